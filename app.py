@@ -1,25 +1,16 @@
 import streamlit as st
-import tempfile
-from helper import process_files, generate_topic_from_filename, get_ai_model
-import re
-
-def strip_duplicate_titles(content, main_title, topic_name):
-    """Remove duplicate main title and topic name from the beginning of content."""
-    # Remove all leading whitespace and newlines
-    content = content.lstrip()
-    
-    # Remove main title (# main_title) if present at the start
-    main_title_pattern = r'^#{1,3}\s*' + re.escape(main_title) + r'\s*\n+'
-    content = re.sub(main_title_pattern, '', content)
-    
-    # Remove topic name (## topic_name) if present at the start
-    topic_pattern = r'^#{1,3}\s*' + re.escape(topic_name) + r'\s*\n+'
-    content = re.sub(topic_pattern, '', content)
-    
-    # Clean up any remaining leading whitespace
-    content = content.lstrip()
-    
-    return content
+from helper import process_files, generate_topic_from_filename, get_ai_model, SUPPORTED_EXTENSIONS
+from cache import NotesCache
+from manifest import ProjectManifest, project_manifest_path
+from rate_limit import RequestScheduler
+from jobs import JobManager, ACTIVE_STATES, FAILED, INTERRUPTED
+from uploads import UploadStore
+from preprocess import Preprocessor
+from dedupe import DuplicateDetector
+from client import NotesClient
+from providers import available_providers, get_provider
+from assembly import DEFAULT_SECTIONS_PER_PAGE, RenderCache, build_sections, join_sections, page_of, write_sections
+from export import Exporter, format_export_report
 
 # Page configuration
 st.set_page_config(
@@ -28,6 +19,21 @@ st.set_page_config(
     layout="wide"
 )
 
+@st.cache_resource
+def get_job_manager():
+    """One job manager per server process, shared by every session and rerun."""
+    return JobManager()
+
+@st.cache_resource
+def get_render_cache():
+    """Rendered HTML of note sections, keyed by content, shared by every session."""
+    return RenderCache()
+
+@st.cache_resource
+def get_exporter():
+    """HTML/PDF exporter with its on-disk cache of rendered sections, shared by every session."""
+    return Exporter()
+
 # Title
 st.title("📚 DevNotes-AI")
 st.markdown("**Transform your code files into study notes with AI!**")
@@ -47,6 +53,20 @@ if 'files_processed' not in st.session_state:
     st.session_state.files_processed = False
 if 'final_notes' not in st.session_state:
     st.session_state.final_notes = ""
+if 'final_sections' not in st.session_state:
+    st.session_state.final_sections = []
+if 'export' not in st.session_state:
+    st.session_state.export = None
+if 'failed_files' not in st.session_state:
+    st.session_state.failed_files = []
+if 'schedulers' not in st.session_state:
+    st.session_state.schedulers = {}
+if 'run_metrics' not in st.session_state:
+    st.session_state.run_metrics = []
+if 'upload_store' not in st.session_state:
+    st.session_state.upload_store = UploadStore()
+if 'job_id' not in st.session_state:
+    st.session_state.job_id = st.query_params.get("job")
 
 # Sidebar
 with st.sidebar:
@@ -56,7 +76,7 @@ with st.sidebar:
     st.subheader("🤖 AI Provider")
     ai_provider = st.selectbox(
         "Choose AI Provider:",
-        ["Gemini", "OpenAI", "Claude"],
+        available_providers(),
         help="Select which AI service to use"
     )
     
@@ -76,20 +96,26 @@ with st.sidebar:
             "gpt-4-turbo",
         ]
         default_model = "gpt-4o"
-    else:  # Claude
+    elif ai_provider == "Claude":
         models = [
             "claude-haiku-4-5-20251001",
             "claude-sonnet-4-5-20250929",
             "claude-opus-4-1-20250805"
         ]
         default_model = "claude-sonnet-4-5-20250929"
+    else:  # Plugin provider
+        default_model = get_provider(ai_provider).default_model
+        models = [default_model] if default_model else []
     
-    model_name = st.selectbox(
-        "Choose Model:",
-        models,
-        index=models.index(default_model) if default_model in models else 0,
-        help="Select the specific model to use"
-    )
+    if models:
+        model_name = st.selectbox(
+            "Choose Model:",
+            models,
+            index=models.index(default_model) if default_model in models else 0,
+            help="Select the specific model to use"
+        )
+    else:
+        model_name = st.text_input("Model Name:", help=f"Model name understood by {ai_provider}")
     
     # API Key Input
     api_key = st.text_input(
@@ -109,11 +135,79 @@ with st.sidebar:
         help="Title for your generated notes"
     )
     
+    max_workers = st.slider(
+        "Parallel Requests",
+        min_value=1,
+        max_value=8,
+        value=4,
+        help="How many files are sent to the AI at the same time"
+    )
+    
+    max_chunk_tokens = st.number_input(
+        "Max Tokens per Request",
+        min_value=1000,
+        max_value=200000,
+        value=6000,
+        step=1000,
+        help="Larger files are split into parts of this size and the notes are stitched back together"
+    )
+    
+    use_cache = st.checkbox(
+        "Reuse Cached Responses",
+        value=True,
+        help="Skip the AI call for files whose content, topic, suggestion and model haven't changed"
+    )
+    
+    prompt_caching = st.checkbox(
+        "Provider Prompt Caching",
+        value=True,
+        help="Send the fixed instructions as a cacheable prefix (Claude cache_control; OpenAI and Gemini cache it automatically)"
+    )
+    
+    trim_source = st.checkbox(
+        "Trim Source Before Prompting",
+        value=True,
+        help="Collapse big data literals and base64 blobs, drop duplicate notebook cells and repeated imports"
+    )
+    
+    strip_commented_code = st.checkbox(
+        "Remove Commented-Out Code",
+        value=False,
+        disabled=not trim_source,
+        help="Drop long blocks of commented-out code; explanatory comments are kept"
+    )
+    
+    markdown_headings = st.checkbox(
+        "Include Notebook Headings",
+        value=False,
+        disabled=not trim_source,
+        help="Send the headings of markdown cells along with the code so the notes follow the notebook's sections"
+    )
+    
+    merge_duplicates = st.checkbox(
+        "Merge Duplicate Files",
+        value=True,
+        help="Copies of another uploaded file reuse its notes; near copies (exercise vs. solution) only send their differences"
+    )
+    
+    skip_unchanged = st.checkbox(
+        "Only Regenerate Changed Files",
+        value=True,
+        help="Keep the notes (including your edits) of files whose content, topic and suggestion haven't changed since the last run of this project"
+    )
+    
+    server_url = st.text_input(
+        "Notes Server (optional)",
+        value="",
+        placeholder="http://127.0.0.1:8765",
+        help="Generate on a shared DevNotes-AI server (python server.py) instead of in this app. Identical work from other users is done only once; the API key can be left empty if the server has one"
+    ).strip()
+    
     # File Upload Section
     st.subheader("📁 Upload Files")
     uploaded_files = st.file_uploader(
         "Choose code files",
-        type=['py', 'js', 'ipynb', 'java', 'cpp', 'c', 'txt'],
+        type=SUPPORTED_EXTENSIONS,
         accept_multiple_files=True,
         help="Upload your code files from anywhere on your PC"
     )
@@ -122,32 +216,25 @@ with st.sidebar:
 if uploaded_files:
     st.success(f"✅ {len(uploaded_files)} files uploaded!")
     
-    # Save uploaded files and update session state
-    temp_files = []
-    for uploaded_file in uploaded_files:
-        # Create temporary file
-        with tempfile.NamedTemporaryFile(delete=False, suffix=f".{uploaded_file.name.split('.')[-1]}") as tmp_file:
-            tmp_file.write(uploaded_file.getbuffer())
-            temp_files.append(tmp_file.name)
-            
-            # Initialize file details
-            if tmp_file.name not in st.session_state.file_details:
-                st.session_state.file_details[tmp_file.name] = {
-                    'topic': generate_topic_from_filename(uploaded_file.name),
-                    'suggestion': "Explain clearly and simply"
-                }
-    
-    st.session_state.uploaded_files = temp_files
+    # Keep uploads in memory, keyed by content, so reruns don't rewrite them to disk
+    uploads = st.session_state.upload_store.sync(uploaded_files)
+    for upload in uploads:
+        # Initialize file details
+        if upload.id not in st.session_state.file_details:
+            st.session_state.file_details[upload.id] = {
+                'topic': generate_topic_from_filename(upload.name),
+                'suggestion': "Explain clearly and simply"
+            }
+    
+    st.session_state.uploaded_files = uploads
     
     # Show uploaded files with concise configuration
     st.subheader("📝 Configure Your Files")
     st.info("💡 **Tip:** You can edit the topic names and suggestions below. These will be used as section titles in your final notes.")
     
     # Create a more concise table-like view
-    for i, file_path in enumerate(st.session_state.uploaded_files):
-        original_name = uploaded_files[i].name
-        
-        st.write(f"### 📄 {original_name}")
+    for upload in st.session_state.uploaded_files:
+        st.write(f"### 📄 {upload.name}")
         
         col1, col2 = st.columns([1, 1])
         
@@ -155,71 +242,228 @@ if uploaded_files:
             st.write("**Section Topic:**")
             topic = st.text_input(
                 "Section Topic:",
-                value=st.session_state.file_details[file_path]['topic'],
-                key=f"topic_{i}",
+                value=st.session_state.file_details[upload.id]['topic'],
+                key=f"topic_{upload.id}",
                 help="This will be the section title in your notes",
                 label_visibility="collapsed"
             )
-            st.session_state.file_details[file_path]['topic'] = topic
+            st.session_state.file_details[upload.id]['topic'] = topic
         
         with col2:
             st.write("**Any Suggestions:**")
             suggestion = st.text_input(
                 "Any Suggestions:",
-                value=st.session_state.file_details[file_path]['suggestion'],
-                key=f"suggestion_{i}",
+                value=st.session_state.file_details[upload.id]['suggestion'],
+                key=f"suggestion_{upload.id}",
                 help="How should the AI explain this file",
                 label_visibility="collapsed"
             )
-            st.session_state.file_details[file_path]['suggestion'] = suggestion
+            st.session_state.file_details[upload.id]['suggestion'] = suggestion
         
         st.markdown("---")
     
+    if merge_duplicates:
+        keep_separate = st.multiselect(
+            "Never Merge These Files",
+            options=[upload.name for upload in st.session_state.uploaded_files],
+            help="Files listed here always get their own notes, even if they copy another file"
+        )
+    
     # Generate button
     if st.button("🚀 Start Processing", type="primary", use_container_width=True):
         if not main_title.strip():
             st.error("Please enter a title for your notes!")
-        elif not api_key.strip():
+        elif not api_key.strip() and not server_url:
             st.error("Please enter your API key!")
         else:
             try:
-                # Get AI model
-                ai_model = get_ai_model(ai_provider, model_name, api_key)
+                if not server_url:
+                    # Get AI model (retries are left to the scheduler so they respect the rate limits)
+                    ai_model = get_ai_model(ai_provider, model_name, api_key, max_retries=0)
+                    
+                    # Keep one scheduler per provider and model so limits and learned concurrency survive reruns
+                    scheduler_key = (ai_provider, model_name, max_workers)
+                    if scheduler_key not in st.session_state.schedulers:
+                        st.session_state.schedulers[scheduler_key] = RequestScheduler.for_provider(ai_provider, max_concurrency=max_workers)
+                    scheduler = st.session_state.schedulers[scheduler_key]
                 
                 # Prepare data for processing
-                topics = [st.session_state.file_details[file_path]['topic'] for file_path in st.session_state.uploaded_files]
-                suggestions = [st.session_state.file_details[file_path]['suggestion'] for file_path in st.session_state.uploaded_files]
-                
-                # Process files with progress updates
-                progress_bar = st.progress(0)
-                status_text = st.empty()
+                topics = [st.session_state.file_details[upload.id]['topic'] for upload in st.session_state.uploaded_files]
+                suggestions = [st.session_state.file_details[upload.id]['suggestion'] for upload in st.session_state.uploaded_files]
                 
-                def update_progress(current, total, message):
-                    progress = current / total
-                    progress_bar.progress(progress)
-                    status_text.text(f"{message} ({current}/{total})")
+                # Everything the job needs is captured here; it must not touch st.* from its thread
+                file_uploads = list(st.session_state.uploaded_files)
+                file_keys = [upload.name for upload in file_uploads]
+                notes_title = main_title
                 
-                with st.spinner("Processing files... Please wait."):
-                    st.session_state.processed_files, previous_topics = process_files(
-                        st.session_state.uploaded_files, 
-                        main_title, 
+                def run_on_server(job):
+                    # The server does the work; its progress, text and results are mirrored into this job
+                    client = NotesClient(server_url)
+                    server_job_id = client.submit(
+                        file_uploads,
+                        notes_title,
                         topics,
                         suggestions,
-                        progress_callback=update_progress,
-                        ai_model=ai_model
+                        provider=ai_provider,
+                        model=model_name,
+                        api_key=api_key.strip() or None,
+                        options={
+                            "workers": max_workers,
+                            "max_chunk_tokens": max_chunk_tokens,
+                            "use_cache": use_cache,
+                            "skip_unchanged": skip_unchanged,
+                            "prompt_caching": prompt_caching,
+                            "preprocess": trim_source,
+                            "strip_commented_code": strip_commented_code,
+                            "markdown_headings": markdown_headings,
+                            "dedupe": merge_duplicates,
+                            "keep_separate": keep_separate if merge_duplicates else []
+                        }
                     )
-                    st.session_state.editing_mode = True
-                    st.session_state.current_file_index = 0
-                    st.session_state.files_processed = True
-                    st.rerun()
+                    job.set_info(server_job=server_job_id)
+                    client.follow(server_job_id, progress_callback=job.update_progress, on_chunk=job.append_text, on_result=job.add_result)
+                    job.set_info(cache_stats=client.get(server_job_id)['info'].get('cache_stats'))
+                
+                # The job keeps the uploads' buffers open even if the store is closed ("Start New Project") while it runs
+                release_uploads = st.session_state.upload_store.hold(file_uploads)
+                
+                def run_job(job):
+                    try:
+                        generate(job)
+                    finally:
+                        release_uploads()
+                
+                def generate(job):
+                    job.set_info(file_keys=file_keys)
+                    if server_url:
+                        run_on_server(job)
+                        return
+                    # Cached responses are reused unless the user asked for fresh ones
+                    notes_cache = NotesCache(bypass=not use_cache)
+                    manifest = ProjectManifest(project_manifest_path(notes_title)) if skip_unchanged else None
+                    try:
+                        process_files(
+                            file_uploads,
+                            notes_title,
+                            topics,
+                            suggestions,
+                            progress_callback=job.update_progress,
+                            ai_model=ai_model,
+                            max_workers=max_workers,
+                            cache=notes_cache,
+                            on_chunk=job.append_text,
+                            max_chunk_tokens=max_chunk_tokens,
+                            manifest=manifest,
+                            file_keys=file_keys,
+                            scheduler=scheduler,
+                            on_result=job.add_result,
+                            prompt_caching=prompt_caching,
+                            preprocess=Preprocessor(
+                                strip_commented_code=strip_commented_code,
+                                markdown_headings=markdown_headings
+                            ) if trim_source else None,
+                            dedupe=DuplicateDetector(keep_separate=keep_separate) if merge_duplicates else None
+                        )
+                    finally:
+                        job.set_info(cache_stats=notes_cache.stats())
+                        notes_cache.close()
+                
+                # Generation runs in the background; the job ID in the URL lets a reloaded page find it again
+                job_id = get_job_manager().submit(run_job, total=len(file_uploads), title=notes_title)
+                st.session_state.job_id = job_id
+                st.query_params["job"] = job_id
+                st.session_state.processed_files = []
+                st.session_state.failed_files = []
+                st.session_state.current_file_index = 0
+                st.session_state.final_notes = ""
+                st.session_state.final_sections = []
+                st.session_state.export = None
+                st.rerun()
                     
             except Exception as e:
                 st.error(f"❌ Error: {e}")
                 st.info("Please check your API key and try again.")
 
-else:
+elif not st.session_state.job_id:
     st.info("👆 Please upload your code files using the sidebar to get started!")
 
+def project_manifest_entries(title, version):
+    """A project's manifest entries, read from disk again only once the job has changed since the last read."""
+    cached = st.session_state.get('manifest_cache')
+    if cached is None or cached['key'] != (title, version):
+        cached = {'key': (title, version), 'entries': ProjectManifest(project_manifest_path(title)).entries}
+        st.session_state.manifest_cache = cached
+    return cached['entries']
+
+def sync_job_results(job):
+    """Copy newly finished files from a job into the session, keeping edits made to files already there."""
+    known = {file_data['file_key']: file_data for file_data in st.session_state.processed_files}
+    finished = [file_data for file_data in job['results'] if file_data is not None]
+    
+    # Prefer edits saved in the project manifest (they survive a page reload)
+    manifest_entries = project_manifest_entries(job['title'], job['version'])
+    processed = []
+    for file_data in finished:
+        if file_data['error']:
+            continue
+        if file_data['file_key'] in known:
+            processed.append(known[file_data['file_key']])
+            continue
+        edited_notes = manifest_entries.get(file_data['file_key'], {}).get('edited_notes')
+        processed.append(dict(file_data, notes=edited_notes) if edited_notes else file_data)
+    
+    st.session_state.processed_files = processed
+    st.session_state.failed_files = [file_data for file_data in finished if file_data['error']]
+    st.session_state.run_metrics = [file_data['metrics'] for file_data in finished if file_data.get('metrics')]
+    st.session_state.cache_stats = job['info'].get('cache_stats')
+    st.session_state.current_file_index = min(st.session_state.current_file_index, max(len(processed) - 1, 0))
+    if processed:
+        st.session_state.editing_mode = True
+        st.session_state.files_processed = True
+
+@st.fragment(run_every=1.0)
+def show_job_progress(job_id, finished_count):
+    """Live progress of a running job; redraws every second without rerunning the whole page."""
+    job = get_job_manager().get(job_id)
+    if job is None:
+        return
+    
+    st.progress(job['completed'] / job['total'] if job['total'] else 0.0)
+    st.text(f"{job['message']} ({job['completed']}/{job['total']})")
+    
+    # Live output for files that are still being written
+    file_keys = job['info'].get('file_keys') or []
+    for index, text in sorted(job['live_text'].items()):
+        with st.expander(f"✍️ {file_keys[index] if index < len(file_keys) else f'File {index + 1}'}", expanded=True):
+            st.markdown(text)
+    
+    # A file finished or the job ended: rerun the page so the editor picks it up
+    finished = sum(1 for file_data in job['results'] if file_data is not None)
+    if finished != finished_count or job['status'] not in ACTIVE_STATES:
+        st.rerun()
+
+# Background job - keep the editor in sync with files as they finish
+project_title = main_title
+job_running = False
+if st.session_state.job_id:
+    job = get_job_manager().get(st.session_state.job_id)
+    if job is None:
+        st.session_state.job_id = None
+    else:
+        sync_job_results(job)
+        project_title = job['title']
+        job_running = job['status'] in ACTIVE_STATES
+        if job_running:
+            st.markdown("---")
+            st.subheader(f"⏳ Generating \"{job['title']}\"")
+            st.caption("You can start editing finished files below while the rest are generated. Reloading the page won't stop the job.")
+            show_job_progress(job['id'], sum(1 for file_data in job['results'] if file_data is not None))
+        elif job['status'] == FAILED:
+            st.error(f"❌ Error: {job['error']}")
+            st.info("Please check your API key and try again.")
+        elif job['status'] == INTERRUPTED:
+            st.warning("⚠️ This job was interrupted by a server restart. Upload the files and press Start Processing again; finished files are reused.")
+
 # Editing mode - show generated markdown for each file
 if st.session_state.editing_mode and st.session_state.processed_files:
     current_file = st.session_state.processed_files[st.session_state.current_file_index]
@@ -228,6 +472,63 @@ if st.session_state.editing_mode and st.session_state.processed_files:
     st.subheader(f"📝 Editing: {current_file['file_path']}")
     st.write(f"**Topic:** {current_file['topic_name']}")
     
+    if current_file.get('time_to_first_token') is not None:
+        st.caption(f"⚡ First text after {current_file['time_to_first_token']:.2f}s")
+    
+    reused_count = sum(1 for file_data in st.session_state.processed_files if file_data.get('reused'))
+    if reused_count:
+        st.caption(f"♻️ {reused_count} unchanged files kept their previous notes")
+    
+    if st.session_state.failed_files:
+        failed_names = ", ".join(file_data['file_key'] for file_data in st.session_state.failed_files)
+        st.warning(f"⚠️ {len(st.session_state.failed_files)} files failed ({failed_names}). Press Start Processing again to retry them; finished files are reused.")
+    
+    merged = [file_data for file_data in st.session_state.processed_files if file_data.get('duplicate_of')]
+    if merged:
+        with st.expander(f"🔗 {len(merged)} files were merged with a file they copy"):
+            for file_data in merged:
+                if file_data['merged'] == "copy":
+                    st.write(f"**{file_data['file_key']}** is a copy of **{file_data['duplicate_of']}** and reuses its notes")
+                else:
+                    st.write(f"**{file_data['file_key']}** is ~{file_data['similarity']:.0%} similar to **{file_data['duplicate_of']}**; its notes only explain what differs")
+            st.caption("Add a file to \"Never Merge These Files\" and process again to give it its own notes.")
+    
+    cache_stats = st.session_state.get('cache_stats')
+    if cache_stats and cache_stats['hits']:
+        st.caption(f"♻️ {cache_stats['hits']} of {cache_stats['hits'] + cache_stats['misses']} files reused from cache")
+    
+    if st.session_state.run_metrics:
+        with st.expander("⏱️ Timing and Token Usage"):
+            st.dataframe(
+                [
+                    {
+                        "File": span['file'],
+                        "Read (s)": round(span['read_time'], 3),
+                        "Prompt (s)": round(span['render_time'], 3),
+                        "First Token (s)": round(span['time_to_first_token'], 2) if span['time_to_first_token'] is not None else None,
+                        "LLM (s)": round(span['llm_time'], 2),
+                        "Total (s)": round(span['total_time'], 2),
+                        "Source Tokens": span.get('source_tokens', 0),
+                        "Trimmed Tokens": span.get('preprocessed_tokens', 0),
+                        "Input Tokens": span['input_tokens'],
+                        "Output Tokens": span['output_tokens'],
+                        "Cached Tokens": span.get('cached_tokens', 0),
+                        "Retries": span['retries'],
+                        "Status": "failed" if span['error'] else "reused" if span['reused'] else "cached" if span['cached_calls'] and not span['llm_time'] else "shared" if span.get('coalesced_calls') and not span['llm_time'] else "generated"
+                    }
+                    for span in st.session_state.run_metrics
+                ],
+                use_container_width=True
+            )
+            total_input = sum(span['input_tokens'] for span in st.session_state.run_metrics)
+            total_output = sum(span['output_tokens'] for span in st.session_state.run_metrics)
+            total_cached = sum(span.get('cached_tokens', 0) for span in st.session_state.run_metrics)
+            estimated = any(call['estimated'] for span in st.session_state.run_metrics for call in span.get('calls', []))
+            st.caption(
+                f"{total_input:,} input ({total_cached:,} from the provider's prompt cache) and {total_output:,} output tokens"
+                + (" — partly estimated at four characters per token" if estimated else "")
+            )
+    
     # Show progress
     progress = (st.session_state.current_file_index + 1) / len(st.session_state.processed_files)
     st.progress(progress)
@@ -238,10 +539,13 @@ if st.session_state.editing_mode and st.session_state.processed_files:
         "Generated Notes (Edit if needed):",
         value=current_file['notes'],
         height=400,
-        key=f"edit_{st.session_state.current_file_index}"
+        key=f"edit_{current_file['file_key']}"
     )
     
-    # Update the notes in session state
+    # Update the notes in session state and remember edits for the next run of this project
+    if edited_notes != current_file['notes']:
+        ProjectManifest(project_manifest_path(project_title)).record_edit(current_file['file_key'], edited_notes)
+        st.session_state.pop('manifest_cache', None)
     st.session_state.processed_files[st.session_state.current_file_index]['notes'] = edited_notes
     
     col1, col2, col3 = st.columns([1, 1, 2])
@@ -258,30 +562,16 @@ if st.session_state.editing_mode and st.session_state.processed_files:
                 st.session_state.current_file_index += 1
                 st.rerun()
         else:
-            if st.button("✅ Finish & Generate"):
-                # Combine all notes with proper formatting
-                combined_notes = f"# {main_title}\n\n"
+            if st.button("✅ Finish & Generate", disabled=job_running, help="Available once every file has been generated" if job_running else None):
+                # One section per file; unchanged sections keep their rendered preview
+                sections = build_sections(project_title, st.session_state.processed_files)
+                st.session_state.final_sections = sections
+                st.session_state.final_notes = join_sections(sections)
+                st.session_state.export = None
                 
-                for file_data in st.session_state.processed_files:
-                    # Add section heading
-                    combined_notes += f"## {file_data['topic_name']}\n\n"
-                    
-                    # Get the notes content and remove any duplicate titles
-                    notes_content = file_data['notes']
-                    
-                    # Strip duplicate titles using the helper function
-                    notes_content = strip_duplicate_titles(notes_content, main_title, file_data['topic_name'])
-                    
-                    # Add the cleaned notes content
-                    combined_notes += notes_content + "\n\n"
-                
-                # Save to session state
-                st.session_state.final_notes = combined_notes
-                
-                # Save markdown file
-                markdown_filename = f"{main_title.replace(' ', '_').lower()}_notes.md"
-                with open(markdown_filename, 'w', encoding='utf-8') as f:
-                    f.write(combined_notes)
+                # Save markdown file, written section by section
+                markdown_filename = f"{project_title.replace(' ', '_').lower()}_notes.md"
+                write_sections(markdown_filename, sections)
                 
                 st.success("✅ Notes generated successfully!")
                 st.rerun()
@@ -295,14 +585,30 @@ if st.session_state.final_notes:
     tab1, tab2 = st.tabs(["📖 Preview", "📥 Download"])
     
     with tab1:
-        # Nice preview with proper markdown rendering
-        st.markdown(st.session_state.final_notes)
+        # A page of sections at a time; each section's HTML is cached by its content
+        sections = st.session_state.final_sections
+        page = 1
+        if len(sections) > DEFAULT_SECTIONS_PER_PAGE:
+            page = st.number_input(
+                "Page",
+                min_value=1,
+                max_value=page_of(sections, 1)[1],
+                value=1,
+                help=f"{DEFAULT_SECTIONS_PER_PAGE} sections per page"
+            )
+        page_sections, pages = page_of(sections, page)
+        render_cache = get_render_cache()
+        for section in page_sections:
+            st.html(render_cache.render(section))
+        if pages > 1:
+            first = (page - 1) * DEFAULT_SECTIONS_PER_PAGE + 1
+            st.caption(f"Sections {first}–{first + len(page_sections) - 1} of {len(sections)}")
     
     with tab2:
         st.subheader("📥 Download Your Notes")
         
         # Download button
-        markdown_filename = f"{main_title.replace(' ', '_').lower()}_notes.md"
+        markdown_filename = f"{project_title.replace(' ', '_').lower()}_notes.md"
         st.download_button(
             label="📝 Download Markdown File",
             data=st.session_state.final_notes,
@@ -315,20 +621,49 @@ if st.session_state.final_notes:
         st.info(f"📄 **File:** {markdown_filename}")
         st.info(f"📊 **Size:** {len(st.session_state.final_notes)} characters")
         
-        # MD to PDF conversion info
+        # HTML and PDF are rendered here, offline; unchanged sections reuse their cached HTML
         st.markdown("---")
-        st.subheader("📄 Convert to PDF")
-        st.write("Want to convert your Markdown file to PDF? Use these online tools:")
-        st.markdown("""
-        - **[Markdown to PDF](https://www.markdowntopdf.com/)** - Simple and fast conversion
-        - **[Dillinger](https://dillinger.io/)** - Markdown editor with PDF export
-        """)
+        st.subheader("📄 Export to HTML & PDF")
+        if st.button("📄 Export HTML & PDF", use_container_width=True):
+            stem = markdown_filename[:-len(".md")]
+            with st.spinner("Rendering sections..."):
+                st.session_state.export = get_exporter().export(
+                    st.session_state.final_sections,
+                    project_title,
+                    html_path=f"{stem}.html",
+                    pdf_path=f"{stem}.pdf"
+                )
+        
+        export = st.session_state.export
+        if export:
+            st.caption(f"Exported {format_export_report(export)}")
+            with open(export["html_path"], "rb") as f:
+                st.download_button(
+                    label="🌐 Download HTML File",
+                    data=f.read(),
+                    file_name=export["html_path"],
+                    mime="text/html",
+                    use_container_width=True
+                )
+            if export["pdf_path"]:
+                with open(export["pdf_path"], "rb") as f:
+                    st.download_button(
+                        label="📄 Download PDF File",
+                        data=f.read(),
+                        file_name=export["pdf_path"],
+                        mime="application/pdf",
+                        use_container_width=True
+                    )
+            else:
+                st.warning(f"No PDF written: {export['pdf_error']}. The HTML file can be printed to PDF from the browser.")
         
         # Reset button
         if st.button("🔄 Start New Project", type="secondary"):
-            # Reset all session state
+            # Reset all session state (and forget the job in the URL); a running job keeps the uploads it holds
+            st.session_state.upload_store.close()
             for key in list(st.session_state.keys()):
                 del st.session_state[key]
+            st.query_params.clear()
             st.rerun()
 
 # Footer
@@ -0,0 +1,130 @@
+"""
+Assembly of the final notes document, one section per file.
+
+The document is kept as a list of sections instead of one growing string:
+it is written to disk section by section, joined once when the whole text
+is needed, and previewed a page of sections at a time. Rendered HTML is
+cached per section by a hash of its Markdown, so after an edit only the
+changed sections are rendered again.
+"""
+
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
+DEFAULT_RENDER_CACHE_ENTRIES = 4096
+DEFAULT_SECTIONS_PER_PAGE = 10
+
+MARKDOWN_EXTRAS = ["fenced-code-blocks", "tables", "header-ids", "strike", "cuddled-lists"]
+
+@lru_cache(maxsize=1024)
+def _heading_pattern(title):
+    """Compiled pattern for `title` as a level 1-3 heading at the start of a text."""
+    return re.compile(r'^#{1,3}\s*' + re.escape(title) + r'\s*\n+')
+
+def strip_duplicate_titles(content, main_title, topic_name):
+    """Remove duplicate main title and topic name from the beginning of content."""
+    # Remove all leading whitespace and newlines
+    content = content.lstrip()
+
+    # Remove main title (# main_title) and then topic name (## topic_name) if present at the start
+    content = _heading_pattern(main_title).sub('', content, count=1)
+    content = _heading_pattern(topic_name).sub('', content, count=1)
+
+    # Clean up any remaining leading whitespace
+    return content.lstrip()
+
+def section_key(markdown):
+    """Content hash identifying a section's Markdown."""
+    return hashlib.sha256(markdown.encode("utf-8")).hexdigest()
+
+def build_sections(main_title, processed_files):
+    """
+    Split the final document into sections: the title, then one per file.
+
+    Each section is a dict with its `title`, `markdown` (ending in a blank
+    line, so joining the sections gives the whole document) and `key`, a
+    hash of the Markdown. Files that failed to generate are left out.
+    """
+    sections = [{"title": main_title, "markdown": f"# {main_title}\n\n"}]
+    for file_data in processed_files:
+        # Files that failed to generate have no notes to add
+        if file_data.get('error'):
+            continue
+        notes_content = strip_duplicate_titles(file_data['notes'], main_title, file_data['topic_name'])
+        sections.append({
+            "title": file_data['topic_name'],
+            "markdown": f"## {file_data['topic_name']}\n\n{notes_content}\n\n"
+        })
+    for section in sections:
+        section["key"] = section_key(section["markdown"])
+    return sections
+
+def join_sections(sections):
+    """The whole document as one string."""
+    return "".join(section["markdown"] for section in sections)
+
+def assemble_notes(main_title, processed_files):
+    """Combine the notes of every processed file into one Markdown document."""
+    return join_sections(build_sections(main_title, processed_files))
+
+def write_sections(path, sections):
+    """Write the document to `path` section by section, without building it in memory; returns the characters written."""
+    written = 0
+    with open(path, "w", encoding="utf-8") as f:
+        for section in sections:
+            written += f.write(section["markdown"])
+    return written
+
+def render_markdown(markdown):
+    """Render Markdown to HTML; raw HTML in the notes is escaped."""
+    import markdown2
+    return str(markdown2.markdown(markdown, extras=MARKDOWN_EXTRAS, safe_mode="escape"))
+
+class RenderCache:
+    """
+    Rendered HTML of sections, keyed by the hash of their Markdown; safe to use from several threads.
+
+    Args:
+        max_entries: Least recently used sections beyond this many are dropped
+        render: Function turning Markdown into HTML
+    """
+
+    def __init__(self, max_entries=DEFAULT_RENDER_CACHE_ENTRIES, render=render_markdown):
+        self.max_entries = max_entries
+        self.render_function = render
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def render(self, section):
+        """Return the HTML of a section (from build_sections), rendering it only if its content is new."""
+        key = section.get("key") or section_key(section["markdown"])
+        with self._lock:
+            html = self._entries.get(key)
+            if html is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return html
+            self.misses += 1
+
+        html = self.render_function(section["markdown"])
+        with self._lock:
+            self._entries[key] = html
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return html
+
+    def stats(self):
+        """Return hit/miss counters and the number of cached sections."""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
+
+def page_of(sections, page, per_page=DEFAULT_SECTIONS_PER_PAGE):
+    """Sections on a 1-based page, and the number of pages."""
+    pages = max(1, -(-len(sections) // per_page))
+    page = min(max(page, 1), pages)
+    return sections[(page - 1) * per_page:page * per_page], pages
@@ -0,0 +1,861 @@
+"""
+Offline benchmarks for the DevNotes-AI pipeline.
+
+Usage:
+    python benchmark.py concurrency --files 40 --latency 0.5
+    python benchmark.py streaming --files 10 --latency 2
+    python benchmark.py notebook --size-mb 50
+    python benchmark.py clients --calls 200
+    python benchmark.py throttling --files 30 --server-concurrency 3
+    python benchmark.py suite --output bench.json
+    python benchmark.py prefix-cache --files 20
+    python benchmark.py preprocess --files 10
+    python benchmark.py dedupe --files 10
+    python benchmark.py ingest --files 5000
+    python benchmark.py context --files 10 50 200
+    python benchmark.py service --clients 5 --files 10
+    python benchmark.py imports --runs 5
+    python benchmark.py assembly --sections 500
+    python benchmark.py export --sections 500
+    python benchmark.py truncation --file-tokens 20000 --limits 4000 8000
+    python benchmark.py hedging --calls 200 --slow-rate 0.05
+"""
+
+import argparse
+import ast
+import base64
+import json
+import os
+import platform
+import random
+import re
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from fake_models import FakeNotesModel, StubChatServer, fake_notes, numbered_notes
+from helper import (
+    process_files, read_code_cells, read_notebook_cells, create_ai_model, get_ai_model, get_notes_chain, parser,
+    file_reader, generate_topic_from_filename, strip_duplicate_titles, generate_detailed_notes
+)
+from assembly import RenderCache, build_sections, write_sections
+from export import Exporter, format_export_report
+from chunking import estimate_tokens
+from dedupe import DuplicateDetector
+from ingest import ingest
+from preprocess import Preprocessor
+from prompts import notes_template
+from rate_limit import RequestScheduler
+from client import NotesClient
+from concurrent.futures import ThreadPoolExecutor
+from hedging import Backend, HedgedChatModel
+from server import NotesServer
+
+def write_python_corpus(directory, count, lines=40):
+    """Write `count` small Python files into `directory` and return their paths."""
+    paths = []
+    for i in range(count):
+        path = os.path.join(directory, f"lesson_{i:03d}.py")
+        with open(path, "w", encoding="utf-8") as f:
+            for line in range(lines):
+                f.write(f"value_{line} = {line} * {i}  # step {line}\n")
+        paths.append(path)
+    return paths
+
+def bench_concurrency(args):
+    """Time process_files against a fake model for increasing worker counts."""
+    model = FakeNotesModel(latency=args.latency, output_chars=args.output_chars)
+
+    with tempfile.TemporaryDirectory() as directory:
+        files = write_python_corpus(directory, args.files)
+
+        print(f"{'workers':>8} {'seconds':>10} {'speedup':>8}")
+        baseline = None
+        for workers in args.workers:
+            start = time.perf_counter()
+            process_files(files, ai_model=model, max_workers=workers)
+            elapsed = time.perf_counter() - start
+            baseline = baseline or elapsed
+            print(f"{workers:>8} {elapsed:>10.2f} {baseline / elapsed:>7.1f}x")
+
+def bench_streaming(args):
+    """Compare time-to-first-token with the time to finish a whole streamed batch."""
+    model = FakeNotesModel(latency=args.latency, output_chars=args.output_chars)
+
+    with tempfile.TemporaryDirectory() as directory:
+        files = write_python_corpus(directory, args.files)
+
+        start = time.perf_counter()
+        all_notes, _ = process_files(files, ai_model=model, max_workers=args.workers, on_chunk=lambda index, chunk: None)
+        batch_time = time.perf_counter() - start
+
+    first_tokens = sorted(note['time_to_first_token'] for note in all_notes)
+    print(f"first token (fastest file): {first_tokens[0]:.3f}s")
+    print(f"first token (median file):  {first_tokens[len(first_tokens) // 2]:.3f}s")
+    print(f"whole batch:                {batch_time:.3f}s")
+
+def write_large_python_file(path, functions=300, seed=0):
+    """Write one long Python module made of many small functions (big enough to be chunked)."""
+    rng = random.Random(seed)
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(functions):
+            f.write(f"def step_{i}(values):\n")
+            f.write(f'    """Scale every value by {i}."""\n')
+            for line in range(rng.randint(5, 15)):
+                f.write(f"    values = [v * {line} + {i} for v in values]  # pass {line}\n")
+            f.write("    return values\n\n")
+
+def write_notebook(path, size_mb, cells=50, seed=0):
+    """Write a notebook whose code cells carry about `size_mb` MB of base64 plot outputs."""
+    rng = random.Random(seed)
+    image = base64.b64encode(rng.randbytes(int(size_mb * 1024 * 1024) * 3 // 4 // cells)).decode("ascii")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('{"cells": [')
+        for i in range(cells):
+            cell = {
+                "cell_type": "code",
+                "execution_count": i + 1,
+                "metadata": {},
+                "outputs": [{"output_type": "display_data", "data": {"image/png": image, "text/plain": ["<Figure>"]}, "metadata": {}}],
+                "source": [f"plt.plot(range({i}))\n", "plt.show()"],
+            }
+            f.write(("," if i else "") + json.dumps(cell))
+        f.write('], "metadata": {}, "nbformat": 4, "nbformat_minor": 5}')
+
+def read_cells_json_load(path):
+    """The previous notebook reader: parse the whole file with json.load."""
+    with open(path, "r", encoding="utf-8") as f:
+        notebook = json.load(f)
+    return ["".join(cell["source"]) for cell in notebook.get("cells", []) if cell.get("cell_type") == "code"]
+
+def notebook_worker(args):
+    """Run one reader in a fresh process and print its timing and peak RSS as JSON."""
+    reader = read_cells_json_load if args.reader == "json.load" else read_code_cells
+    baseline_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    cells = reader(args.path)
+    elapsed = time.perf_counter() - start
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({"reader": args.reader, "seconds": elapsed, "peak_rss_mb": peak_kb / 1024, "reader_rss_mb": (peak_kb - baseline_kb) / 1024, "cells": len(cells)}))
+
+def bench_notebook(args):
+    """Compare peak RSS and parse time of json.load against the streaming notebook reader."""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "large.ipynb")
+        write_notebook(path, args.size_mb)
+        print(f"notebook size: {os.path.getsize(path) / 1024 / 1024:.1f} MB")
+
+        print(f"{'reader':>10} {'seconds':>8} {'peak RSS MB':>12} {'used by reader':>15}")
+        for reader in ("json.load", "streaming"):
+            output = subprocess.run(
+                [sys.executable, __file__, "notebook-worker", reader, path],
+                capture_output=True, text=True, check=True
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print(f"{reader:>10} {result['seconds']:>8.2f} {result['peak_rss_mb']:>12.1f} {result['reader_rss_mb']:>15.1f}")
+
+def bench_clients(args):
+    """Per-call overhead of building a new client and chain each time versus reusing warm ones."""
+    inputs = {"main_title": "Bench", "previous_topics": "", "topic_name": "Stub", "suggestion": "", "file": "x = 1"}
+
+    def fresh_call(base_url):
+        model = create_ai_model("OpenAI", "stub-model", "sk-bench", base_url=base_url)
+        return (notes_template | model | parser).invoke(inputs)
+
+    def warm_call(base_url):
+        model = get_ai_model("OpenAI", "stub-model", "sk-bench", base_url=base_url)
+        return get_notes_chain(model).invoke(inputs)
+
+    print(f"{'mode':>6} {'ms/call':>8} {'connections':>12}")
+    for mode, call in (("fresh", fresh_call), ("warm", warm_call)):
+        with StubChatServer() as server:
+            call(server.base_url)  # exclude one-time import and setup costs
+            start = time.perf_counter()
+            for _ in range(args.calls):
+                call(server.base_url)
+            elapsed = time.perf_counter() - start
+            print(f"{mode:>6} {elapsed / args.calls * 1000:>8.2f} {server.connections:>12}")
+
+def bench_throttling(args):
+    """Run a batch against a stub server that answers 429s, with and without the request scheduler."""
+    with tempfile.TemporaryDirectory() as directory:
+        files = write_python_corpus(directory, args.files)
+
+        print(f"{'mode':>10} {'seconds':>8} {'finished':>9} {'failed':>7} {'429s':>6} {'retries':>8} {'limit':>6}")
+        for mode in ("none", "scheduler"):
+            with StubChatServer(latency=args.latency, max_in_flight=args.server_concurrency,
+                                throttle_rate=args.throttle_rate, retry_after=args.retry_after) as server:
+                model = create_ai_model("OpenAI", "stub-model", "sk-bench", base_url=server.base_url, max_retries=0)
+                scheduler = RequestScheduler(max_concurrency=args.workers, base_delay=0.1, max_retries=8) if mode == "scheduler" else None
+                start = time.perf_counter()
+                all_notes, _ = process_files(files, ai_model=model, max_workers=args.workers, scheduler=scheduler)
+                elapsed = time.perf_counter() - start
+                failed = sum(1 for note in all_notes if note['error'])
+                stats = scheduler.stats() if scheduler else {"retries": 0, "concurrency_limit": args.workers}
+                print(f"{mode:>10} {elapsed:>8.2f} {len(all_notes) - failed:>9} {failed:>7} {server.throttled:>6} {stats['retries']:>8} {stats['concurrency_limit']:>6}")
+
+SUITE_CORPORA = ("small_py", "large_py", "notebook")
+
+def write_suite_corpus(directory, corpus, files):
+    """Write one of the suite's deterministic corpora and return its file paths."""
+    if corpus == "small_py":
+        return write_python_corpus(directory, files)
+
+    paths = []
+    for i in range(files):
+        if corpus == "large_py":
+            path = os.path.join(directory, f"module_{i:03d}.py")
+            write_large_python_file(path, seed=i)
+        else:
+            path = os.path.join(directory, f"analysis_{i:03d}.ipynb")
+            write_notebook(path, 2, cells=30, seed=i)
+        paths.append(path)
+    return paths
+
+def latency_summary(samples):
+    """p50/p95/mean of a list of durations in seconds, reported in milliseconds."""
+    ordered = sorted(samples)
+    return {
+        "count": len(ordered),
+        "p50_ms": ordered[len(ordered) // 2] * 1000,
+        "p95_ms": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000,
+        "mean_ms": statistics.fmean(ordered) * 1000
+    }
+
+def time_calls(function, inputs, repeat):
+    """Call `function` on every input `repeat` times and return each call's duration."""
+    samples = []
+    for _ in range(repeat):
+        for value in inputs:
+            start = time.perf_counter()
+            function(value)
+            samples.append(time.perf_counter() - start)
+    return samples
+
+def suite_worker(args):
+    """Run one suite scenario in a fresh process and print its results as JSON."""
+    with tempfile.TemporaryDirectory() as directory:
+        files = write_suite_corpus(directory, args.corpus, args.files)
+        baseline_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+        if args.scenario == "process_files":
+            model = FakeNotesModel(latency=args.latency, output_chars=args.output_chars)
+            start = time.perf_counter()
+            entries, _ = process_files(files, ai_model=model, max_workers=args.workers)
+            # Each file's own span, so concurrent runs have latencies too
+            samples = [entry['metrics']['total_time'] for entry in entries]
+            elapsed = time.perf_counter() - start
+            operations = len(files)
+        else:
+            names = [os.path.basename(path) for path in files]
+            if args.scenario == "file_reader":
+                function, inputs = file_reader, files
+            elif args.scenario == "generate_topic_from_filename":
+                function, inputs = generate_topic_from_filename, names
+            else:
+                notes = f"# Bench\n\n## Topic\n\n{fake_notes(args.output_chars)}"
+                function, inputs = (lambda notes: strip_duplicate_titles(notes, "Bench", "Topic")), [notes] * len(files)
+            start = time.perf_counter()
+            samples = time_calls(function, inputs, args.repeat)
+            elapsed = time.perf_counter() - start
+            operations = len(samples)
+
+        peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    result = {
+        "scenario": args.scenario,
+        "corpus": args.corpus,
+        "files": len(files),
+        "workers": args.workers,
+        "seconds": elapsed,
+        "throughput_per_s": operations / elapsed if elapsed else None,
+        "latency": latency_summary(samples) if samples else None,
+        "peak_rss_mb": peak_kb / 1024,
+        "scenario_rss_mb": (peak_kb - baseline_kb) / 1024
+    }
+    print(json.dumps(result))
+
+def measure_import_time(module, runs=5):
+    """Median wall time of importing `module` in a fresh interpreter, in seconds."""
+    code = f"import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+        samples.append(float(output.strip().splitlines()[-1]))
+    return statistics.median(samples)
+
+def parse_importtime(stderr):
+    """Sum `-X importtime` output into (total microseconds, {top-level package: microseconds})."""
+    packages = {}
+    total = 0
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        package = name.strip().split(".")[0]
+        # Nested imports are indented under the module that imported them
+        if len(name) - len(name.lstrip()) == 1:
+            total += int(cumulative)
+            packages[package] = packages.get(package, 0) + int(cumulative)
+    return total, packages
+
+def app_import_code():
+    """The top-level import statements of app.py, which is what a Streamlit cold start pays for before rendering."""
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+    with open(path, "r", encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    return "\n".join(ast.unparse(node) for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom)))
+
+def bench_imports(args):
+    """Cold-start import time of the CLI and the app with lazy providers, against importing every provider SDK up front."""
+    all_sdks = "import langchain_google_genai, langchain_openai, langchain_anthropic"
+    scenarios = [
+        ("cli", "import main"),
+        ("cli, then Gemini on first use", "import main, providers; providers.get_provider('Gemini').load()"),
+        ("cli with every SDK (eager)", f"import main; {all_sdks}"),
+        ("app", app_import_code()),
+        ("app with every SDK (eager)", f"{app_import_code()}\n{all_sdks}")
+    ]
+    print(f"{'scenario':>32} {'median ms':>10}  heaviest packages")
+    for name, code in scenarios:
+        samples = []
+        for _ in range(args.runs):
+            stderr = subprocess.run(
+                [sys.executable, "-X", "importtime", "-c", code],
+                capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__))
+            ).stderr
+            samples.append(parse_importtime(stderr))
+        total, packages = sorted(samples)[len(samples) // 2]
+        heaviest = ", ".join(f"{package} {micros / 1000:.0f}" for package, micros in sorted(packages.items(), key=lambda item: -item[1])[:4])
+        print(f"{name:>32} {total / 1000:>10.0f}  {heaviest}")
+
+def bench_suite(args):
+    """Run every scenario on every corpus, each in its own process, and report the results as JSON."""
+    scenarios = [("file_reader", corpus, 1) for corpus in SUITE_CORPORA]
+    scenarios += [("generate_topic_from_filename", "small_py", 1), ("strip_duplicate_titles", "small_py", 1)]
+    for corpus in SUITE_CORPORA:
+        scenarios += [("process_files", corpus, 1), ("process_files", corpus, args.workers)]
+
+    results = []
+    for scenario, corpus, workers in scenarios:
+        files = args.files if corpus == "small_py" else args.large_files
+        command = [
+            sys.executable, __file__, "suite-worker", scenario, corpus,
+            "--files", str(files), "--workers", str(workers), "--repeat", str(args.repeat),
+            "--latency", str(args.latency), "--output-chars", str(args.output_chars)
+        ]
+        output = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        results.append(result)
+        print(f"{scenario:>30} {corpus:>9} w={workers:<2} {result['throughput_per_s']:>10.1f}/s", file=sys.stderr)
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {
+            "files": args.files,
+            "large_files": args.large_files,
+            "workers": args.workers,
+            "latency": args.latency,
+            "output_chars": args.output_chars,
+            "repeat": args.repeat
+        },
+        "import_time_s": {module: measure_import_time(module) for module in ("helper", "main")},
+        "results": results
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+def bench_prefix_cache(args):
+    """Check that every call in a batch sends byte-identical instructions, and report cached prompt tokens per call."""
+    model = FakeNotesModel(latency=0.0, output_chars=args.output_chars)
+
+    with tempfile.TemporaryDirectory() as directory:
+        files = write_python_corpus(directory, args.files)
+        large = os.path.join(directory, "large_module.py")
+        write_large_python_file(large)
+        files.append(large)
+
+        all_notes, _ = process_files(files, ai_model=model, max_workers=args.workers, max_chunk_tokens=args.max_chunk_tokens)
+
+    calls = [call for note in all_notes for call in note['metrics']['calls']]
+    print(f"{'file':>22} {'calls':>6} {'input':>7} {'cached':>7}")
+    for note in all_notes:
+        span = note['metrics']
+        print(f"{os.path.basename(note['file_path']):>22} {len(span['calls']):>6} {span['input_tokens']:>7} {span['cached_tokens']:>7}")
+
+    prefixes = set(model.prefix_hashes)
+    print(f"model calls: {len(model.prefix_hashes)}, distinct prefixes: {len(prefixes)}")
+    print(f"cached prompt tokens: {sum(call['cached_tokens'] for call in calls)} of {sum(call['input_tokens'] for call in calls)}")
+    if len(prefixes) != 1 or len(model.prefix_hashes) != len(calls):
+        print("❌ The instruction prefix changed between calls")
+        sys.exit(1)
+    print("✅ Every call sent the same instruction prefix")
+
+def write_noisy_notebook(path, cells=30, seed=0):
+    """Write a notebook whose code cells repeat imports, embed data and base64 images, and interleave markdown headings."""
+    rng = random.Random(seed)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('{"cells": [')
+        for i in range(cells):
+            if i % 5 == 0:
+                cell = {"cell_type": "markdown", "metadata": {}, "source": [f"## Part {i // 5 + 1}\n", "Some explanation.\n"]}
+            else:
+                rows = "".join(f"    [{rng.random():.6f}, {rng.random():.6f}, {rng.randint(0, 99)}],\n" for _ in range(40))
+                icon = base64.b64encode(rng.randbytes(3000)).decode("ascii")
+                source = (
+                    "import numpy as np\nimport matplotlib.pyplot as plt\n\n"
+                    f"data = np.array([\n{rows}])\n"
+                    f'icon = "{icon}"\n'
+                    f"plt.plot(data[:, {i % 2}])   \nplt.show()\n"
+                )
+                cell = {"cell_type": "code", "execution_count": i, "metadata": {}, "outputs": [], "source": source}
+            f.write(("," if i else "") + json.dumps(cell))
+        f.write('], "metadata": {}, "nbformat": 4, "nbformat_minor": 5}')
+
+def bench_preprocess(args):
+    """Report estimated tokens before and after preprocessing, and how long it takes, for clean and noisy files."""
+    preprocessor = Preprocessor(strip_commented_code=True, markdown_headings=True)
+
+    with tempfile.TemporaryDirectory() as directory:
+        files = write_python_corpus(directory, args.files)
+        large = os.path.join(directory, "large_module.py")
+        write_large_python_file(large)
+        files.append(large)
+        for i in range(args.files):
+            path = os.path.join(directory, f"noisy_{i:03d}.ipynb")
+            write_noisy_notebook(path, seed=i)
+            files.append(path)
+
+        print(f"{'file':>22} {'before':>8} {'after':>8} {'saved':>7} {'ms':>7}")
+        totals = [0, 0]
+        for path in files:
+            if path.endswith(".ipynb"):
+                before = "\n".join(read_code_cells(path))
+                start = time.perf_counter()
+                after = "\n".join(preprocessor.notebook(path, read_notebook_cells(path)))
+            else:
+                before = file_reader(path)
+                start = time.perf_counter()
+                after = preprocessor.source(path, before)
+            elapsed = (time.perf_counter() - start) * 1000
+            tokens = estimate_tokens(before), estimate_tokens(after)
+            totals = [totals[0] + tokens[0], totals[1] + tokens[1]]
+            print(f"{os.path.basename(path):>22} {tokens[0]:>8} {tokens[1]:>8} {1 - tokens[1] / tokens[0]:>7.0%} {elapsed:>7.2f}")
+
+    print(f"total: {totals[0]:,} -> {totals[1]:,} tokens ({1 - totals[1] / totals[0]:.0%} saved)")
+
+def write_course_corpus(directory, lessons, seed=0):
+    """Write a course folder where every lesson also has a verbatim copy and a slightly edited solution version."""
+    rng = random.Random(seed)
+    paths = []
+    for i in range(lessons):
+        lines = [f"value_{line} = compute({line}, {rng.randint(0, 999)})  # lesson {i}\n" for line in range(60)]
+        solution = list(lines)
+        for line in rng.sample(range(60), 3):
+            solution[line] = f"value_{line} = solve({line})  # filled in\n"
+        for name, body in ((f"lesson_{i:03d}.py", lines), (f"lesson_{i:03d}-copy.py", lines), (f"lesson_{i:03d}_solution.py", solution)):
+            path = os.path.join(directory, name)
+            with open(path, "w", encoding="utf-8") as f:
+                f.writelines(body)
+            paths.append(path)
+    return paths
+
+def bench_dedupe(args):
+    """Compare LLM calls and prompt tokens with and without duplicate detection on a corpus full of copies."""
+    with tempfile.TemporaryDirectory() as directory:
+        files = write_course_corpus(directory, args.files)
+        print(f"{'mode':>10} {'files':>6} {'calls':>6} {'input tokens':>13} {'merged':>7} {'seconds':>8}")
+        for mode, dedupe in (("off", None), ("on", DuplicateDetector(threshold=args.threshold))):
+            model = FakeNotesModel(latency=args.latency, output_chars=args.output_chars)
+            start = time.perf_counter()
+            all_notes, _ = process_files(files, ai_model=model, max_workers=args.workers, dedupe=dedupe)
+            elapsed = time.perf_counter() - start
+            input_tokens = sum(note['metrics']['input_tokens'] for note in all_notes)
+            merged = sum(1 for note in all_notes if note['merged'])
+            print(f"{mode:>10} {len(files):>6} {len(model.prefix_hashes):>6} {input_tokens:>13} {merged:>7} {elapsed:>8.2f}")
+
+def write_repository(directory, files, seed=0):
+    """Write a repository-like tree: nested packages, Latin-1 and binary files, a big generated file and an ignored build folder."""
+    rng = random.Random(seed)
+    with open(os.path.join(directory, ".gitignore"), "w", encoding="utf-8") as f:
+        f.write("build/\n*.log\n")
+    for i in range(files):
+        package = os.path.join(directory, f"pkg_{i % 20:02d}", f"sub_{i % 7}")
+        os.makedirs(package, exist_ok=True)
+        path = os.path.join(package, f"module_{i:05d}.py")
+        if i % 50 == 1:
+            with open(path, "wb") as f:
+                f.write(f"# caf\xe9 {i}\nvalue = {i}\n".encode("latin-1"))
+        elif i % 50 == 2:
+            with open(path, "wb") as f:
+                f.write(rng.randbytes(4096))
+        else:
+            with open(path, "w", encoding="utf-8") as f:
+                f.writelines(f"value_{line} = {line} * {i}\n" for line in range(rng.randint(20, 200)))
+    os.makedirs(os.path.join(directory, "build"), exist_ok=True)
+    for i in range(files // 10):
+        with open(os.path.join(directory, "build", f"generated_{i}.py"), "w", encoding="utf-8") as f:
+            f.write("x = 1\n" * 100)
+    with open(os.path.join(directory, "generated_tables.py"), "w", encoding="utf-8") as f:
+        f.write("TABLE = [\n" + "    0,\n" * 1_000_000 + "]\n")
+
+def read_serially(directory):
+    """The old path: walk with os.walk and read every supported file as UTF-8, skipping the ones that fail."""
+    count = 0
+    for root, dirs, names in os.walk(directory):
+        dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+        for name in sorted(names):
+            if name.split(".")[-1] in ("py", "js", "ipynb", "java", "cpp", "c", "txt"):
+                try:
+                    with open(os.path.join(root, name), "r", encoding="utf-8") as f:
+                        f.read()
+                    count += 1
+                except UnicodeDecodeError:
+                    pass
+    return count
+
+def bench_ingest(args):
+    """Files per second for the serial UTF-8 reader and for parallel ingestion."""
+    with tempfile.TemporaryDirectory() as directory:
+        write_repository(directory, args.files)
+
+        start = time.perf_counter()
+        count = read_serially(directory)
+        serial = time.perf_counter() - start
+        print(f"serial:   {count} files in {serial:.2f}s ({count / serial:,.0f} files/s), crashes on non-UTF-8 files skipped")
+
+        for workers in args.workers:
+            files, report = ingest([directory], extensions=["py", "js", "ipynb", "java", "cpp", "c", "txt"], workers=workers)
+            print(f"ingest/{workers:<2} {report.summary()}")
+
+def bench_context(args):
+    """Prompt tokens per file as the batch grows, with the full topic list and with bounded retrieved context."""
+    print(f"{'files':>6} {'context':>10} {'mean input':>11} {'last input':>11}")
+    for count in args.files:
+        with tempfile.TemporaryDirectory() as directory:
+            files = write_python_corpus(directory, count)
+            for mode, context_tokens in (("full list", None), ("retrieved", args.context_tokens)):
+                model = FakeNotesModel(latency=0.0, output_chars=args.output_chars)
+                all_notes, _ = process_files(files, ai_model=model, max_workers=1, context_tokens=context_tokens)
+                inputs = [note['metrics']['input_tokens'] for note in all_notes]
+                print(f"{count:>6} {mode:>10} {statistics.mean(inputs):>11.0f} {inputs[-1]:>11}")
+
+def bench_service(args):
+    """Several clients submit the same course to one server at once; count the model calls actually made."""
+    with tempfile.TemporaryDirectory() as directory:
+        files = write_python_corpus(directory, args.files)
+        sources = []
+        for path in files:
+            with open(path, "r", encoding="utf-8") as f:
+                sources.append((os.path.basename(path), f.read()))
+        model = FakeNotesModel(latency=args.latency, output_chars=args.output_chars)
+        server = NotesServer(
+            port=0,
+            max_jobs=args.clients,
+            model_factory=lambda provider, model_name, api_key: model,
+            cache_path=os.path.join(directory, "cache.sqlite"),
+            jobs_dir=os.path.join(directory, "jobs")
+        )
+        with server:
+            first_text = [None] * args.clients
+            results = [None] * args.clients
+
+            def run_client(n, start):
+                client = NotesClient(server.base_url)
+                job_id = client.submit(sources, "Shared Course", provider="Fake", model="fake-notes", options={"workers": args.workers, "use_cache": False})
+
+                def on_chunk(index, text):
+                    if first_text[n] is None:
+                        first_text[n] = time.perf_counter() - start
+                results[n] = client.follow(job_id, on_chunk=on_chunk)
+
+            start = time.perf_counter()
+            threads = [threading.Thread(target=run_client, args=(n, start)) for n in range(args.clients)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - start
+
+        requested = args.clients * args.files
+        coalesced = sum(entry['metrics']['coalesced_calls'] for result in results for entry in result)
+        identical = all([entry['notes'] for entry in result] == [entry['notes'] for entry in results[0]] for result in results)
+        print(f"{args.clients} clients x {args.files} files: {len(model.prefix_hashes)} model calls for {requested} files ({coalesced} coalesced) in {elapsed:.2f}s")
+        print(f"first streamed text after {statistics.mean(first_text):.2f}s on average; every client got the same notes: {identical}")
+
+def assemble_by_concatenation(main_title, processed_files):
+    """The old path: grow one string with += and compile the title patterns for every section."""
+    combined_notes = f"# {main_title}\n\n"
+    for file_data in processed_files:
+        notes = file_data['notes'].lstrip()
+        notes = re.sub(r'^#{1,3}\s*' + re.escape(main_title) + r'\s*\n+', '', notes)
+        notes = re.sub(r'^#{1,3}\s*' + re.escape(file_data['topic_name']) + r'\s*\n+', '', notes).lstrip()
+        combined_notes += f"## {file_data['topic_name']}\n\n" + notes + "\n\n"
+    return combined_notes
+
+def bench_assembly(args):
+    """Assemble and render a large document, then re-render it after editing one section."""
+    processed_files = [
+        {'topic_name': f"Topic {i}", 'notes': f"## Topic {i}\n\n{fake_notes(args.output_chars)}", 'error': None}
+        for i in range(args.sections)
+    ]
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        text = assemble_by_concatenation("Bench", processed_files)
+        with open(os.path.join(directory, "old.md"), "w", encoding="utf-8") as f:
+            f.write(text)
+        concatenated = time.perf_counter() - start
+
+        start = time.perf_counter()
+        sections = build_sections("Bench", processed_files)
+        write_sections(os.path.join(directory, "new.md"), sections)
+        streamed = time.perf_counter() - start
+    print(f"assemble {args.sections} sections: concatenation {concatenated * 1000:.1f} ms, sections {streamed * 1000:.1f} ms")
+
+    cache = RenderCache()
+    start = time.perf_counter()
+    for section in sections:
+        cache.render(section)
+    cold = time.perf_counter() - start
+
+    processed_files[args.sections // 2]['notes'] += "\n\nAn edited paragraph."
+    start = time.perf_counter()
+    for section in build_sections("Bench", processed_files):
+        cache.render(section)
+    warm = time.perf_counter() - start
+    print(f"render: first {cold * 1000:.0f} ms, after editing one section {warm * 1000:.1f} ms ({cache.stats()['misses'] - len(sections)} re-rendered)")
+
+def bench_export(args):
+    """Export a large document cold, again unchanged, then after editing one section."""
+    processed_files = [
+        {'topic_name': f"Topic {i}", 'notes': f"## Topic {i}\n\n{fake_notes(args.output_chars)}", 'error': None}
+        for i in range(args.sections)
+    ]
+    sections = build_sections("Bench", processed_files)
+    with tempfile.TemporaryDirectory() as directory:
+        html_path = os.path.join(directory, "notes.html")
+        pdf_path = os.path.join(directory, "notes.pdf") if args.pdf else None
+        exporter = Exporter(cache_dir=os.path.join(directory, "cache"))
+        report = exporter.export(sections, "Bench", html_path=html_path, pdf_path=pdf_path)
+        print(f"cold: {format_export_report(report)}")
+        report = exporter.export(sections, "Bench", html_path=html_path, pdf_path=pdf_path)
+        print(f"unchanged: {format_export_report(report)}")
+
+        processed_files[args.sections // 2]['notes'] += "\n\nAn edited paragraph."
+        report = exporter.export(build_sections("Bench", processed_files), "Bench", html_path=html_path, pdf_path=pdf_path)
+        print(f"after editing one section: {format_export_report(report)}")
+        if report["pdf_error"]:
+            print(f"no PDF: {report['pdf_error']}")
+
+def bench_truncation(args):
+    """Tokens spent completing notes cut off by an output limit: continuing from the tail vs. retrying with a larger limit."""
+    file_content = "value = compute(1)  # a line of code\n" * (args.file_tokens * 4 // 37)
+    expected = numbered_notes(args.output_chars)
+    print(f"{'limit':>7} {'calls':>6} {'complete':>9} {'continued tokens':>17} {'retry tokens':>13} {'saved':>6}")
+    for limit in args.limits:
+        model = FakeNotesModel(latency=0.0, output_chars=args.output_chars, max_output_chars=limit, repeat_chars=args.repeat_chars)
+        timings = {}
+        notes = generate_detailed_notes("Bench", "", "Topic", "", file_content, model, timings=timings)
+        continued = timings['input_tokens'] + timings['output_tokens']
+        # The alternative pays for the truncated call, then sends the whole prompt again with a limit the notes fit in
+        first = timings['calls'][0]
+        retry = first['input_tokens'] + first['output_tokens']
+        if timings.get('continuations'):
+            larger = FakeNotesModel(latency=0.0, output_chars=args.output_chars, max_output_chars=len(expected))
+            retry_timings = {}
+            generate_detailed_notes("Bench", "", "Topic", "", file_content, larger, timings=retry_timings)
+            retry += retry_timings['input_tokens'] + retry_timings['output_tokens']
+        saved = 1 - continued / retry
+        print(f"{limit:>7} {len(timings['calls']):>6} {str(notes == expected):>9} {continued:>17,} {retry:>13,} {saved:>6.0%}")
+
+def bench_hedging(args):
+    """Per-call latency with one provider vs. hedged providers, each with a slow tail; then a provider that fails."""
+    rng = random.Random(args.seed)
+    lock = threading.Lock()
+
+    def slow_tail():
+        # Most calls take about `latency`, a few are `slow_factor` times slower
+        with lock:
+            latency = args.latency * rng.lognormvariate(0, 0.25)
+            return latency * args.slow_factor if rng.random() < args.slow_rate else latency
+
+    def provider(**options):
+        return FakeNotesModel(output_chars=args.output_chars, latency_distribution=slow_tail, **options)
+
+    def run(model, calls):
+        def one(i):
+            start = time.perf_counter()
+            if args.stream:
+                generate_detailed_notes("Bench", "", f"Topic {i}", "", f"value = {i}", model, on_chunk=lambda chunk: None)
+            else:
+                generate_detailed_notes("Bench", "", f"Topic {i}", "", f"value = {i}", model)
+            return time.perf_counter() - start
+        with ThreadPoolExecutor(max_workers=args.workers) as executor:
+            latencies = sorted(executor.map(one, range(calls)))
+        quantiles = statistics.quantiles(latencies, n=100)
+        return f"p50 {quantiles[49]:.2f}s  p95 {quantiles[94]:.2f}s  p99 {quantiles[98]:.2f}s  max {latencies[-1]:.2f}s"
+
+    print(f"one provider:     {run(provider(), args.calls)}")
+    hedged = HedgedChatModel(
+        backends=[Backend("primary", provider()), Backend("secondary", provider())],
+        hedge_percentile=args.percentile,
+        initial_hedge_delay=args.latency * 3
+    )
+    print(f"hedged providers: {run(hedged, args.calls)}")
+    stats = hedged.stats()
+    print(f"  {stats['hedged']} of {stats['calls']} calls hedged ({stats['hedged'] / stats['calls']:.0%} extra requests), {stats['hedge_wins']} won by the hedge")
+
+    failing = HedgedChatModel(
+        backends=[Backend("failing", provider(error_rate=1.0)), Backend("healthy", provider())],
+        hedge_percentile=args.percentile,
+        initial_hedge_delay=args.latency * 3
+    )
+    print(f"first provider down: {run(failing, args.calls // 2)}")
+    backends = failing.stats()['backends']
+    print(f"  failing provider tried {backends['failing']['calls']} times before its circuit opened (now {backends['failing']['circuit']})")
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="DevNotes-AI offline benchmarks")
+    subparsers = arg_parser.add_subparsers(dest="command", required=True)
+
+    concurrency = subparsers.add_parser("concurrency", help="Speedup of concurrent process_files")
+    concurrency.add_argument("--files", type=int, default=40)
+    concurrency.add_argument("--latency", type=float, default=0.5, help="Fake model latency in seconds")
+    concurrency.add_argument("--output-chars", type=int, default=2000)
+    concurrency.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    concurrency.set_defaults(func=bench_concurrency)
+
+    streaming = subparsers.add_parser("streaming", help="Time-to-first-token of streamed generation")
+    streaming.add_argument("--files", type=int, default=10)
+    streaming.add_argument("--latency", type=float, default=2.0, help="Fake model latency in seconds")
+    streaming.add_argument("--output-chars", type=int, default=4000)
+    streaming.add_argument("--workers", type=int, default=4)
+    streaming.set_defaults(func=bench_streaming)
+
+    notebook = subparsers.add_parser("notebook", help="Peak memory and parse time of notebook readers")
+    notebook.add_argument("--size-mb", type=int, default=50)
+    notebook.set_defaults(func=bench_notebook)
+
+    worker = subparsers.add_parser("notebook-worker")
+    worker.add_argument("reader", choices=["json.load", "streaming"])
+    worker.add_argument("path")
+    worker.set_defaults(func=notebook_worker)
+
+    clients = subparsers.add_parser("clients", help="Overhead saved by reusing model clients and chains")
+    clients.add_argument("--calls", type=int, default=200)
+    clients.set_defaults(func=bench_clients)
+
+    throttling = subparsers.add_parser("throttling", help="Batch completion under 429s with and without the request scheduler")
+    throttling.add_argument("--files", type=int, default=30)
+    throttling.add_argument("--workers", type=int, default=8)
+    throttling.add_argument("--latency", type=float, default=0.2, help="Stub server latency in seconds")
+    throttling.add_argument("--server-concurrency", type=int, default=3, help="Requests in flight before the server answers 429")
+    throttling.add_argument("--throttle-rate", type=float, default=0.05, help="Fraction of requests answered with a random 429")
+    throttling.add_argument("--retry-after", type=float, default=None, help="Retry-After seconds sent with 429s")
+    throttling.set_defaults(func=bench_throttling)
+
+    suite = subparsers.add_parser("suite", help="Deterministic pipeline benchmarks reported as JSON")
+    suite.add_argument("--files", type=int, default=40, help="Files in the small .py corpus")
+    suite.add_argument("--large-files", type=int, default=5, help="Files in the large .py and notebook corpora")
+    suite.add_argument("--workers", type=int, default=8, help="Workers for the concurrent process_files runs")
+    suite.add_argument("--latency", type=float, default=0.05, help="Fake model latency in seconds")
+    suite.add_argument("--output-chars", type=int, default=2000)
+    suite.add_argument("--repeat", type=int, default=20, help="Repetitions of each micro benchmark")
+    suite.add_argument("--output", default=None, help="Write the JSON report here instead of stdout")
+    suite.set_defaults(func=bench_suite)
+
+    suite_worker_parser = subparsers.add_parser("suite-worker")
+    suite_worker_parser.add_argument("scenario", choices=["process_files", "file_reader", "generate_topic_from_filename", "strip_duplicate_titles"])
+    suite_worker_parser.add_argument("corpus", choices=SUITE_CORPORA)
+    suite_worker_parser.add_argument("--files", type=int, default=40)
+    suite_worker_parser.add_argument("--workers", type=int, default=1)
+    suite_worker_parser.add_argument("--repeat", type=int, default=20)
+    suite_worker_parser.add_argument("--latency", type=float, default=0.05)
+    suite_worker_parser.add_argument("--output-chars", type=int, default=2000)
+    suite_worker_parser.set_defaults(func=suite_worker)
+
+    prefix_cache = subparsers.add_parser("prefix-cache", help="Verify the prompt prefix is identical across a batch")
+    prefix_cache.add_argument("--files", type=int, default=20)
+    prefix_cache.add_argument("--workers", type=int, default=4)
+    prefix_cache.add_argument("--output-chars", type=int, default=400)
+    prefix_cache.add_argument("--max-chunk-tokens", type=int, default=6000)
+    prefix_cache.set_defaults(func=bench_prefix_cache)
+
+    preprocess = subparsers.add_parser("preprocess", help="Tokens saved by preprocessing clean and noisy files")
+    preprocess.add_argument("--files", type=int, default=10)
+    preprocess.set_defaults(func=bench_preprocess)
+
+    dedupe = subparsers.add_parser("dedupe", help="LLM calls saved by merging duplicate files")
+    dedupe.add_argument("--files", type=int, default=10, help="Lessons; each also gets a copy and a solution version")
+    dedupe.add_argument("--threshold", type=float, default=0.8)
+    dedupe.add_argument("--workers", type=int, default=4)
+    dedupe.add_argument("--latency", type=float, default=0.05)
+    dedupe.add_argument("--output-chars", type=int, default=400)
+    dedupe.set_defaults(func=bench_dedupe)
+
+    ingest_parser = subparsers.add_parser("ingest", help="Serial reading vs. parallel ingestion of a repository tree")
+    ingest_parser.add_argument("--files", type=int, default=5000)
+    ingest_parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 16])
+    ingest_parser.set_defaults(func=bench_ingest)
+
+    context = subparsers.add_parser("context", help="Prompt tokens per file against file count")
+    context.add_argument("--files", type=int, nargs="+", default=[10, 50, 200])
+    context.add_argument("--context-tokens", type=int, default=400)
+    context.add_argument("--output-chars", type=int, default=1500)
+    context.set_defaults(func=bench_context)
+
+    service = subparsers.add_parser("service", help="Request coalescing when several clients submit the same files to one server")
+    service.add_argument("--clients", type=int, default=5)
+    service.add_argument("--files", type=int, default=10)
+    service.add_argument("--workers", type=int, default=1)
+    service.add_argument("--latency", type=float, default=0.5)
+    service.add_argument("--output-chars", type=int, default=1500)
+    service.set_defaults(func=bench_service)
+
+    imports = subparsers.add_parser("imports", help="Cold-start import time (-X importtime) of the CLI and the app")
+    imports.add_argument("--runs", type=int, default=5)
+    imports.set_defaults(func=bench_imports)
+
+    assembly = subparsers.add_parser("assembly", help="Sectioned assembly and cached rendering of a large document")
+    assembly.add_argument("--sections", type=int, default=500)
+    assembly.add_argument("--output-chars", type=int, default=3000)
+    assembly.set_defaults(func=bench_assembly)
+
+    export = subparsers.add_parser("export", help="Cached HTML/PDF export of a large document")
+    export.add_argument("--sections", type=int, default=500)
+    export.add_argument("--output-chars", type=int, default=3000)
+    export.add_argument("--pdf", action="store_true", help="Also print a PDF (needs wkhtmltopdf)")
+    export.set_defaults(func=bench_export)
+
+    truncation = subparsers.add_parser("truncation", help="Tokens saved by continuing cut-off notes instead of retrying with a larger limit")
+    truncation.add_argument("--file-tokens", type=int, default=20000, help="Approximate tokens of the file being explained")
+    truncation.add_argument("--output-chars", type=int, default=24000, help="Length of the complete notes")
+    truncation.add_argument("--limits", type=int, nargs="+", default=[8000, 12000, 16000, 32000], help="Output limits (characters) of the fake model")
+    truncation.add_argument("--repeat-chars", type=int, default=40, help="Characters of the tail the fake model repeats when continuing")
+    truncation.set_defaults(func=bench_truncation)
+
+    hedging = subparsers.add_parser("hedging", help="Tail latency with latency-hedged providers and a circuit breaker")
+    hedging.add_argument("--calls", type=int, default=200)
+    hedging.add_argument("--workers", type=int, default=8)
+    hedging.add_argument("--latency", type=float, default=0.1, help="Median fake model latency in seconds")
+    hedging.add_argument("--slow-rate", type=float, default=0.05, help="Share of calls hitting the slow tail")
+    hedging.add_argument("--slow-factor", type=float, default=20.0, help="How much slower slow calls are")
+    hedging.add_argument("--percentile", type=float, default=95.0, help="Latency percentile after which calls are hedged")
+    hedging.add_argument("--output-chars", type=int, default=2000)
+    hedging.add_argument("--stream", action="store_true", help="Stream the calls (hedging then races to the first token)")
+    hedging.add_argument("--seed", type=int, default=1)
+    hedging.set_defaults(func=bench_hedging)
+
+    args = arg_parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Persistent, content-addressed cache for generated notes.
+
+Responses are stored in a small SQLite database keyed on a hash of the
+rendered prompt plus the provider and model that produced them.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_CACHE_PATH = os.path.join(".devnotes_cache", "notes.sqlite")
+DEFAULT_MAX_BYTES = 200 * 1024 * 1024
+
+def model_identity(ai_model):
+    """Return (provider, model_name) strings that identify an AI model instance."""
+    provider = type(ai_model).__name__
+    model_name = getattr(ai_model, "model_name", None) or getattr(ai_model, "model", None) or ""
+    return provider, str(model_name)
+
+def cache_key(prompt_text, provider, model_name):
+    """Hash a rendered prompt together with the provider and model name."""
+    digest = hashlib.sha256()
+    for part in (provider, model_name, prompt_text):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+class NotesCache:
+    """
+    On-disk LRU cache of LLM responses.
+
+    Args:
+        path: SQLite file to store responses in
+        max_bytes: Total response size kept before least recently used entries are evicted
+        bypass: If True, lookups always miss but fresh responses are still stored
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes=DEFAULT_MAX_BYTES, bypass=False):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.bypass = bypass
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses(last_used)")
+        self._conn.commit()
+
+    def key_for(self, prompt_text, ai_model):
+        """Build the cache key for a rendered prompt sent to `ai_model`."""
+        provider, model_name = model_identity(ai_model)
+        return cache_key(prompt_text, provider, model_name)
+
+    def get(self, key):
+        """Return the cached response for `key`, or None on a miss."""
+        if self.bypass:
+            return None
+
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key, value):
+        """Store a response and evict old entries if the cache is over its size limit."""
+        size = len(value.encode("utf-8"))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, last_used) VALUES (?, ?, ?, ?)",
+                (key, value, size, time.time())
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """Drop least recently used entries until the total size fits `max_bytes`."""
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        rows = self._conn.execute("SELECT key, size FROM responses ORDER BY last_used ASC").fetchall()
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+
+    def stats(self):
+        """Return hit/miss counters and the current number and size of entries."""
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+        return {"hits": self.hits, "misses": self.misses, "entries": entries, "bytes": size}
+
+    def clear(self):
+        """Remove every cached response."""
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def close(self):
+        self._conn.close()
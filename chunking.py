@@ -0,0 +1,193 @@
+"""
+Structure-aware chunking for large source files and notebooks.
+
+Files are split on natural boundaries (top-level Python statements,
+notebook cells, brace-delimited blocks) and the pieces are packed into
+chunks that fit a token budget.
+"""
+
+import ast
+import re
+
+DEFAULT_MAX_CHUNK_TOKENS = 6000
+
+BRACE_EXTENSIONS = {"js", "java", "cpp", "c"}
+
+# Leading "# Title" / "## Topic" lines that each partial answer repeats
+_PART_HEADING_PATTERN = re.compile(r'^\s*#{1,2}\s[^\n]*\n+')
+
+def estimate_tokens(text):
+    """Rough token count (about four characters per token for code and English)."""
+    return len(text) // 4 + 1
+
+def get_extension(file_path):
+    """Return the lower-case file extension without the dot."""
+    return file_path.rsplit(".", 1)[-1].lower() if "." in file_path else ""
+
+def chunk_content(file_path, content, max_tokens=DEFAULT_MAX_CHUNK_TOKENS, cells=None):
+    """
+    Split file content into chunks that each fit `max_tokens`.
+
+    Args:
+        file_path: Path or name of the file (used to pick the splitting strategy)
+        content: Extracted text of the file
+        max_tokens: Token budget per chunk
+        cells: Optional list of notebook code cells (split on cell boundaries)
+    """
+    if not max_tokens or estimate_tokens(content) <= max_tokens:
+        return [content]
+
+    extension = get_extension(file_path)
+    if cells is not None:
+        segments = [cell + "\n" for cell in cells]
+    elif extension == "py":
+        segments = split_python(content, max_tokens)
+    elif extension in BRACE_EXTENSIONS:
+        segments = split_braces(content)
+    else:
+        segments = split_paragraphs(content)
+
+    return pack_segments(segments, max_tokens)
+
+def split_python(source, max_tokens=DEFAULT_MAX_CHUNK_TOKENS):
+    """Split Python source on top-level statement boundaries, descending into oversized classes and functions."""
+    try:
+        tree = ast.parse(source)
+    except SyntaxError:
+        return split_paragraphs(source)
+
+    lines = source.splitlines(keepends=True)
+    return _split_nodes(lines, tree.body, 0, len(lines), max_tokens)
+
+def _node_start(node, lines, floor):
+    """First line (0-based) of a node, including decorators and the comment lines right above it."""
+    start = node.lineno - 1
+    for decorator in getattr(node, "decorator_list", []):
+        start = min(start, decorator.lineno - 1)
+    while start > floor and lines[start - 1].lstrip().startswith("#"):
+        start -= 1
+    return start
+
+def _split_nodes(lines, nodes, start, end, max_tokens):
+    """Cut lines[start:end] at the start of each node, recursing into nodes that are still too big."""
+    if not nodes:
+        return ["".join(lines[start:end])] if start < end else []
+
+    boundaries = [start]
+    owners = [None]
+    floor = start
+    for node in nodes:
+        node_start = max(_node_start(node, lines, floor), floor)
+        if node_start > boundaries[-1]:
+            boundaries.append(node_start)
+            owners.append(node)
+        else:
+            owners[-1] = node
+        floor = node.end_lineno
+    boundaries.append(end)
+
+    segments = []
+    for seg_start, seg_end, node in zip(boundaries, boundaries[1:], owners):
+        text = "".join(lines[seg_start:seg_end])
+        body = getattr(node, "body", None)
+        if estimate_tokens(text) > max_tokens and isinstance(body, list) and body and body[0].lineno - 1 > seg_start:
+            segments.extend(_split_nodes(lines, body, seg_start, seg_end, max_tokens))
+        else:
+            segments.append(text)
+    return segments
+
+def split_braces(source):
+    """Split C-like source at lines where the brace depth returns to zero."""
+    segments = []
+    current = []
+    depth = 0
+    in_block_comment = False
+
+    for line in source.splitlines(keepends=True):
+        current.append(line)
+        opened = False
+        i = 0
+        quote = None
+        while i < len(line):
+            char = line[i]
+            pair = line[i:i + 2]
+            if in_block_comment:
+                if pair == "*/":
+                    in_block_comment = False
+                    i += 1
+            elif quote:
+                if char == "\\":
+                    i += 1
+                elif char == quote:
+                    quote = None
+            elif pair == "//":
+                break
+            elif pair == "/*":
+                in_block_comment = True
+                i += 1
+            elif char in "\"'`":
+                quote = char
+            elif char == "{":
+                depth += 1
+                opened = True
+            elif char == "}":
+                depth = max(depth - 1, 0)
+                opened = True
+            i += 1
+
+        if depth == 0 and not in_block_comment and (opened or not line.strip()):
+            segments.append("".join(current))
+            current = []
+
+    if current:
+        segments.append("".join(current))
+    return segments
+
+def split_paragraphs(text):
+    """Split plain text on blank lines."""
+    segments = re.split(r'(\n\s*\n)', text)
+    # Re-attach each separator to the paragraph before it
+    return ["".join(segments[i:i + 2]) for i in range(0, len(segments), 2)]
+
+def split_lines(text, max_tokens):
+    """Last-resort split of a single oversized segment on line boundaries."""
+    pieces = []
+    current = ""
+    for line in text.splitlines(keepends=True):
+        if current and estimate_tokens(current + line) > max_tokens:
+            pieces.append(current)
+            current = ""
+        current += line
+    if current:
+        pieces.append(current)
+    return pieces
+
+def pack_segments(segments, max_tokens):
+    """Greedily pack consecutive segments into chunks of at most `max_tokens`."""
+    chunks = []
+    current = ""
+    for segment in segments:
+        if estimate_tokens(segment) > max_tokens:
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.extend(split_lines(segment, max_tokens))
+            continue
+        if current and estimate_tokens(current + segment) > max_tokens:
+            chunks.append(current)
+            current = ""
+        current += segment
+    if current:
+        chunks.append(current)
+    return [chunk for chunk in chunks if chunk.strip()] or [""]
+
+def stitch_chunk_notes(parts):
+    """Merge the notes generated for each chunk into one topic section."""
+    cleaned = []
+    for part in parts:
+        part = part.lstrip()
+        # Each part tends to restate the main title and topic; the section heading is added once at assembly
+        while _PART_HEADING_PATTERN.match(part):
+            part = _PART_HEADING_PATTERN.sub('', part, count=1)
+        cleaned.append(part.strip())
+    return "\n\n".join(part for part in cleaned if part)
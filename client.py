@@ -0,0 +1,128 @@
+"""
+Thin client for the DevNotes-AI server (server.py).
+
+Only the standard library is needed: files are posted as JSON and the job
+is followed over its server-sent event stream, with the same callbacks
+process_files takes, so the CLI and the Streamlit app can hand the work to
+a shared server without changing how they show it.
+"""
+
+import json
+import urllib.error
+import urllib.request
+
+from jobs import DONE
+
+DEFAULT_TIMEOUT = 60.0
+
+class ServerError(Exception):
+    """The server rejected a request or a job failed on it."""
+
+def iter_events(lines):
+    """Parse server-sent events from an iterable of byte lines into (event, data) pairs."""
+    event, data = None, []
+    for raw in lines:
+        line = raw.decode("utf-8").rstrip("\r\n")
+        if not line:
+            if data:
+                yield event or "message", json.loads("\n".join(data))
+            event, data = None, []
+        elif line.startswith(":"):
+            continue
+        elif line.startswith("event:"):
+            event = line[6:].strip()
+        elif line.startswith("data:"):
+            data.append(line[5:].lstrip())
+
+def _read(upload):
+    with upload.open() as f:
+        return f.read()
+
+class NotesClient:
+    """
+    Submit batches to a DevNotes-AI server and follow them.
+
+    Args:
+        base_url: Server address, e.g. http://127.0.0.1:8765
+        timeout: Seconds to wait on the connection; idle event streams get a keep-alive well within it
+    """
+
+    def __init__(self, base_url, timeout=DEFAULT_TIMEOUT):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+
+    def _request(self, method, path, body=None):
+        data = json.dumps(body).encode("utf-8") if body is not None else None
+        request = urllib.request.Request(
+            f"{self.base_url}{path}",
+            data=data,
+            method=method,
+            headers={"Content-Type": "application/json"} if data is not None else {}
+        )
+        try:
+            return urllib.request.urlopen(request, timeout=self.timeout)
+        except urllib.error.HTTPError as e:
+            try:
+                message = json.loads(e.read()).get("error")
+            except ValueError:
+                message = None
+            raise ServerError(message or f"{e.code} {e.reason}") from None
+
+    def submit(self, files, title, topics=None, suggestions=None, provider=None, model=None, api_key=None, options=None, client_id=None):
+        """
+        Queue a batch and return the job ID.
+
+        `files` are uploads (objects with `name` and `open()`, as returned by
+        ingest or UploadStore) or (name, text) pairs. `options` are the job
+        options listed in server.JOB_OPTIONS. `client_id` keeps this client's
+        project manifests on the server apart from other clients'.
+        """
+        body = {
+            "title": title,
+            "files": [
+                {"name": f[0], "content": f[1]} if isinstance(f, tuple) else {"name": f.name, "content": _read(f)}
+                for f in files
+            ],
+            "topics": topics,
+            "suggestions": suggestions,
+            "provider": provider,
+            "model": model,
+            "api_key": api_key,
+            "client_id": client_id,
+            "options": options or {}
+        }
+        with self._request("POST", "/jobs", body) as response:
+            return json.loads(response.read())["id"]
+
+    def get(self, job_id):
+        """Return the job as the server reports it."""
+        with self._request("GET", f"/jobs/{job_id}") as response:
+            return json.loads(response.read())
+
+    def events(self, job_id):
+        """Yield the job's (event, data) pairs as they arrive, until it ends."""
+        with self._request("GET", f"/jobs/{job_id}/events") as response:
+            yield from iter_events(response)
+
+    def follow(self, job_id, progress_callback=None, on_chunk=None, on_result=None):
+        """
+        Follow a job to its end, passing its progress, streamed text and
+        finished entries to the callbacks (same signatures as in process_files).
+
+        Returns the entries in batch order; raises ServerError if the job failed.
+        """
+        results = {}
+        for event, data in self.events(job_id):
+            if event == "progress" and progress_callback:
+                progress_callback(data["completed"], data["total"], data["message"])
+            elif event == "text" and on_chunk:
+                on_chunk(data["index"], data["text"])
+            elif event == "result":
+                results[data["index"]] = data["entry"]
+                if on_result:
+                    on_result(data["index"], data["entry"])
+            elif event == "end":
+                if data["status"] != DONE:
+                    raise ServerError(data["error"] or f"Job {job_id} ended as {data['status']}")
+                return [results[index] for index in sorted(results)]
+        raise ServerError(f"The event stream of job {job_id} ended early")
@@ -0,0 +1,127 @@
+"""
+Coalescing of identical in-flight model calls.
+
+When several jobs ask the same model for the same prompt at the same time
+(many users processing the same shared course files on one server), only
+the first caller makes the call. The others wait for its result, or follow
+its stream chunk by chunk, instead of paying for it again. A flight is
+forgotten as soon as it finishes; later callers are served by the response cache.
+"""
+
+import threading
+
+class _Flight:
+    """State of one call in flight: the text chunks produced so far and how it ended."""
+
+    def __init__(self):
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.condition = threading.Condition()
+
+class Singleflight:
+    """
+    Share the text of identical in-flight calls between threads.
+
+    Calls are identified by a key, e.g. the hash of the prompt and model
+    (see cache.cache_key). `leaders` counts calls that were made and
+    `coalesced` calls that joined one already in flight.
+    """
+
+    def __init__(self):
+        self.leaders = 0
+        self.coalesced = 0
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def _join(self, key):
+        """Return the flight for `key` and whether the caller has to make the call."""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = self._flights[key] = _Flight()
+                self.leaders += 1
+                return flight, True
+            self.coalesced += 1
+            return flight, False
+
+    def _publish(self, flight, chunk):
+        with flight.condition:
+            flight.chunks.append(chunk)
+            flight.condition.notify_all()
+
+    def _finish(self, key, flight, error=None):
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+        with flight.condition:
+            flight.done = True
+            flight.error = error
+            flight.condition.notify_all()
+
+    def _follow(self, flight, stats):
+        if stats is not None:
+            stats['coalesced_calls'] = stats.get('coalesced_calls', 0) + 1
+        position = 0
+        while True:
+            with flight.condition:
+                while position >= len(flight.chunks) and not flight.done:
+                    flight.condition.wait()
+                new_chunks = flight.chunks[position:]
+                position += len(new_chunks)
+                done, error = flight.done, flight.error
+            yield from new_chunks
+            if done:
+                if error is not None:
+                    raise error
+                return
+
+    def run(self, key, function, stats=None):
+        """
+        Return `function()`, or the text of an identical call already in flight.
+
+        Followers get the leader's error if it fails. With a `stats` dict,
+        `coalesced_calls` is counted in it when the call was shared.
+        """
+        flight, leader = self._join(key)
+        if not leader:
+            return "".join(self._follow(flight, stats))
+
+        try:
+            result = function()
+        except Exception as error:
+            self._finish(key, flight, error)
+            raise
+        self._publish(flight, result)
+        self._finish(key, flight)
+        return result
+
+    def stream(self, key, open_stream, stats=None):
+        """
+        Yield the chunks of `open_stream()`, or of an identical stream already in flight.
+
+        Followers first get the chunks the leader has already produced, then
+        each new one as it arrives, so they see the same text at the same time.
+        """
+        flight, leader = self._join(key)
+        if not leader:
+            yield from self._follow(flight, stats)
+            return
+
+        error = RuntimeError("The shared call was abandoned before it finished")
+        try:
+            for chunk in open_stream():
+                self._publish(flight, chunk)
+                yield chunk
+            error = None
+        except Exception as failure:
+            error = failure
+            raise
+        finally:
+            # Also runs when the leader stops reading early, so followers never wait forever
+            self._finish(key, flight, error)
+
+    def stats(self):
+        """Return the call counters and the number of calls in flight."""
+        with self._lock:
+            return {"leaders": self.leaders, "coalesced": self.coalesced, "in_flight": len(self._flights)}
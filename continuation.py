@@ -0,0 +1,104 @@
+"""
+Detection and continuation of notes cut off by the model's output limit.
+
+A response is treated as truncated when the provider reports that it
+stopped at the token limit or, when no finish reason is reported (some
+streams and proxies drop it), when it ends inside a fenced code block.
+Instead of generating the whole file again (paying for every input token
+once more), the notes are continued with a short request carrying only
+their tail, and the continuation is stitched on with any text the model
+repeated from the tail removed.
+"""
+
+import re
+
+# Finish reasons meaning the output limit was hit (OpenAI, Claude, Gemini)
+TRUNCATED_FINISH_REASONS = frozenset({"length", "max_tokens", "MAX_TOKENS"})
+
+DEFAULT_TAIL_CHARS = 1500
+DEFAULT_MAX_CONTINUATIONS = 3
+
+# Shorter matches between the tail and a continuation are likely coincidence
+MIN_OVERLAP_CHARS = 16
+
+FENCE_PATTERN = re.compile(r'^ {0,3}(`{3,}|~{3,})(.*)$')
+
+FENCE_HINT = " The cut happened inside a fenced code block: continue the code without opening a new block, then close it."
+
+def finish_reason(metadata):
+    """The finish reason in a message's response_metadata (or a generation's info), if any."""
+    if not metadata:
+        return None
+    reason = metadata.get("finish_reason") or metadata.get("stop_reason")
+    # Some SDKs report an enum member rather than its name
+    return getattr(reason, "name", reason)
+
+def has_open_fence(text):
+    """Whether `text` ends inside a fenced code block."""
+    fence = None
+    for line in text.split("\n"):
+        match = FENCE_PATTERN.match(line)
+        if not match:
+            continue
+        marker, info = match.groups()
+        if fence is None:
+            fence = marker
+        elif marker[0] == fence[0] and len(marker) >= len(fence) and not info.strip():
+            fence = None
+    return fence is not None
+
+def is_truncated(text, reason=None):
+    """Whether notes look cut off, from the provider's finish reason or, without one, an unclosed code fence."""
+    if reason is not None:
+        return str(reason) in TRUNCATED_FINISH_REASONS
+    return has_open_fence(text)
+
+def continuation_inputs(main_title, topic_name, text, tail_chars=DEFAULT_TAIL_CHARS):
+    """Inputs for the continuation prompt: the topic and the last `tail_chars` characters of the notes."""
+    return {
+        "main_title": main_title,
+        "topic_name": topic_name,
+        "fence_hint": FENCE_HINT if has_open_fence(text) else "",
+        "tail": text[-tail_chars:]
+    }
+
+def trim_overlap(text, continuation, tail_chars=DEFAULT_TAIL_CHARS):
+    """
+    Return the part of `continuation` that is new after `text`.
+
+    Models often start a continuation by repeating the end of what they were
+    shown, or by reopening the code block they were cut off in; both are dropped.
+    """
+    for size in range(min(len(continuation), len(text), tail_chars), MIN_OVERLAP_CHARS - 1, -1):
+        if text.endswith(continuation[:size]):
+            continuation = continuation[size:]
+            break
+
+    if has_open_fence(text):
+        first_line, newline, rest = continuation.partition("\n")
+        match = FENCE_PATTERN.match(first_line)
+        # A fence with a language opens a new block rather than closing the cut one
+        if newline and match and match.group(2).strip():
+            continuation = rest
+    return continuation
+
+def stitch_stream(text, chunks, tail_chars=DEFAULT_TAIL_CHARS):
+    """
+    Yield a streamed continuation of `text` with any repeated tail removed.
+
+    Only the start of the stream is held back, until it either stops
+    matching the tail (so the overlap is known) or is as long as the tail.
+    """
+    tail = text[-tail_chars:]
+    chunks = iter(chunks)
+    buffer = ""
+    for chunk in chunks:
+        buffer += chunk
+        if len(buffer) >= len(tail) or ("\n" in buffer and buffer not in tail):
+            break
+    head = trim_overlap(text, buffer, tail_chars)
+    if head:
+        yield head
+    for chunk in chunks:
+        if chunk:
+            yield chunk
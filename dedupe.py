@@ -0,0 +1,149 @@
+"""
+Cross-file duplicate detection.
+
+Course repositories often contain several copies of the same material
+(`lesson3.ipynb` and `lesson3-copy.ipynb`, exercise and solution versions).
+Exact copies are found by hashing their content; near copies by comparing
+MinHash signatures of word shingles, with locality-sensitive hashing so
+only files that share a band are compared.
+"""
+
+import difflib
+import hashlib
+import re
+import struct
+
+DEFAULT_THRESHOLD = 0.8
+DEFAULT_SHINGLE_SIZE = 5
+DEFAULT_NUM_PERM = 64
+DEFAULT_BANDS = 16
+
+# Files with fewer shingles than this are only merged when identical
+MIN_SHINGLES = 20
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_TOKEN_PATTERN = re.compile(r'\w+|[^\w\s]')
+
+def shingles(text, size=DEFAULT_SHINGLE_SIZE):
+    """Return the set of hashed `size`-token shingles of a text (whitespace and layout are ignored)."""
+    tokens = _TOKEN_PATTERN.findall(text)
+    if len(tokens) < size:
+        return {_hash(" ".join(tokens))} if tokens else set()
+    return {_hash(" ".join(tokens[k:k + size])) for k in range(len(tokens) - size + 1)}
+
+def _hash(text):
+    return struct.unpack("<I", hashlib.blake2b(text.encode("utf-8"), digest_size=4).digest())[0]
+
+class MinHasher:
+    """
+    MinHash signatures with a fixed set of random permutations.
+
+    Args:
+        num_perm: Signature length; the Jaccard estimate's error shrinks with its square root
+        seed: Seed for the permutations, so signatures are comparable across runs
+    """
+
+    def __init__(self, num_perm=DEFAULT_NUM_PERM, seed=1):
+        self.num_perm = num_perm
+        self._permutations = []
+        for k in range(num_perm):
+            digest = hashlib.sha256(f"{seed}:{k}".encode("ascii")).digest()
+            a, b = struct.unpack("<QQ", digest[:16])
+            self._permutations.append((a % (_MERSENNE_PRIME - 1) + 1, b % _MERSENNE_PRIME))
+
+    def signature(self, shingle_set):
+        """Return the MinHash signature of a set of hashed shingles."""
+        if not shingle_set:
+            return (_MAX_HASH,) * self.num_perm
+        values = list(shingle_set)
+        return tuple(
+            min((a * value + b) % _MERSENNE_PRIME for value in values) & _MAX_HASH
+            for a, b in self._permutations
+        )
+
+def estimate_similarity(signature, other):
+    """Estimated Jaccard similarity of the shingle sets behind two signatures."""
+    return sum(1 for x, y in zip(signature, other) if x == y) / len(signature)
+
+class DuplicateDetector:
+    """
+    Find files that are exact or near copies of an earlier file in the batch.
+
+    Args:
+        threshold: Minimum estimated Jaccard similarity for two files to count as near copies
+        shingle_size: Tokens per shingle
+        num_perm: MinHash signature length
+        bands: LSH bands; `num_perm` must be divisible by it. More bands find less similar pairs
+        keep_separate: File keys that are never merged, in either direction
+    """
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD, shingle_size=DEFAULT_SHINGLE_SIZE, num_perm=DEFAULT_NUM_PERM, bands=DEFAULT_BANDS, keep_separate=()):
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        self.threshold = threshold
+        self.shingle_size = shingle_size
+        self.bands = bands
+        self.keep_separate = set(keep_separate)
+        self.hasher = MinHasher(num_perm)
+
+    def find(self, files):
+        """
+        Match each file to an earlier one it copies.
+
+        Args:
+            files: (index, file_key, content) tuples in batch order
+
+        Returns a dict mapping the index of every duplicate to
+        `{'original': index, 'similarity': float, 'exact': bool}`. An
+        original is always a file that isn't a near copy itself, so a
+        chain of small edits doesn't drift away from the first version.
+        """
+        duplicates = {}
+        by_hash = {}
+        buckets = {}
+        signatures = {}
+        rows = self.hasher.num_perm // self.bands
+
+        for index, file_key, content in files:
+            if file_key in self.keep_separate:
+                continue
+
+            digest = hashlib.sha256(content.strip().encode("utf-8")).hexdigest()
+            if digest in by_hash:
+                duplicates[index] = {'original': by_hash[digest], 'similarity': 1.0, 'exact': True}
+                continue
+            by_hash[digest] = index
+
+            shingle_set = shingles(content, self.shingle_size)
+            if len(shingle_set) < MIN_SHINGLES:
+                continue
+            signature = self.hasher.signature(shingle_set)
+            band_keys = [(band, signature[band * rows:(band + 1) * rows]) for band in range(self.bands)]
+
+            candidates = {original for key in band_keys for original in buckets.get(key, ())}
+            best = max(
+                ((estimate_similarity(signature, signatures[original]), original) for original in candidates),
+                default=(0.0, None),
+                key=lambda pair: (pair[0], -pair[1])
+            )
+            if best[0] >= self.threshold:
+                duplicates[index] = {'original': best[1], 'similarity': round(best[0], 3), 'exact': False}
+                continue
+
+            # Only files that aren't copies themselves are matched against later files
+            signatures[index] = signature
+            for key in band_keys:
+                buckets.setdefault(key, []).append(index)
+
+        return duplicates
+
+def content_diff(original, content, original_name, name):
+    """Unified diff of two file contents, as sent to the model for near copies."""
+    return "".join(difflib.unified_diff(
+        original.splitlines(keepends=True),
+        content.splitlines(keepends=True),
+        fromfile=original_name,
+        tofile=name,
+        n=2
+    ))
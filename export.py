@@ -0,0 +1,210 @@
+"""
+Offline export of the final notes to HTML and PDF.
+
+Sections (from assembly.build_sections) are rendered to HTML one after
+another in this process, and each section's HTML is kept on disk under its
+content hash, so exporting again after a few edits only renders the
+sections that changed. The HTML is built once and used for both the .html
+file and the PDF, which pdfkit prints locally with wkhtmltopdf; nothing is
+sent to a third-party converter.
+"""
+
+import hashlib
+import html
+import os
+import time
+
+from assembly import MARKDOWN_EXTRAS, render_markdown
+
+DEFAULT_EXPORT_CACHE_DIR = os.path.join(".devnotes_cache", "html")
+DEFAULT_MAX_AGE = 30 * 24 * 60 * 60
+
+# Bump when the renderer or its options change, so cached HTML is not reused
+RENDER_VERSION = 1
+
+PDF_OPTIONS = {"encoding": "UTF-8", "quiet": "", "page-size": "A4", "margin-top": "18mm", "margin-bottom": "18mm"}
+
+STYLESHEET = """
+body { font-family: -apple-system, "Segoe UI", Helvetica, Arial, sans-serif; line-height: 1.6; color: #24292f; max-width: 860px; margin: 0 auto; padding: 24px; }
+h1, h2, h3 { line-height: 1.25; }
+h1 { border-bottom: 2px solid #d0d7de; padding-bottom: .3em; }
+h2 { border-bottom: 1px solid #d0d7de; padding-bottom: .3em; margin-top: 2em; }
+code { font-family: SFMono-Regular, Consolas, "Liberation Mono", monospace; font-size: 90%; background: #f6f8fa; padding: .1em .3em; border-radius: 4px; }
+pre { background: #f6f8fa; padding: 12px; border-radius: 6px; overflow-x: auto; page-break-inside: avoid; }
+pre code { background: none; padding: 0; }
+table { border-collapse: collapse; }
+th, td { border: 1px solid #d0d7de; padding: 4px 10px; }
+section + section { page-break-before: always; }
+"""
+
+class ExportError(Exception):
+    """The notes could not be exported."""
+
+def render_key(markdown):
+    """Cache key of a section's HTML: its Markdown plus the renderer settings."""
+    settings = f"{RENDER_VERSION}|{','.join(MARKDOWN_EXTRAS)}\n"
+    return hashlib.sha256((settings + markdown).encode("utf-8")).hexdigest()
+
+def stylesheet():
+    """CSS for exported documents, with syntax highlighting colors if Pygments is installed."""
+    try:
+        from pygments.formatters import HtmlFormatter
+    except ImportError:
+        return STYLESHEET
+    return STYLESHEET + HtmlFormatter().get_style_defs(".codehilite")
+
+class HtmlCache:
+    """
+    Rendered section HTML on disk, one file per section named by its render_key.
+
+    Args:
+        directory: Folder the HTML files are kept in
+    """
+
+    def __init__(self, directory=DEFAULT_EXPORT_CACHE_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.html")
+
+    def get(self, key):
+        """Return the cached HTML, or None on a miss."""
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                html_text = f.read()
+        except FileNotFoundError:
+            return None
+        # Keep sections that are still exported from being pruned
+        os.utime(path)
+        return html_text
+
+    def put(self, key, html_text):
+        # Write to a temporary file first so a crash never leaves half a section
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(html_text)
+        os.replace(temp_path, path)
+
+    def prune(self, max_age=DEFAULT_MAX_AGE):
+        """Delete sections that haven't been exported for `max_age` seconds."""
+        cutoff = time.time() - max_age
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                path = os.path.join(root, name)
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+
+def render_sections(sections, cache=None):
+    """
+    Return the HTML of every section and how many had to be rendered.
+
+    Sections found in `cache` are reused; the rest are rendered and stored.
+    Rendering stays in this process: spawning worker processes cost more
+    than it saved even on large documents, and after the first export only
+    edited sections are rendered at all.
+    """
+    bodies = []
+    rendered = 0
+    for section in sections:
+        key = render_key(section["markdown"])
+        body = cache.get(key) if cache else None
+        if body is None:
+            body = render_markdown(section["markdown"])
+            rendered += 1
+            if cache:
+                cache.put(key, body)
+        bodies.append(body)
+    return bodies, rendered
+
+def html_document(title, bodies):
+    """Wrap rendered sections in a standalone HTML page (styles inline, no external resources)."""
+    parts = [
+        "<!DOCTYPE html>\n<html>\n<head>\n<meta charset=\"utf-8\">\n",
+        f"<title>{html.escape(title)}</title>\n<style>{stylesheet()}</style>\n</head>\n<body>\n"
+    ]
+    parts.extend(f"<section>\n{body}\n</section>\n" for body in bodies)
+    parts.append("</body>\n</html>\n")
+    return "".join(parts)
+
+def write_pdf(document, path):
+    """Print an HTML document to a PDF file with pdfkit and the local wkhtmltopdf."""
+    try:
+        import pdfkit
+    except ImportError:
+        raise ExportError("PDF export needs pdfkit (pip install pdfkit)") from None
+    try:
+        configuration = pdfkit.configuration()
+    except OSError:
+        raise ExportError("PDF export needs wkhtmltopdf installed (https://wkhtmltopdf.org/downloads.html)") from None
+    try:
+        pdfkit.from_string(document, path, options=PDF_OPTIONS, configuration=configuration)
+    except OSError as e:
+        raise ExportError(f"wkhtmltopdf failed: {e}") from None
+
+class Exporter:
+    """
+    Export sections to HTML and PDF, reusing the HTML of unchanged sections.
+
+    Args:
+        cache_dir: Folder of the per-section HTML cache (None keeps nothing between exports)
+    """
+
+    def __init__(self, cache_dir=DEFAULT_EXPORT_CACHE_DIR):
+        self.cache = HtmlCache(cache_dir) if cache_dir else None
+        if self.cache:
+            self.cache.prune()
+
+    def export(self, sections, title, html_path=None, pdf_path=None):
+        """
+        Render `sections` once and write them to `html_path` and/or `pdf_path`.
+
+        Returns a report with section counts and the time spent rendering,
+        writing the HTML and printing the PDF. A PDF that can't be printed
+        doesn't stop the HTML from being written; its reason is in `pdf_error`.
+        """
+        start = time.perf_counter()
+        bodies, rendered = render_sections(sections, self.cache)
+        render_done = time.perf_counter()
+        document = html_document(title, bodies)
+
+        report = {
+            "sections": len(sections),
+            "rendered": rendered,
+            "cached": len(sections) - rendered,
+            "render_time": render_done - start,
+            "html_time": 0.0,
+            "pdf_time": 0.0,
+            "html_path": html_path,
+            "pdf_path": None,
+            "pdf_error": None
+        }
+        if html_path:
+            with open(html_path, "w", encoding="utf-8") as f:
+                f.write(document)
+        report["html_time"] = time.perf_counter() - render_done
+
+        if pdf_path:
+            pdf_start = time.perf_counter()
+            try:
+                write_pdf(document, pdf_path)
+                report["pdf_path"] = pdf_path
+            except ExportError as e:
+                report["pdf_error"] = str(e)
+            report["pdf_time"] = time.perf_counter() - pdf_start
+
+        report["total_time"] = time.perf_counter() - start
+        return report
+
+def format_export_report(report):
+    """One-line summary of an export report; render time covers the sections rendered one by one, not cache hits."""
+    line = (
+        f"{report['sections']} sections ({report['rendered']} rendered, {report['cached']} cached) "
+        f"in {report['total_time']:.2f}s: render {report['render_time']:.2f}s, HTML {report['html_time']:.2f}s"
+    )
+    if report["pdf_path"] or report["pdf_error"]:
+        line += f", PDF {report['pdf_time']:.2f}s"
+    return line
@@ -0,0 +1,266 @@
+"""
+Offline chat models for benchmarking and local testing of the DevNotes-AI pipeline.
+"""
+
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import Field
+
+def fake_notes(output_chars):
+    """Build deterministic Markdown notes of roughly `output_chars` characters."""
+    block = (
+        "### Example Concept\n\n"
+        "🔹 **Idea**: The code defines a value and explains why it matters.\n\n"
+        "```python\nvalue = 42  # the answer\n```\n\n"
+    )
+    repeats = output_chars // len(block) + 1
+    return (block * repeats)[:output_chars]
+
+def numbered_notes(output_chars):
+    """Like fake_notes, but every block is numbered, so any stretch of the text occurs only once."""
+    blocks = []
+    length = 0
+    i = 0
+    while length < output_chars:
+        i += 1
+        block = (
+            f"### Example Concept {i}\n\n"
+            f"🔹 **Idea {i}**: The code defines value {i} and explains why it matters.\n\n"
+            f"```python\nvalue_{i} = {i}  # the answer\n```\n\n"
+        )
+        blocks.append(block)
+        length += len(block)
+    return "".join(blocks)[:output_chars]
+
+# Characters at the end of a continuation prompt used to find where the notes were cut
+CONTINUATION_PROBE_CHARS = 120
+
+class StubChatServer:
+    """
+    Local OpenAI-compatible HTTP server for benchmarks that need a real network client.
+
+    Serves POST /v1/chat/completions with canned notes over keep-alive
+    HTTP/1.1 and counts how many TCP connections clients opened.
+
+    To test rate limit handling it can answer with 429s: a `throttle_rate`
+    fraction of requests at random, and every request beyond `max_in_flight`
+    concurrent ones. Throttled responses carry `Retry-After: retry_after`
+    when it is set.
+    """
+
+    def __init__(self, latency=0.0, output_chars=200, port=0, throttle_rate=0.0, max_in_flight=None, retry_after=None, seed=0):
+        self.latency = latency
+        self.output_chars = output_chars
+        self.throttle_rate = throttle_rate
+        self.max_in_flight = max_in_flight
+        self.retry_after = retry_after
+        self.connections = 0
+        self.requests = 0
+        self.throttled = 0
+        self.in_flight = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self._server.server_address[1]}/v1"
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _count(self, attribute):
+        with self._lock:
+            setattr(self, attribute, getattr(self, attribute) + 1)
+
+    def _should_throttle(self):
+        with self._lock:
+            throttle = (
+                self._random.random() < self.throttle_rate
+                or (self.max_in_flight is not None and self.in_flight >= self.max_in_flight)
+            )
+            if throttle:
+                self.throttled += 1
+            else:
+                self.in_flight += 1
+            return throttle
+
+    def throttle(self, handler):
+        """Write a 429 rate limit response."""
+        body = json.dumps({"error": {"message": "Rate limit reached", "type": "rate_limit_error", "code": "rate_limit_exceeded"}}).encode("utf-8")
+        handler.send_response(429)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(body)))
+        if self.retry_after is not None:
+            handler.send_header("Retry-After", str(self.retry_after))
+        handler.end_headers()
+        handler.wfile.write(body)
+
+    def respond(self, handler, request):
+        """Write the response for one chat completion request."""
+        if self._should_throttle():
+            self.throttle(handler)
+            return
+        try:
+            time.sleep(self.latency)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+        body = json.dumps({
+            "id": f"stub-{self.requests}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "stub"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": fake_notes(self.output_chars)},
+                "finish_reason": "stop"
+            }],
+            "usage": {"prompt_tokens": 10, "completion_tokens": self.output_chars // 4, "total_tokens": 10 + self.output_chars // 4}
+        }).encode("utf-8")
+        handler.send_response(200)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(body)))
+        handler.end_headers()
+        handler.wfile.write(body)
+
+    def _make_handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                stub._count("connections")
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length) or b"{}")
+                stub._count("requests")
+                stub.respond(self, request)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+def message_text(message):
+    """Text of a message whose content is a string or a list of content blocks."""
+    if isinstance(message.content, str):
+        return message.content
+    return "".join(block.get("text", "") if isinstance(block, dict) else str(block) for block in message.content)
+
+class FakeNotesModel(BaseChatModel):
+    """
+    Chat model that waits `latency` seconds and returns canned notes, no network needed.
+
+    It also acts like a provider with automatic prefix caching: the hash of
+    every leading system message is kept in `prefix_hashes`, and once a
+    prefix has been seen its tokens are reported as `cache_read` in the usage.
+
+    With `max_output_chars` it behaves like a model with an output limit:
+    numbered notes (see numbered_notes) are cut after that many characters
+    with finish_reason "length". A prompt ending with the last characters
+    written so far (a continuation) is answered with the text after them,
+    starting `repeat_chars` characters early, as models often repeat a bit.
+
+    For hedging tests, `latency_distribution` (a function returning seconds)
+    draws each call's latency instead of the fixed `latency`, and with
+    `error_rate` that share of calls fails with a ConnectionError.
+    """
+
+    latency: float = 0.5
+    output_chars: int = 2000
+    chunk_chars: int = 200
+    max_output_chars: int = 0
+    repeat_chars: int = 0
+    latency_distribution: object = None
+    error_rate: float = 0.0
+    prefix_hashes: list = Field(default_factory=list)
+
+    @property
+    def _llm_type(self):
+        return "fake-notes"
+
+    def _usage(self, messages, output_text):
+        prefix = message_text(messages[0]) if messages and messages[0].type == "system" else ""
+        prefix_hash = hashlib.sha256(prefix.encode("utf-8")).hexdigest()
+        cached = prefix_hash in self.prefix_hashes
+        self.prefix_hashes.append(prefix_hash)
+
+        input_tokens = sum(len(message_text(message)) for message in messages) // 4
+        prefix_tokens = len(prefix) // 4
+        return {
+            "input_tokens": input_tokens,
+            "output_tokens": len(output_text) // 4,
+            "total_tokens": input_tokens + len(output_text) // 4,
+            "input_token_details": {"cache_read": prefix_tokens if cached else 0, "cache_creation": 0 if cached else prefix_tokens}
+        }
+
+    def _reply(self, messages):
+        """The response text and its finish reason."""
+        if not self.max_output_chars:
+            return fake_notes(self.output_chars), "stop"
+        notes = numbered_notes(self.output_chars)
+        start = 0
+        probe = message_text(messages[-1])[-CONTINUATION_PROBE_CHARS:]
+        position = notes.find(probe)
+        if position >= 0:
+            start = max(0, position + len(probe) - self.repeat_chars)
+        end = start + self.max_output_chars
+        return notes[start:end], "length" if end < len(notes) else "stop"
+
+    def _call_latency(self):
+        """Latency of one call, failing it first if the injected error rate says so."""
+        latency = self.latency_distribution() if self.latency_distribution else self.latency
+        if self.error_rate and random.random() < self.error_rate:
+            time.sleep(latency / 10)
+            raise ConnectionError("Fake provider unavailable")
+        return latency
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self._call_latency())
+        text, reason = self._reply(messages)
+        message = AIMessage(content=text, usage_metadata=self._usage(messages, text), response_metadata={"finish_reason": reason})
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        # Spread the latency evenly over the chunks, like a model emitting tokens
+        latency = self._call_latency()
+        text, reason = self._reply(messages)
+        pieces = [text[i:i + self.chunk_chars] for i in range(0, len(text), self.chunk_chars)]
+        for piece in pieces:
+            time.sleep(latency / len(pieces))
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=piece))
+            if run_manager:
+                run_manager.on_llm_new_token(piece, chunk=chunk)
+            yield chunk
+        # Usage and the finish reason arrive on a final empty chunk, as with OpenAI's stream_usage
+        yield ChatGenerationChunk(message=AIMessageChunk(
+            content="",
+            usage_metadata=self._usage(messages, text),
+            response_metadata={"finish_reason": reason}
+        ))
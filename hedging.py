@@ -0,0 +1,350 @@
+"""
+Latency-hedged execution across several providers.
+
+HedgedChatModel is a chat model made of an ordered list of backends (e.g.
+Gemini, then Claude, then OpenAI). A call goes to the first backend whose
+circuit is closed. If it hasn't answered within a high percentile of that
+backend's recent latencies, the same request is also sent to the next
+backend; whichever answers first is used and the other is cancelled. A
+backend that fails hands the call over to the next one at once, and a
+backend that keeps failing is taken out of rotation by a circuit breaker
+until a cooldown has passed.
+
+It is a regular LangChain chat model, so chains, the response cache,
+coalescing and streaming work with it unchanged.
+"""
+
+import math
+import queue
+import threading
+import time
+from collections import deque
+
+from langchain_core.language_models.chat_models import BaseChatModel, generate_from_stream
+from langchain_core.outputs import ChatGenerationChunk
+from pydantic import PrivateAttr
+
+DEFAULT_HEDGE_PERCENTILE = 95.0
+DEFAULT_INITIAL_HEDGE_DELAY = 10.0
+DEFAULT_MIN_SAMPLES = 20
+DEFAULT_LATENCY_WINDOW = 200
+DEFAULT_FAILURE_THRESHOLD = 3
+DEFAULT_COOLDOWN = 30.0
+
+# Circuit breaker states
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+class LatencyTracker:
+    """
+    Recent latencies of one backend.
+
+    Args:
+        window: Number of most recent samples kept
+    """
+
+    def __init__(self, window=DEFAULT_LATENCY_WINDOW):
+        self.samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self.samples.append(seconds)
+
+    def percentile(self, percent, min_samples=DEFAULT_MIN_SAMPLES):
+        """The `percent` percentile (nearest rank) of the samples, or None with fewer than `min_samples`."""
+        with self._lock:
+            if len(self.samples) < max(1, min_samples):
+                return None
+            ordered = sorted(self.samples)
+        rank = max(1, math.ceil(percent / 100 * len(ordered)))
+        return ordered[rank - 1]
+
+class CircuitBreaker:
+    """
+    Takes a backend out of rotation after repeated failures.
+
+    After `failure_threshold` failures in a row the circuit opens and the
+    backend is skipped. Once `cooldown` seconds have passed one trial call
+    is let through (half-open): success closes the circuit, failure opens it again.
+    """
+
+    def __init__(self, failure_threshold=DEFAULT_FAILURE_THRESHOLD, cooldown=DEFAULT_COOLDOWN, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.clock = clock
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Whether a call may go to the backend now (claims the trial call when half-open)."""
+        with self._lock:
+            if self.state == OPEN and self.clock() - self.opened_at >= self.cooldown:
+                self.state = HALF_OPEN
+                self.trial_running = False
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and not self.trial_running:
+                self.trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+            self.trial_running = False
+
+    def release(self):
+        """A cancelled trial call doesn't decide the state; let another one through."""
+        with self._lock:
+            self.trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = OPEN
+                self.opened_at = self.clock()
+            self.trial_running = False
+
+class Backend:
+    """
+    One provider model taking part in hedged calls.
+
+    Args:
+        name: Label used in stats, e.g. "Claude:claude-sonnet-4-5-20250929"
+        model: LangChain chat model
+        scheduler: Optional RequestScheduler applying this provider's rate limits
+        failure_threshold: Failures in a row before the circuit opens
+        cooldown: Seconds an open circuit waits before a trial call
+    """
+
+    def __init__(self, name, model, scheduler=None, failure_threshold=DEFAULT_FAILURE_THRESHOLD, cooldown=DEFAULT_COOLDOWN):
+        self.name = name
+        self.model = model
+        self.scheduler = scheduler
+        self.breaker = CircuitBreaker(failure_threshold, cooldown)
+        self.first_token_latency = LatencyTracker()
+        self.total_latency = LatencyTracker()
+        self.calls = 0
+        self.wins = 0
+        self.failures = 0
+        self.cancelled = 0
+        self._lock = threading.Lock()
+
+    def count(self, field):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def open_stream(self, messages, stop, kwargs):
+        """Stream the model's message chunks, within the scheduler's limits if there is one."""
+        if self.scheduler is None:
+            return self.model.stream(messages, stop=stop, **kwargs)
+        return self.scheduler.stream(lambda: self.model.stream(messages, stop=stop, **kwargs))
+
+class _Attempt:
+    """One backend working on one call, on its own thread."""
+
+    def __init__(self, backend, hedge):
+        self.backend = backend
+        self.hedge = hedge
+        self.chunks = []
+        self.started = time.perf_counter()
+        self.cancelled = threading.Event()
+
+    def run(self, messages, stop, kwargs, events):
+        first = True
+        try:
+            stream = self.backend.open_stream(messages, stop, kwargs)
+            try:
+                for chunk in stream:
+                    if self.cancelled.is_set():
+                        break
+                    if first and chunk.content:
+                        self.backend.first_token_latency.record(time.perf_counter() - self.started)
+                        first = False
+                    events.put((self, "chunk", chunk))
+            finally:
+                # Closing the stream drops the provider's connection when cancelled
+                close = getattr(stream, "close", None)
+                if close:
+                    close()
+        except Exception as error:
+            events.put((self, "error", error))
+            return
+        if not self.cancelled.is_set():
+            self.backend.total_latency.record(time.perf_counter() - self.started)
+            events.put((self, "done", None))
+
+class HedgedChatModel(BaseChatModel):
+    """
+    Chat model that sends each call to an ordered list of backends with latency hedging and fallback.
+
+    A call starts on the first backend whose circuit allows it. After the
+    `hedge_percentile` latency of that backend (time to first token when
+    streaming, to the whole answer otherwise; `initial_hedge_delay` until
+    `min_samples` calls have been seen) the call is also sent to the next
+    backend, up to `max_hedges` extra backends. A streamed call sticks to
+    the first backend that produces text; otherwise the first complete
+    answer wins. Backends that fail are replaced by the next one right away.
+    """
+
+    backends: list
+    hedge_percentile: float = DEFAULT_HEDGE_PERCENTILE
+    initial_hedge_delay: float = DEFAULT_INITIAL_HEDGE_DELAY
+    min_samples: int = DEFAULT_MIN_SAMPLES
+    max_hedges: int = 1
+    model_name: str = ""
+
+    _stats: dict = PrivateAttr(default_factory=lambda: {"calls": 0, "hedged": 0, "hedge_wins": 0, "fallbacks": 0})
+    _stats_lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    def __init__(self, **data):
+        super().__init__(**data)
+        # Identifies the backend list in cache keys
+        if not self.model_name:
+            self.model_name = "|".join(backend.name for backend in self.backends)
+
+    @property
+    def _llm_type(self):
+        return "hedged"
+
+    def _count(self, key):
+        with self._stats_lock:
+            self._stats[key] += 1
+
+    def hedge_delay(self, backend, streaming):
+        """Seconds to wait on `backend` before hedging."""
+        tracker = backend.first_token_latency if streaming else backend.total_latency
+        delay = tracker.percentile(self.hedge_percentile, self.min_samples)
+        return self.initial_hedge_delay if delay is None else delay
+
+    def _race(self, messages, stop, kwargs, streaming):
+        """Yield the message chunks of the winning backend."""
+        self._count("calls")
+        events = queue.Queue()
+        untried = list(self.backends)
+        running = []
+        hedges = 0
+        last_error = None
+
+        def launch(hedge):
+            # Backends with an open circuit are skipped, unless none is left at all
+            backend = next((backend for backend in untried if backend.breaker.allow()), None)
+            if backend is None and not running and untried and not hedge:
+                backend = untried[0]
+            if backend is None:
+                return None
+            untried.remove(backend)
+            backend.count("calls")
+            attempt = _Attempt(backend, bool(hedge))
+            running.append(attempt)
+            threading.Thread(target=attempt.run, args=(messages, stop, kwargs, events), daemon=True).start()
+            return attempt
+
+        def cancel_others(winner):
+            for attempt in running:
+                if attempt is not winner:
+                    attempt.cancelled.set()
+                    attempt.backend.breaker.release()
+                    attempt.backend.count("cancelled")
+
+        try:
+            launch(None)
+            deadline = time.perf_counter() + self.hedge_delay(running[0].backend, streaming) if running else None
+            winner = None
+            while running:
+                timeout = None
+                if winner is None and hedges < self.max_hedges and untried and deadline is not None:
+                    timeout = max(0.0, deadline - time.perf_counter())
+                try:
+                    attempt, kind, payload = events.get(timeout=timeout)
+                except queue.Empty:
+                    # The call is slower than usual: send it to the next backend as well
+                    deadline = None
+                    if launch(True):
+                        hedges += 1
+                        self._count("hedged")
+                        deadline = time.perf_counter() + self.hedge_delay(running[-1].backend, streaming)
+                    continue
+                if attempt not in running or attempt.cancelled.is_set():
+                    continue
+
+                if kind == "chunk":
+                    attempt.chunks.append(payload)
+                    # Streamed text can't be taken back, so the first backend with text wins
+                    if winner is None and streaming and payload.content:
+                        winner = attempt
+                        cancel_others(winner)
+                        yield from attempt.chunks
+                    elif attempt is winner:
+                        yield payload
+                elif kind == "done":
+                    if winner is None:
+                        winner = attempt
+                        cancel_others(winner)
+                        yield from attempt.chunks
+                    running.remove(attempt)
+                    attempt.backend.breaker.record_success()
+                    attempt.backend.count("wins")
+                    if attempt.hedge:
+                        self._count("hedge_wins")
+                    return
+                else:
+                    attempt.backend.breaker.record_failure()
+                    attempt.backend.count("failures")
+                    running.remove(attempt)
+                    last_error = payload
+                    # Text from it was already passed on, so there is nothing to fall back to
+                    if attempt is winner:
+                        raise payload
+                    if not running:
+                        if launch(None) is None:
+                            break
+                        self._count("fallbacks")
+                        deadline = time.perf_counter() + self.hedge_delay(running[-1].backend, streaming)
+            raise last_error or RuntimeError("No backend is available: every circuit is open")
+        finally:
+            # Also reached when the caller stops reading early: stop every attempt still streaming
+            for attempt in running:
+                if not attempt.cancelled.is_set():
+                    attempt.cancelled.set()
+                    attempt.backend.breaker.release()
+                    attempt.backend.count("cancelled")
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        for message_chunk in self._race(messages, stop, kwargs, streaming=True):
+            chunk = ChatGenerationChunk(message=message_chunk)
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        # Backends are streamed either way, so a losing call can be cut off
+        return generate_from_stream(
+            ChatGenerationChunk(message=message_chunk)
+            for message_chunk in self._race(messages, stop, kwargs, streaming=False)
+        )
+
+    def stats(self):
+        """Hedging counters and, per backend, calls, wins, failures, cancellations, circuit state and p95 latency."""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["backends"] = {
+            backend.name: {
+                "calls": backend.calls,
+                "wins": backend.wins,
+                "failures": backend.failures,
+                "cancelled": backend.cancelled,
+                "circuit": backend.breaker.state,
+                "p95_first_token": backend.first_token_latency.percentile(95, 1),
+                "p95_total": backend.total_latency.percentile(95, 1)
+            }
+            for backend in self.backends
+        }
+        return stats
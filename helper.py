@@ -1,58 +1,454 @@
-import json
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_openai import ChatOpenAI
-from langchain_anthropic import ChatAnthropic
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import nullcontext
+import hashlib
 import os
+from langchain_core.callbacks import BaseCallbackHandler
 from langchain_core.output_parsers import StrOutputParser
-import markdown2
-import re
-from prompts import notes_template
-
-def get_ai_model(provider, model_name, api_key):
-    """Get AI model based on provider, model name, and API key."""
-    if provider == "Gemini":
-        return ChatGoogleGenerativeAI(model=model_name, google_api_key=api_key)
-    elif provider == "OpenAI":
-        return ChatOpenAI(model=model_name, openai_api_key=api_key)
-    elif provider == "Claude":
-        return ChatAnthropic(model=model_name, anthropic_api_key=api_key)
-    else:
-        raise ValueError(f"Unsupported provider: {provider}")
+import threading
+import time
+from prompts import build_continuation_template, build_notes_template, continuation_template, notes_template
+from notebook_reader import iter_notebook_cells
+from chunking import DEFAULT_MAX_CHUNK_TOKENS, chunk_content, estimate_tokens, stitch_chunk_notes
+from metrics import new_span
+from cache import cache_key, model_identity
+from dedupe import content_diff
+from ingest import open_text
+from retrieval import DEFAULT_CONTEXT_TOKENS, NotesIndex
+from providers import get_provider, supports_cache_control
+from assembly import assemble_notes, strip_duplicate_titles
+from continuation import DEFAULT_MAX_CONTINUATIONS, continuation_inputs, finish_reason, is_truncated, stitch_stream, trim_overlap
+
+# Warm clients and chains are kept for reuse until they have been idle this long
+MODEL_IDLE_SECONDS = 30 * 60
+
+_model_registry = {}
+_chain_registry = {}
+_registry_lock = threading.Lock()
+
+def create_ai_model(provider, model_name, api_key, **client_options):
+    """
+    Build a new AI model client for a provider (use get_ai_model to reuse warm clients).
+    
+    Only the selected provider's SDK is imported, the first time it is used.
+    """
+    return get_provider(provider).create(model_name, api_key, **client_options)
+
+def get_ai_model(provider, model_name, api_key, **client_options):
+    """
+    Get AI model based on provider, model name, and API key.
+    
+    Clients are cached by provider, model and a hash of the API key, so their
+    HTTP connection pools and TLS sessions stay warm across files and
+    Streamlit reruns. Clients unused for MODEL_IDLE_SECONDS are dropped.
+    """
+    key_hash = hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+    registry_key = (provider, model_name, key_hash, repr(sorted(client_options.items())))
+    now = time.monotonic()
+    
+    with _registry_lock:
+        _evict_idle_models(now)
+        entry = _model_registry.get(registry_key)
+        if entry is not None:
+            entry['last_used'] = now
+            return entry['model']
+    
+    model = create_ai_model(provider, model_name, api_key, **client_options)
+    with _registry_lock:
+        entry = _model_registry.setdefault(registry_key, {'model': model, 'last_used': now})
+    return entry['model']
+
+def get_notes_chain(ai_model, prompt_caching=False, continuation=False):
+    """
+    Return the prebuilt `notes_template | ai_model | parser` chain for a model.
+    
+    With `prompt_caching`, Claude models get the system prefix marked with
+    cache_control. OpenAI and Gemini cache the stable prefix automatically.
+    With `continuation`, the chain continues truncated notes instead.
+    """
+    cache_control = prompt_caching and supports_cache_control(ai_model)
+    registry_key = (id(ai_model), cache_control, continuation)
+    now = time.monotonic()
+    with _registry_lock:
+        _evict_idle_models(now)
+        entry = _chain_registry.get(registry_key)
+        # The entry keeps the model alive, so its id can't be reused while cached
+        if entry is None or entry['model'] is not ai_model:
+            if continuation:
+                template = build_continuation_template(cache_control=True) if cache_control else continuation_template
+            else:
+                template = build_notes_template(cache_control=True) if cache_control else notes_template
+            entry = {'model': ai_model, 'chain': template | ai_model | parser}
+            _chain_registry[registry_key] = entry
+        entry['last_used'] = now
+        return entry['chain']
+
+class UsageRecorder(BaseCallbackHandler):
+    """Callback that keeps the token usage and finish reason the provider reported for a call, including cached prompt tokens."""
+    
+    def __init__(self):
+        self.usage = None
+        self.finish_reason = None
+    
+    def on_llm_end(self, response, **kwargs):
+        for generations in response.generations:
+            for generation in generations:
+                message = getattr(generation, "message", None)
+                usage = getattr(message, "usage_metadata", None)
+                if usage:
+                    self.usage = usage
+                reason = finish_reason(getattr(message, "response_metadata", None)) or finish_reason(generation.generation_info)
+                if reason:
+                    self.finish_reason = reason
+    
+    @property
+    def cached_tokens(self):
+        details = (self.usage or {}).get("input_token_details") or {}
+        return details.get("cache_read") or 0
+
+def _record_usage(timings, recorder, estimated_input_tokens, result):
+    """Add a call's tokens to `timings`, preferring the provider's counts over estimates."""
+    usage = recorder.usage or {}
+    call = {
+        'input_tokens': usage.get('input_tokens') or estimated_input_tokens,
+        'output_tokens': usage.get('output_tokens') or estimate_tokens(result),
+        'cached_tokens': recorder.cached_tokens,
+        'estimated': not usage
+    }
+    for key in ('input_tokens', 'output_tokens', 'cached_tokens'):
+        _add_timing(timings, key, call[key])
+    if timings is not None:
+        timings.setdefault('calls', []).append(call)
+
+def _evict_idle_models(now):
+    """Drop clients and chains that haven't been used for MODEL_IDLE_SECONDS (caller holds the lock)."""
+    for registry in (_model_registry, _chain_registry):
+        for key in [key for key, entry in registry.items() if now - entry['last_used'] > MODEL_IDLE_SECONDS]:
+            del registry[key]
 
 parser = StrOutputParser()
 
-def generate_detailed_notes(main_title, previous_topics, topic_name, suggestion, file_content, ai_model):
-    """Generate detailed notes for a given file content."""
-    current_chain = notes_template | ai_model | parser
+# File types the app and CLI accept
+SUPPORTED_EXTENSIONS = ['py', 'js', 'ipynb', 'java', 'cpp', 'c', 'txt']
+
+def _render_prompt(inputs, timings):
+    """Render the notes prompt, adding the time it took to `timings['render_time']`."""
+    start = time.perf_counter()
+    prompt_text = notes_template.format(**inputs)
+    _add_timing(timings, 'render_time', time.perf_counter() - start)
+    return prompt_text
+
+def _add_timing(timings, key, value):
+    """Add `value` to a counter in a timings dict (a no-op when no dict is given)."""
+    if timings is not None:
+        timings[key] = timings.get(key, 0) + value
+
+def _continue_notes(text, reason, inputs, ai_model, timings=None, scheduler=None, prompt_caching=False, stream=False):
+    """
+    Yield the rest of notes cut off by the output limit, one continuation request at a time.
     
-    result = current_chain.invoke({
+    Each request carries only the tail of the notes, not the code file, and
+    is made while the notes still look truncated, up to
+    DEFAULT_MAX_CONTINUATIONS times. Every request counts in `continuations`.
+    """
+    for _ in range(DEFAULT_MAX_CONTINUATIONS):
+        if not is_truncated(text, reason):
+            return
+        continuation_chain = get_notes_chain(ai_model, prompt_caching=prompt_caching, continuation=True)
+        request = continuation_inputs(inputs["main_title"], inputs["topic_name"], text)
+        usage = UsageRecorder()
+        config = {"callbacks": [usage]}
+        input_tokens = estimate_tokens(continuation_template.format(**request))
+        start = time.perf_counter()
+        if stream:
+            if scheduler is not None:
+                pieces = scheduler.stream(
+                    lambda: continuation_chain.stream(request, config=config),
+                    input_tokens=input_tokens,
+                    count_output=estimate_tokens,
+                    stats=timings
+                )
+            else:
+                pieces = continuation_chain.stream(request, config=config)
+            pieces = stitch_stream(text, pieces)
+        elif scheduler is not None:
+            pieces = [trim_overlap(text, scheduler.run(
+                lambda: continuation_chain.invoke(request, config=config),
+                input_tokens=input_tokens,
+                count_output=estimate_tokens,
+                stats=timings
+            ))]
+        else:
+            pieces = [trim_overlap(text, continuation_chain.invoke(request, config=config))]
+        
+        added = []
+        for piece in pieces:
+            if piece:
+                added.append(piece)
+                yield piece
+        continued = "".join(added)
+        _add_timing(timings, 'llm_time', time.perf_counter() - start)
+        _record_usage(timings, usage, input_tokens, continued)
+        _add_timing(timings, 'continuations', 1)
+        # A model with nothing to add would otherwise be asked again
+        if not continued.strip():
+            return
+        text += continued
+        reason = usage.finish_reason
+
+def generate_detailed_notes(main_title, previous_topics, topic_name, suggestion, file_content, ai_model, cache=None, on_chunk=None, timings=None, scheduler=None, prompt_caching=False, coalescer=None):
+    """
+    Generate detailed notes for a given file content, reusing cached responses when possible.
+    
+    If `on_chunk` is given the response is streamed and each piece of text is
+    passed to it as soon as it arrives. With a RequestScheduler the call is
+    rate limited and retried when the provider throttles it. With a
+    Singleflight `coalescer`, a call identical to one already in flight (same
+    prompt and model) waits for that call's text instead of making its own.
+    
+    If a `timings` dict is given, `render_time`, `llm_time`, `input_tokens`,
+    `output_tokens`, `cached_tokens`, `retries`, `cached_calls`,
+    `coalesced_calls` and `continuations` are added to it, and each model
+    call is appended to `calls`. Token counts come from the provider when it
+    reports them and are estimated otherwise.
+    
+    Notes cut off by the output limit (see continuation.is_truncated) are
+    continued from their tail rather than generated again.
+    """
+    if on_chunk is not None:
+        streamed = []
+        for chunk in stream_detailed_notes(main_title, previous_topics, topic_name, suggestion, file_content, ai_model, cache=cache, timings=timings, scheduler=scheduler, prompt_caching=prompt_caching, coalescer=coalescer):
+            on_chunk(chunk)
+            streamed.append(chunk)
+        return "".join(streamed)
+    
+    inputs = {
         "main_title": main_title,
         "previous_topics": previous_topics,
         "topic_name": topic_name,
         "suggestion": suggestion,
         "file": file_content
-    })
-    return result
+    }
+    prompt_text = _render_prompt(inputs, timings)
+    key = cache_key(prompt_text, *model_identity(ai_model))
+    
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            _add_timing(timings, 'cached_calls', 1)
+            return cached
+    
+    def call_model():
+        current_chain = get_notes_chain(ai_model, prompt_caching=prompt_caching)
+        usage = UsageRecorder()
+        config = {"callbacks": [usage]}
+        input_tokens = estimate_tokens(prompt_text)
+        start = time.perf_counter()
+        if scheduler is not None:
+            result = scheduler.run(
+                lambda: current_chain.invoke(inputs, config=config),
+                input_tokens=input_tokens,
+                count_output=estimate_tokens,
+                stats=timings
+            )
+        else:
+            result = current_chain.invoke(inputs, config=config)
+        _add_timing(timings, 'llm_time', time.perf_counter() - start)
+        _record_usage(timings, usage, input_tokens, result)
+        result += "".join(_continue_notes(result, usage.finish_reason, inputs, ai_model, timings=timings, scheduler=scheduler, prompt_caching=prompt_caching))
+        
+        # Stored before the flight ends, so callers arriving later find it in the cache
+        if cache is not None:
+            cache.put(key, result)
+        return result
+    
+    if coalescer is not None:
+        return coalescer.run(key, call_model, stats=timings)
+    return call_model()
 
-def process_files(file_list, main_title="Complete Study Notes", topics=None, suggestions=None, progress_callback=None, ai_model=None):
+def stream_detailed_notes(main_title, previous_topics, topic_name, suggestion, file_content, ai_model, cache=None, timings=None, scheduler=None, prompt_caching=False, coalescer=None):
+    """
+    Stream detailed notes for a given file content, yielding text chunks as the model produces them.
+    
+    If a `timings` dict is given, `time_to_first_token` and `total_time` (seconds) are recorded
+    in it along with the counters described in generate_detailed_notes. A call
+    coalesced with an identical stream in flight replays that stream's chunks.
+    """
+    inputs = {
+        "main_title": main_title,
+        "previous_topics": previous_topics,
+        "topic_name": topic_name,
+        "suggestion": suggestion,
+        "file": file_content
+    }
+    if timings is None:
+        timings = {}
+    start = time.perf_counter()
+    prompt_text = _render_prompt(inputs, timings)
+    key = cache_key(prompt_text, *model_identity(ai_model))
+    
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            timings['time_to_first_token'] = timings['total_time'] = time.perf_counter() - start
+            _add_timing(timings, 'cached_calls', 1)
+            yield cached
+            return
+    
+    def call_model():
+        current_chain = get_notes_chain(ai_model, prompt_caching=prompt_caching)
+        usage = UsageRecorder()
+        config = {"callbacks": [usage]}
+        input_tokens = estimate_tokens(prompt_text)
+        llm_start = time.perf_counter()
+        if scheduler is not None:
+            stream = scheduler.stream(
+                lambda: current_chain.stream(inputs, config=config),
+                input_tokens=input_tokens,
+                count_output=estimate_tokens,
+                stats=timings
+            )
+        else:
+            stream = current_chain.stream(inputs, config=config)
+        chunks = []
+        for chunk in stream:
+            if not chunk:
+                continue
+            chunks.append(chunk)
+            yield chunk
+        
+        result = "".join(chunks)
+        _add_timing(timings, 'llm_time', time.perf_counter() - llm_start)
+        _record_usage(timings, usage, input_tokens, result)
+        
+        # Cut-off notes are continued in the same stream
+        for chunk in _continue_notes(result, usage.finish_reason, inputs, ai_model, timings=timings, scheduler=scheduler, prompt_caching=prompt_caching, stream=True):
+            chunks.append(chunk)
+            yield chunk
+        result = "".join(chunks)
+        if cache is not None:
+            cache.put(key, result)
+    
+    stream = coalescer.stream(key, call_model, stats=timings) if coalescer is not None else call_model()
+    first = True
+    for chunk in stream:
+        if first:
+            timings['time_to_first_token'] = time.perf_counter() - start
+            first = False
+        yield chunk
+    timings['total_time'] = time.perf_counter() - start
+
+def generate_chunked_notes(main_title, previous_topics, topic_name, suggestion, chunks, ai_model, cache=None, on_chunk=None, timings=None, max_workers=4, scheduler=None, prompt_caching=False, coalescer=None, limiter=None, parts=None, on_part=None):
+    """
+    Generate notes for a file split into chunks (map), then stitch them into one section (reduce).
+    
+    Up to `max_workers` chunks are generated in parallel (one by one when 1).
+    When streaming, each part's notes are passed to `on_chunk` in order as
+    soon as all earlier parts are done. `limiter` is an optional semaphore
+    held during every LLM call; sharing one between files keeps the whole
+    batch within its size however many files are chunked. `parts` is an
+    optional list with one entry per chunk: notes to reuse, or None for the
+    chunks to generate, whose notes are filled in. `on_part(k, notes)` is
+    called as soon as each chunk's notes are generated.
+    """
+    limiter = limiter if limiter is not None else nullcontext()
+    if len(chunks) == 1:
+        with limiter:
+            return generate_detailed_notes(main_title, previous_topics, topic_name, suggestion, chunks[0], ai_model, cache=cache, on_chunk=on_chunk, timings=timings, scheduler=scheduler, prompt_caching=prompt_caching, coalescer=coalescer)
+    
+    if timings is None:
+        timings = {}
+    start = time.perf_counter()
+    
+    def generate_part(k):
+        part_suggestion = (
+            f"{suggestion} (This is part {k + 1} of {len(chunks)} of the same file. "
+            "Only explain the code in this part and don't re-introduce the topic.)"
+        )
+        with limiter:
+            notes = generate_detailed_notes(main_title, previous_topics, topic_name, part_suggestion, chunks[k], ai_model, cache=cache, timings=part_timings[k], scheduler=scheduler, prompt_caching=prompt_caching, coalescer=coalescer)
+        if on_part:
+            on_part(k, notes)
+        return notes
+    
+    if parts is None:
+        parts = [None] * len(chunks)
+    pending = [k for k, part in enumerate(parts) if part is None]
+    part_timings = [{} for _ in chunks]
+    next_part = 0
+    
+    def emit_ready():
+        nonlocal next_part
+        # Emit finished parts in file order
+        while next_part < len(parts) and parts[next_part] is not None:
+            if next_part == 0:
+                timings['time_to_first_token'] = time.perf_counter() - start
+            if on_chunk:
+                on_chunk(stitch_chunk_notes([parts[next_part]]) + "\n\n")
+            next_part += 1
+    
+    emit_ready()
+    if max_workers is None or max_workers <= 1 or len(pending) <= 1:
+        for k in pending:
+            parts[k] = generate_part(k)
+            emit_ready()
+    else:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(pending))) as executor:
+            futures = {executor.submit(generate_part, k): k for k in pending}
+            for future in as_completed(futures):
+                parts[futures[future]] = future.result()
+                emit_ready()
+    
+    timings['total_time'] = time.perf_counter() - start
+    for key in ('render_time', 'llm_time', 'input_tokens', 'output_tokens', 'cached_tokens', 'retries', 'cached_calls', 'coalesced_calls', 'continuations'):
+        _add_timing(timings, key, sum(part.get(key, 0) for part in part_timings))
+    timings.setdefault('calls', []).extend(call for part in part_timings for call in part.get('calls', []))
+    return stitch_chunk_notes(parts)
+
+def process_files(file_list, main_title="Complete Study Notes", topics=None, suggestions=None, progress_callback=None, ai_model=None, max_workers=1, cache=None, on_chunk=None, max_chunk_tokens=DEFAULT_MAX_CHUNK_TOKENS, manifest=None, file_keys=None, scheduler=None, metrics=None, on_result=None, prompt_caching=False, preprocess=None, dedupe=None, context_tokens=DEFAULT_CONTEXT_TOKENS, coalescer=None):
     """
     Process a list of files and generate detailed notes for each.
     Returns individual notes for editing.
     
     Args:
-        file_list: List of file paths to process
+        file_list: List of file paths or in-memory uploads (objects with `name` and `open()`) to process
         main_title: Main title for the notes
         topics: Optional list of topic names (if None, will use file names)
         suggestions: Optional list of suggestions for each file
         progress_callback: Optional callback function for progress updates
         ai_model: AI model to use for processing (required)
+        max_workers: Maximum number of LLM calls in flight at once, across files and their chunks (1 = one by one)
+        cache: Optional NotesCache used to reuse responses for unchanged prompts
+        on_chunk: Optional callback `on_chunk(index, text)` that streams each file's notes as they are generated
+        max_chunk_tokens: Token budget per request; larger files are split into chunks (None = never split)
+        manifest: Optional ProjectManifest; files whose content, topic and suggestion are unchanged reuse stored notes
+        file_keys: Optional stable names used to identify files in the manifest (defaults to the file paths)
+        scheduler: Optional RequestScheduler that rate limits and retries every LLM call
+        metrics: Optional sink (see metrics.py) that receives each file's span as it finishes
+        on_result: Optional callback `on_result(index, entry)` called with each file's entry as soon as it finishes
+        prompt_caching: Mark the fixed instruction prefix for provider prompt caching (Claude); others cache it automatically
+        preprocess: Optional Preprocessor that trims data literals, duplicate cells and other token-heavy noise before prompting
+        dedupe: Optional DuplicateDetector; exact copies of an earlier file reuse its notes and near copies are sent as a diff against it
+        context_tokens: Token budget for the context each prompt gets about earlier files: recent topic names and the
+            most relevant sections of the notes of files at least `max_workers` places earlier, waiting for them if
+            needed so the prompt doesn't depend on completion order (None = the full comma-separated list of earlier topics)
+        coalescer: Optional Singleflight shared between batches; identical prompts to the same model that are in flight
+            at the same time (e.g. two users processing the same course) make one LLM call
+    
+    Every returned entry carries its span under `metrics`: read (including
+    preprocessing), prompt render, time-to-first-token, LLM and total times,
+    source tokens before and after preprocessing, tokens sent and received
+    (including cached prompt tokens, per call under `calls`) and retries.
+    
+    Entries of files merged by `dedupe` name the file they copy in
+    `duplicate_of`, with the estimated `similarity` and how they were
+    `merged`: "copy" (notes reused) or "diff" (notes about the differences).
+    
+    A file that still fails after retries doesn't stop the batch: its entry
+    has empty notes and an `error` message, and every other file is kept.
     """
     if ai_model is None:
         raise ValueError("ai_model is required. Please provide an AI model instance.")
     
-    all_notes = []
-    previous_topics = ""
-    
     # Use provided model
     current_model = ai_model
     
@@ -61,53 +457,280 @@ def process_files(file_list, main_title="Complete Study Notes", topics=None, sug
         topics = []
     if suggestions is None:
         suggestions = []
+    if file_keys is None:
+        file_keys = [source_name(file_path) for file_path in file_list]
     
+    total = len(file_list)
+    
+    # Step 1 — Work out topic names and the completed-topics list up front.
+    # Topics only depend on user input or file names, so every file can be
+    # generated without waiting for the ones before it. With a context
+    # budget, prompts get related notes that are already finished instead
+    # of the ever-growing list.
+    tasks = []
+    previous_topics = ""
     for i, file_path in enumerate(file_list):
-        print(f"📁 Processing file {i+1}/{len(file_list)}: {file_path}")
-        
-        # Update progress if callback provided
-        if progress_callback:
-            progress_callback(i, len(file_list), f"Processing {file_path}")
-        
-        content = file_reader(file_path)
-        
-        # Step 1 — Get topic name
         if i < len(topics) and topics[i] and topics[i].strip():
             # Use provided topic
             topic_name = topics[i].strip()
         else:
             # Use file name as topic (simple and fast)
-            topic_name = generate_topic_from_filename(file_path)
-        
-        print(f"📝 Topic: {topic_name}")
+            topic_name = generate_topic_from_filename(source_name(file_path))
         
-        # Step 2 — Generate detailed notes
         suggestion = suggestions[i] if i < len(suggestions) else "Explain clearly and simply"
+        tasks.append((i, file_path, file_keys[i], topic_name, suggestion, previous_topics))
         
-        notes = generate_detailed_notes(
-            main_title=main_title,
-            previous_topics=previous_topics,
-            topic_name=topic_name,
-            suggestion=suggestion,
-            file_content=content,
-            ai_model=current_model
-        )
-        
-        all_notes.append({
-            'file_path': file_path,
-            'topic_name': topic_name,
-            'notes': notes
-        })
-        
-        # Step 3 — Update previous topics
         if previous_topics:
             previous_topics += f", {topic_name}"
         else:
             previous_topics = topic_name
     
+    spans = [new_span(task[2], task[3]) for task in tasks]
+    notes_index = NotesIndex() if context_tokens else None
+    # Notes are indexed in file order, and a file only sees the notes of files at
+    # least `max_workers` places before it: those are done whatever order the
+    # pool finishes files in, so its prompt (and cache key) is the same every run
+    index_ready = threading.Condition()
+    unindexed = {}
+    # Chunks of every file share one budget of LLM calls in flight
+    limiter = threading.BoundedSemaphore(max(1, max_workers or 1))
+    
+    def read_one(file_path, span):
+        read_start = time.perf_counter()
+        if is_notebook(file_path):
+            notebook_cells = read_notebook_cells(file_path)
+            cells = [source for cell_type, source in notebook_cells if cell_type == "code"]
+            content = "\n".join(cells)
+        else:
+            cells = None
+            content = file_reader(file_path)
+        span['source_tokens'] = estimate_tokens(content)
+        
+        # Collapse data literals, duplicate cells and other text that costs tokens without teaching anything
+        if preprocess is not None:
+            if cells is not None:
+                cells = preprocess.notebook(source_name(file_path), notebook_cells)
+                content = "\n".join(cells)
+            else:
+                content = preprocess.source(source_name(file_path), content)
+        span['preprocessed_tokens'] = estimate_tokens(content)
+        span['read_time'] = time.perf_counter() - read_start
+        if span['preprocessed_tokens'] < span['source_tokens']:
+            print(f"🧹 Trimmed {source_name(file_path)} from {span['source_tokens']:,} to {span['preprocessed_tokens']:,} tokens")
+        return content, cells
+    
+    # Step 2 — Find files that copy an earlier file of the batch. This needs
+    # every file's content, so with deduplication files are read up front.
+    sources = {}
+    duplicates = {}
+    if dedupe is not None:
+        def read_for_dedupe(task):
+            i, file_path = task[0], task[1]
+            try:
+                sources[i] = read_one(file_path, spans[i])
+            except Exception:
+                # The file is read again, and the error reported, when it is processed
+                return
+            spans[i]['total_time'] = spans[i]['read_time']
+        
+        with ThreadPoolExecutor(max_workers=max(max_workers or 1, 1)) as executor:
+            list(executor.map(read_for_dedupe, tasks))
+        duplicates = dedupe.find([(i, file_keys[i], sources[i][0]) for i in sorted(sources)])
+        for i, duplicate in sorted(duplicates.items()):
+            original = duplicate['original']
+            kind = "a copy of" if duplicate['exact'] else f"{duplicate['similarity']:.0%} similar to"
+            print(f"🔗 {source_name(file_list[i])} is {kind} {source_name(file_list[original])}")
+    
+    def process_one(i, file_path, file_key, topic_name, suggestion, completed_topics):
+        span = spans[i]
+        print(f"📁 Processing file {i+1}/{total}: {source_name(file_path)}")
+        content, cells = sources[i] if i in sources else read_one(file_path, span)
+        print(f"📝 Topic: {topic_name}")
+        
+        # Reuse notes for files that haven't changed since the last run
+        if manifest is not None:
+            stored_notes = manifest.lookup(file_key, content, topic_name, suggestion)
+            if stored_notes is not None:
+                print("♻️ Unchanged, reusing stored notes")
+                if on_chunk:
+                    on_chunk(i, stored_notes)
+                span['reused'] = True
+                return stored_notes
+        
+        # Near copies only send what differs from the file they copy, when that is much smaller
+        prompt_content, prompt_cells, prompt_suggestion = content, cells, suggestion
+        duplicate = duplicates.get(i)
+        if duplicate is not None:
+            original = duplicate['original']
+            diff = content_diff(sources[original][0], content, file_keys[original], file_key)
+            if len(diff) < len(content) / 2:
+                print(f"🔀 Sending only the differences from {file_keys[original]}")
+                span.update(duplicate_of=file_keys[original], similarity=duplicate['similarity'], merged="diff")
+                prompt_content, prompt_cells = diff, None
+                prompt_suggestion = (
+                    f"{suggestion} (This file is a near copy of {file_keys[original]}, covered under "
+                    f"\"{tasks[original][3]}\". Only the differences are shown, as a unified diff: explain "
+                    "what this version changes and why, without repeating what the two files share.)"
+                )
+        
+        # Tell the model what earlier files covered, within a fixed budget however big the batch is
+        if notes_index is not None:
+            visible = max(0, positions[i] - max(1, max_workers or 1) + 1)
+            with index_ready:
+                index_ready.wait_for(lambda: notes_index.files >= visible)
+            completed_topics = notes_index.context(topic_name, content, [task[3] for task in tasks[:i]], budget=context_tokens, files=visible)
+        
+        # Step 3 — Split oversized files on structural boundaries
+        chunks = chunk_content(source_name(file_path), prompt_content, max_chunk_tokens, cells=prompt_cells)
+        span['chunks'] = len(chunks)
+        parts = None
+        if len(chunks) > 1:
+            print(f"✂️ Split into {len(chunks)} chunks")
+            # Chunks (groups of cells, for notebooks) that are unchanged since the last run keep their notes
+            if manifest is not None:
+                parts = manifest.stored_chunks(file_key, chunks, topic_name, suggestion)
+                reused = sum(part is not None for part in parts)
+                if reused:
+                    print(f"🔄 {len(chunks) - reused} of {len(chunks)} chunks changed, reusing the notes of the others")
+            else:
+                parts = [None] * len(chunks)
+        
+        # Step 4 — Generate detailed notes (streamed when a chunk callback is given)
+        timings = {}
+        try:
+            notes = generate_chunked_notes(
+                main_title=main_title,
+                previous_topics=completed_topics,
+                topic_name=topic_name,
+                suggestion=prompt_suggestion,
+                chunks=chunks,
+                ai_model=current_model,
+                cache=cache,
+                on_chunk=(lambda chunk: on_chunk(i, chunk)) if on_chunk else None,
+                timings=timings,
+                max_workers=max_workers,
+                scheduler=scheduler,
+                prompt_caching=prompt_caching,
+                coalescer=coalescer,
+                limiter=limiter,
+                parts=parts,
+                # Keep finished chunks even if a later one fails
+                on_part=(lambda k, part: manifest.record_chunk(file_key, topic_name, suggestion, chunks[k], part)) if manifest is not None else None
+            )
+        finally:
+            for key in ('render_time', 'llm_time', 'input_tokens', 'output_tokens', 'cached_tokens', 'retries', 'cached_calls', 'coalesced_calls', 'continuations', 'time_to_first_token', 'calls'):
+                if key in timings:
+                    span[key] = timings[key]
+        
+        if manifest is not None:
+            manifest.record(file_key, content, topic_name, suggestion, notes, chunks=chunks if parts else None, parts=parts)
+        return notes
+    
+    def make_entry(i, notes):
+        span = spans[i]
+        if metrics is not None:
+            metrics.record(span)
+        return {
+            'file_path': source_name(file_list[i]),
+            'file_key': file_keys[i],
+            'topic_name': tasks[i][3],
+            'notes': notes,
+            'time_to_first_token': span['time_to_first_token'],
+            'retries': span['retries'],
+            'reused': span['reused'],
+            'error': span['error'],
+            'duplicate_of': span['duplicate_of'],
+            'similarity': span['similarity'],
+            'merged': span['merged'],
+            'metrics': span
+        }
+    
+    def process_and_measure(i, file_path, *rest):
+        # Keep going when one file fails so finished notes aren't thrown away
+        span = spans[i]
+        start = time.perf_counter()
+        try:
+            notes = process_one(i, file_path, *rest)
+        except Exception as e:
+            print(f"❌ Failed {source_name(file_path)}: {e}")
+            notes = ""
+            span['error'] = str(e)
+        if notes_index is not None:
+            index_in_order(i, notes)
+        span['total_time'] += time.perf_counter() - start
+        return make_entry(i, notes)
+    
+    def index_in_order(i, notes):
+        with index_ready:
+            unindexed[positions[i]] = (tasks[i][3], notes)
+            while notes_index.files in unindexed:
+                notes_index.add(*unindexed.pop(notes_index.files))
+            index_ready.notify_all()
+    
+    def copy_notes(i, original_entry):
+        """Give an exact copy the notes of the file it copies, unless it has its own stored (maybe edited) notes."""
+        _, _, file_key, topic_name, suggestion, _ = tasks[i]
+        span = spans[i]
+        span.update(duplicate_of=original_entry['file_key'], similarity=1.0, merged="copy")
+        content, _ = sources[i]
+        notes = manifest.lookup(file_key, content, topic_name, suggestion) if manifest is not None else None
+        if notes is not None:
+            span['reused'] = True
+        elif original_entry['error']:
+            notes = ""
+            span['error'] = f"Copy of {original_entry['file_key']}, which failed: {original_entry['error']}"
+        else:
+            notes = original_entry['notes']
+            if manifest is not None:
+                manifest.record(file_key, content, topic_name, suggestion, notes)
+        if on_chunk and notes:
+            on_chunk(i, notes)
+        return make_entry(i, notes)
+    
+    all_notes = [None] * total
+    completed = 0
+    
+    # Exact copies make no LLM call; they are finished together with the file they copy
+    copies = {}
+    for i, duplicate in sorted(duplicates.items()):
+        if duplicate['exact']:
+            copies.setdefault(duplicate['original'], []).append(i)
+    to_generate = [task for task in tasks if not duplicates.get(task[0], {}).get('exact')]
+    positions = {task[0]: position for position, task in enumerate(to_generate)}
+    
+    def finish(i, entry):
+        nonlocal completed
+        all_notes[i] = entry
+        completed += 1
+        if on_result:
+            on_result(i, entry)
+        if progress_callback:
+            progress_callback(completed, total, f"Finished {entry['file_path']}")
+        for copy in copies.get(i, []):
+            finish(copy, copy_notes(copy, entry))
+    
+    try:
+        if max_workers is None or max_workers <= 1:
+            # Generate one file at a time
+            for task in to_generate:
+                if progress_callback:
+                    progress_callback(completed, total, f"Processing {source_name(task[1])}")
+                finish(task[0], process_and_measure(*task))
+        else:
+            # Generate several files at once, keeping results in input order.
+            # Callbacks still run on the caller's thread as each file finishes.
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = {executor.submit(process_and_measure, *task): task for task in to_generate}
+                for future in as_completed(futures):
+                    finish(futures[future][0], future.result())
+    finally:
+        # The manifest saves at most every few seconds; write the rest, also when interrupted
+        if manifest is not None:
+            manifest.flush()
+    
     # Final progress update
     if progress_callback:
-        progress_callback(len(file_list), len(file_list), "Processing complete!")
+        progress_callback(total, total, "Processing complete!")
     
     return all_notes, previous_topics
 
@@ -130,26 +753,41 @@ def generate_topic_from_filename(file_path):
     
     return topic
 
-def file_reader(file_path):
-    """Read file content, handling both regular files and Jupyter notebooks."""
-    for_extension = file_path.split(".")
-    extension = for_extension[len(for_extension)-1]
+def source_name(source):
+    """Path of a file on disk, or the name of an in-memory upload (anything with `name` and `open()`)."""
+    return source if isinstance(source, (str, os.PathLike)) else source.name
 
-    if extension == "ipynb":
-        with open(file_path, "r", encoding="utf-8") as f:
-            notebook = json.load(f)
+def open_source(source):
+    """Open a path or an in-memory upload as text, in the file's detected encoding."""
+    if isinstance(source, (str, os.PathLike)):
+        return open_text(source)
+    return source.open()
 
-        # Extract all code cells
-        code_cells = [
-            "".join(cell["source"])
-            for cell in notebook.get("cells", [])
-            if cell.get("cell_type") == "code"
-        ]
+def is_notebook(file_path):
+    """Check whether a path (or upload) points to a Jupyter notebook."""
+    return str(source_name(file_path)).split(".")[-1] == "ipynb"
+
+def read_notebook_cells(file_path):
+    """Return (cell_type, source) for every cell in a Jupyter notebook (outputs are skipped, not parsed)."""
+    with open_source(file_path) as f:
+        return list(iter_notebook_cells(f))
+
+def read_code_cells(file_path):
+    """Return the source of every code cell in a Jupyter notebook (outputs are skipped, not parsed)."""
+    return [
+        source
+        for cell_type, source in read_notebook_cells(file_path)
+        if cell_type == "code"
+    ]
 
-        code_text = "\n".join(code_cells)
+def file_reader(file_path):
+    """Read file content from a path or an in-memory upload, handling both regular files and Jupyter notebooks."""
+    if is_notebook(file_path):
+        # Extract all code cells
+        code_text = "\n".join(read_code_cells(file_path))
         return code_text
 
     else:
-        with open(file_path, "r", encoding="utf-8") as f:
+        with open_source(file_path) as f:
             code_text = f.read()
-        return code_text
\ No newline at end of file
+        return code_text
@@ -0,0 +1,371 @@
+"""
+Parallel ingestion of files and directory trees.
+
+Directories are listed and files are read on one thread pool, honoring
+.gitignore files along the way; a directory reached twice (through a
+symlink loop, say) is only walked once. Every candidate is sniffed so
+binaries are skipped, checked against a size cap, decoded with a detected
+encoding (UTF-8 with or without BOM, UTF-16/32 by BOM, then Windows-1252 /
+Latin-1) and read either into memory or, when large, through a memory
+map. The result is a list of in-memory files that process_files accepts
+like uploads, plus a report of what was read and skipped.
+"""
+
+import codecs
+import fnmatch
+import glob
+import hashlib
+import mmap
+import os
+import re
+import threading
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from uploads import Upload
+
+DEFAULT_MAX_FILE_BYTES = 2 * 1024 * 1024
+# Notebook outputs are skipped while reading, so notebooks may be much larger
+DEFAULT_MAX_NOTEBOOK_BYTES = 100 * 1024 * 1024
+DEFAULT_MMAP_THRESHOLD = 1024 * 1024
+DEFAULT_WORKERS = 16
+
+SNIFF_BYTES = 8192
+
+_BOMS = (
+    (codecs.BOM_UTF32_LE, "utf-32"),
+    (codecs.BOM_UTF32_BE, "utf-32"),
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16")
+)
+# UTF-16/32 text is full of NUL bytes, so it must not be sniffed as binary
+_WIDE_BOMS = tuple(bom for bom, encoding in _BOMS if encoding in ("utf-16", "utf-32"))
+# Bytes that never appear in text files, apart from tab, newlines, form feed and escape
+_CONTROL_BYTES = bytes(set(range(32)) - {8, 9, 10, 12, 13, 27})
+
+def matches_filters(path, include, exclude):
+    """Check a path against include/exclude glob patterns (matched on the full path and the file name)."""
+    name = os.path.basename(path)
+    matches = lambda pattern: fnmatch.fnmatch(path, pattern) or fnmatch.fnmatch(name, pattern)
+    if include and not any(matches(pattern) for pattern in include):
+        return False
+    return not any(matches(pattern) for pattern in exclude)
+
+def detect_encoding(head, complete=False):
+    """
+    Guess the encoding of a file from its first bytes (or all of them, with `complete`).
+
+    Byte order marks win; otherwise UTF-8 if the bytes decode as UTF-8,
+    then Windows-1252, and Latin-1 (which accepts any bytes) as a last resort.
+    """
+    for bom, encoding in _BOMS:
+        if head.startswith(bom):
+            return encoding
+    try:
+        # A sample may end in the middle of a multi-byte character
+        codecs.getincrementaldecoder("utf-8")().decode(head, final=complete)
+        return "utf-8"
+    except UnicodeDecodeError:
+        pass
+    try:
+        codecs.decode(head, "cp1252")
+        return "cp1252"
+    except UnicodeDecodeError:
+        return "latin-1"
+
+def is_binary(head):
+    """Sniff the first bytes of a file: NUL bytes or many control characters mean it isn't text."""
+    if not head or head.startswith(_WIDE_BOMS):
+        return False
+    if b"\0" in head:
+        return True
+    return len(head.translate(None, _CONTROL_BYTES)) < len(head) * 0.9
+
+def open_text(path):
+    """Open a file as text in its detected encoding; undecodable bytes are replaced instead of raising."""
+    with open(path, "rb") as f:
+        head = f.read(SNIFF_BYTES)
+    return open(path, "r", encoding=detect_encoding(head), errors="replace")
+
+class GitIgnore:
+    """
+    The .gitignore rules that apply inside one directory.
+
+    Rules are (directory prefix, regex, negated, directory only) tuples; a
+    child directory's rules extend its parent's, and the last matching rule wins.
+    """
+
+    def __init__(self, rules=()):
+        self.rules = tuple(rules)
+
+    def child(self, directory):
+        """Rules for `directory`: these plus its own .gitignore, if it has one."""
+        path = os.path.join(directory, ".gitignore")
+        try:
+            with open(path, "r", encoding="utf-8", errors="replace") as f:
+                lines = f.read().splitlines()
+        except OSError:
+            return self
+        rules = [rule for rule in (self._parse(directory, line) for line in lines) if rule]
+        return GitIgnore(self.rules + tuple(rules)) if rules else self
+
+    @staticmethod
+    def _parse(base, line):
+        line = line.rstrip()
+        if not line or line.startswith("#"):
+            return None
+        negated = line.startswith("!")
+        if negated:
+            line = line[1:]
+        if line.startswith("\\"):
+            line = line[1:]
+        directory_only = line.endswith("/")
+        line = line.strip("/") if directory_only else line
+        # A slash at the start or in the middle anchors the pattern to the .gitignore's directory
+        anchored = "/" in line
+        line = line.lstrip("/")
+        regex = _translate(line)
+        if not anchored:
+            regex = "(?:.*/)?" + regex
+        return (base.rstrip(os.sep) + os.sep, re.compile(regex + r"\Z"), negated, directory_only)
+
+    def ignored(self, path, is_directory):
+        result = False
+        for prefix, regex, negated, directory_only in self.rules:
+            if (directory_only and not is_directory) or not path.startswith(prefix):
+                continue
+            if regex.match(path[len(prefix):].replace(os.sep, "/")):
+                result = not negated
+        return result
+
+def _translate(pattern):
+    """Translate a gitignore glob into a regex over "/"-separated relative paths."""
+    parts = []
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith("**/", i):
+            parts.append("(?:.*/)?")
+            i += 3
+        elif pattern.startswith("**", i):
+            parts.append(".*")
+            i += 2
+        elif pattern[i] == "*":
+            parts.append("[^/]*")
+            i += 1
+        elif pattern[i] == "?":
+            parts.append("[^/]")
+            i += 1
+        elif pattern[i] == "[" and "]" in pattern[i + 1:]:
+            end = pattern.index("]", i + 1)
+            body = pattern[i + 1:end]
+            parts.append("[" + ("^" + body[1:] if body.startswith("!") else body) + "]")
+            i = end + 1
+        else:
+            parts.append(re.escape(pattern[i]))
+            i += 1
+    return "".join(parts)
+
+class IngestReport:
+    """Counts and timings of one ingestion: files and bytes read, and what was skipped and why."""
+
+    def __init__(self):
+        self.files = 0
+        self.bytes_read = 0
+        self.skipped = Counter()
+        self.bytes_skipped = 0
+        self.skipped_files = []
+        self.encodings = Counter()
+        self.mapped = 0
+        self.elapsed = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, upload, mapped):
+        with self._lock:
+            self.files += 1
+            self.bytes_read += upload.size
+            self.encodings[upload.encoding] += 1
+            self.mapped += mapped
+
+    def skip(self, path, reason, size=0):
+        with self._lock:
+            self.skipped[reason] += 1
+            self.bytes_skipped += size
+            self.skipped_files.append((path, reason))
+
+    @property
+    def files_per_second(self):
+        return self.files / self.elapsed if self.elapsed else 0.0
+
+    def summary(self):
+        """One-line human-readable summary."""
+        text = f"{self.files} files ({self.bytes_read / 1e6:.1f} MB) in {self.elapsed:.2f}s ({self.files_per_second:,.0f} files/s)"
+        if self.skipped:
+            reasons = ", ".join(f"{count} {reason}" for reason, count in self.skipped.most_common())
+            text += f"; skipped {sum(self.skipped.values())} ({reasons}, {self.bytes_skipped / 1e6:.1f} MB)"
+        return text
+
+    def as_dict(self):
+        return {
+            "files": self.files,
+            "bytes_read": self.bytes_read,
+            "skipped": dict(self.skipped),
+            "bytes_skipped": self.bytes_skipped,
+            "encodings": dict(self.encodings),
+            "memory_mapped": self.mapped,
+            "elapsed": self.elapsed,
+            "files_per_second": self.files_per_second
+        }
+
+def _walk_key(path):
+    """Sort key that lists a directory's files before its subdirectories, like os.walk."""
+    parts = os.path.normpath(path).split(os.sep)
+    return [(1, part) for part in parts[:-1]] + [(0, parts[-1])]
+
+def ingest(
+    paths,
+    include=(),
+    exclude=(),
+    extensions=None,
+    max_file_bytes=DEFAULT_MAX_FILE_BYTES,
+    max_notebook_bytes=DEFAULT_MAX_NOTEBOOK_BYTES,
+    mmap_threshold=DEFAULT_MMAP_THRESHOLD,
+    respect_gitignore=True,
+    workers=DEFAULT_WORKERS
+):
+    """
+    Collect and read files, directories and glob patterns in parallel.
+
+    Args:
+        paths: Files, directories (walked recursively; hidden ones are skipped) and glob patterns
+        include: Only keep files matching one of these globs
+        exclude: Skip files matching any of these globs
+        extensions: File extensions (without the dot) to keep when walking directories; None keeps all
+        max_file_bytes: Larger files are skipped (0 or None for no cap)
+        max_notebook_bytes: Size cap for .ipynb files, whose outputs are never read
+        mmap_threshold: Files at least this large are memory-mapped instead of read into memory
+        respect_gitignore: Skip files and directories ignored by .gitignore files inside walked directories
+        workers: Threads used to list directories and read files
+
+    Returns (files, report): Upload objects in the order os.walk would list
+    them (named by their path, so they work as process_files inputs and
+    manifest keys) and an IngestReport.
+    """
+    report = IngestReport()
+    start = time.perf_counter()
+    extensions = {extension.lower() for extension in extensions} if extensions is not None else None
+    found = {}
+    order = {}
+    visited = set()
+    lock = threading.Lock()
+
+    def claim(path, index):
+        """Normalize a candidate path; None if it is filtered out or was already claimed via another input."""
+        path = os.path.normpath(path)
+        if not matches_filters(path, include, exclude):
+            return None
+        key = (index, _walk_key(path))
+        with lock:
+            if path in order:
+                # Listed by several inputs: it belongs where the first of them puts it
+                order[path] = min(order[path], key)
+                return None
+            order[path] = key
+        return path
+
+    def read_file(path, size=None):
+        try:
+            if size is None:
+                size = os.path.getsize(path)
+            limit = max_notebook_bytes if path.lower().endswith(".ipynb") else max_file_bytes
+            if limit and size > limit:
+                report.skip(path, "too large", size)
+                return
+
+            mapped = False
+            with open(path, "rb") as f:
+                if size >= mmap_threshold and size > 0:
+                    buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                    mapped = True
+                else:
+                    buffer = f.read()
+            head = bytes(buffer[:SNIFF_BYTES])
+            if is_binary(head):
+                report.skip(path, "binary", size)
+                return
+
+            # Small files are checked in full; large ones only by their first bytes
+            encoding = detect_encoding(head if mapped else buffer, complete=not mapped)
+            upload = Upload(hashlib.sha256(buffer).hexdigest(), path, buffer, encoding=encoding)
+            found[path] = upload
+            report.add(upload, mapped)
+        except OSError as e:
+            report.skip(path, "unreadable")
+            print(f"⚠️  Skipping {path}: {e}")
+
+    def scan_directory(directory, rules, index):
+        """List one directory; returns the (function, args) tasks reading its files and walking its subdirectories."""
+        # Symlinked directories are followed, but each real directory is walked once
+        real_directory = os.path.realpath(directory)
+        with lock:
+            if real_directory in visited:
+                return []
+            visited.add(real_directory)
+        if respect_gitignore:
+            rules = rules.child(directory)
+        tasks = []
+        try:
+            entries = sorted(os.scandir(directory), key=lambda entry: entry.name)
+        except OSError as e:
+            print(f"⚠️  Skipping {directory}: {e}")
+            return tasks
+        for entry in entries:
+            try:
+                is_directory = entry.is_dir()
+                if is_directory and entry.name.startswith("."):
+                    # Skip hidden directories such as .git
+                    continue
+                if rules.rules and rules.ignored(entry.path, is_directory):
+                    report.skip(entry.path, "ignored")
+                    continue
+                if is_directory:
+                    tasks.append((scan_directory, (entry.path, rules, index)))
+                elif entry.is_file():
+                    extension = entry.name.rsplit(".", 1)[-1].lower() if "." in entry.name else ""
+                    if extensions is not None and extension not in extensions:
+                        continue
+                    path = claim(entry.path, index)
+                    if path is not None:
+                        tasks.append((read_file, (path, entry.stat().st_size)))
+            except OSError:
+                report.skip(entry.path, "unreadable")
+        return tasks
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="devnotes-ingest") as executor:
+        pending = set()
+        for index, path in enumerate(paths):
+            if os.path.isdir(path):
+                pending.add(executor.submit(scan_directory, path, GitIgnore(), index))
+                continue
+            if glob.has_magic(path):
+                matches = [match for match in sorted(glob.glob(path, recursive=True)) if os.path.isfile(match)]
+            elif os.path.isfile(path):
+                matches = [path]
+            else:
+                print(f"⚠️  Skipping missing path: {path}")
+                continue
+            for match in matches:
+                match = claim(match, index)
+                if match is not None:
+                    pending.add(executor.submit(read_file, match))
+
+        # Directory listings fan out: each finished one queues its file reads and subdirectories
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                for function, args in future.result() or ():
+                    pending.add(executor.submit(function, *args))
+
+    report.elapsed = time.perf_counter() - start
+    return [found[path] for path in sorted(found, key=order.get)], report
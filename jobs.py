@@ -0,0 +1,226 @@
+"""
+Background jobs for the Streamlit app.
+
+Generation runs on a worker pool owned by a process-wide JobManager instead
+of the Streamlit script thread, so reruns and page reloads don't block or
+restart it. Each job has an ID, reports progress and finished files as they
+come in, and is saved to a small JSON store so its results can be reloaded.
+"""
+
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_JOBS_DIR = ".devnotes_jobs"
+DEFAULT_MAX_AGE = 7 * 24 * 60 * 60
+
+# Job states
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+INTERRUPTED = "interrupted"
+
+ACTIVE_STATES = (QUEUED, RUNNING)
+
+class JobStore:
+    """
+    One JSON file per job under `directory`.
+
+    Args:
+        directory: Folder the job files are kept in
+    """
+
+    def __init__(self, directory=DEFAULT_JOBS_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, job_id):
+        return os.path.join(self.directory, f"{job_id}.json")
+
+    def save(self, job):
+        # Write to a temporary file first so a crash never leaves a half-written job
+        path = self._path(job["id"])
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(job, f, ensure_ascii=False)
+        os.replace(temp_path, path)
+
+    def load(self, job_id):
+        """Return the stored job, or None if there is no such job."""
+        path = self._path(job_id)
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def prune(self, max_age=DEFAULT_MAX_AGE):
+        """Delete jobs that haven't been updated for `max_age` seconds."""
+        cutoff = time.time() - max_age
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith(".json") and os.path.getmtime(path) < cutoff:
+                os.remove(path)
+
+class JobHandle:
+    """What a running job uses to report progress and results back to its manager."""
+
+    def __init__(self, manager, job_id):
+        self._manager = manager
+        self.job_id = job_id
+
+    def update_progress(self, current, total, message):
+        """Progress callback compatible with process_files."""
+        self._manager._update(self.job_id, completed=current, total=total, message=message)
+
+    def add_result(self, index, entry):
+        """Store a finished file's entry at its position in the batch."""
+        self._manager._add_result(self.job_id, index, entry)
+
+    def append_text(self, index, chunk):
+        """Stream callback compatible with process_files; kept in memory only."""
+        self._manager._append_text(self.job_id, index, chunk)
+
+    def set_info(self, **info):
+        """Attach extra JSON-serialisable details (e.g. cache stats) to the job."""
+        self._manager._update(self.job_id, info=info)
+
+class JobManager:
+    """
+    Runs jobs on a thread pool and keeps their state in memory and in a JobStore.
+
+    Args:
+        max_jobs: Jobs that may run at the same time; later ones wait in the queue
+        store: JobStore used to persist jobs (defaults to DEFAULT_JOBS_DIR)
+    """
+
+    def __init__(self, max_jobs=2, store=None):
+        self.store = store or JobStore()
+        self.store.prune()
+        self._jobs = {}
+        self._live_text = {}
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._executor = ThreadPoolExecutor(max_workers=max_jobs, thread_name_prefix="devnotes-job")
+
+    def submit(self, target, total, title=""):
+        """
+        Queue `target(handle)` to run in the background and return the new job's ID.
+
+        `target` receives a JobHandle; whatever it raises marks the job as failed.
+        """
+        job_id = uuid.uuid4().hex[:12]
+        now = time.time()
+        job = {
+            "id": job_id,
+            "title": title,
+            "status": QUEUED,
+            "total": total,
+            "completed": 0,
+            "message": "Waiting to start",
+            "results": [None] * total,
+            "info": {},
+            "error": None,
+            "version": 0,
+            "created_at": now,
+            "updated_at": now
+        }
+        with self._lock:
+            self._jobs[job_id] = job
+            self._live_text[job_id] = {}
+            self.store.save(job)
+        self._executor.submit(self._run, job_id, target)
+        return job_id
+
+    def get(self, job_id):
+        """
+        Return a snapshot of a job, or None if it is unknown.
+
+        Jobs found only in the store that never finished belong to a previous
+        server process and are reported as interrupted.
+        """
+        with self._lock:
+            snapshot = self._snapshot(job_id)
+            if snapshot is not None:
+                return snapshot
+
+        job = self.store.load(job_id)
+        if job is None:
+            return None
+        if job["status"] in ACTIVE_STATES:
+            job["status"] = INTERRUPTED
+        job["live_text"] = {}
+        return job
+
+    def wait(self, job_id, version, timeout=None):
+        """
+        Block until a job changes past `version` (its `version` field counts
+        every update), it finishes, or `timeout` seconds pass; then return a snapshot like `get`.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._changed:
+            while True:
+                job = self._jobs.get(job_id)
+                if job is None or job["version"] > version:
+                    break
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                self._changed.wait(remaining)
+        return self.get(job_id)
+
+    def _snapshot(self, job_id):
+        job = self._jobs.get(job_id)
+        if job is None:
+            return None
+        snapshot = dict(job, results=list(job["results"]), info=dict(job["info"]))
+        snapshot["live_text"] = dict(self._live_text.get(job_id, {}))
+        return snapshot
+
+    def _touch(self, job):
+        job["version"] += 1
+        job["updated_at"] = time.time()
+        self._changed.notify_all()
+
+    def _run(self, job_id, target):
+        self._update(job_id, status=RUNNING, message="Starting")
+        try:
+            target(JobHandle(self, job_id))
+        except Exception as e:
+            self._update(job_id, status=FAILED, error=str(e), message=f"Failed: {e}")
+        else:
+            self._update(job_id, status=DONE, message="Processing complete!")
+
+        # The final state is in the store now, so finished jobs don't have to stay in memory
+        with self._lock:
+            self._jobs.pop(job_id, None)
+            self._live_text.pop(job_id, None)
+            self._changed.notify_all()
+
+    def _update(self, job_id, info=None, **fields):
+        with self._lock:
+            job = self._jobs[job_id]
+            job.update(fields)
+            if info:
+                job["info"].update(info)
+            self._touch(job)
+            # Progress messages change often; only save state that matters after a reload
+            if "status" in fields or info:
+                self.store.save(job)
+
+    def _add_result(self, job_id, index, entry):
+        with self._lock:
+            job = self._jobs[job_id]
+            job["results"][index] = entry
+            self._touch(job)
+            self._live_text[job_id].pop(index, None)
+            self.store.save(job)
+
+    def _append_text(self, job_id, index, chunk):
+        with self._lock:
+            live_text = self._live_text[job_id]
+            live_text[index] = live_text.get(index, "") + chunk
+            self._touch(self._jobs[job_id])
@@ -1,16 +1,32 @@
-from helper import file_reader, process_files, format_final_notes, markdown_to_pdf
+import argparse
+import os
+import sys
+from helper import process_files, get_ai_model, SUPPORTED_EXTENSIONS
+from cache import NotesCache
+from manifest import ProjectManifest, project_manifest_path
+from rate_limit import RequestScheduler
+from metrics import JsonLinesSink, MultiSink, PrometheusSink
+from preprocess import Preprocessor
+from dedupe import DEFAULT_THRESHOLD, DuplicateDetector
+from ingest import DEFAULT_MAX_FILE_BYTES, ingest, matches_filters
+from retrieval import DEFAULT_CONTEXT_TOKENS
+from client import NotesClient
+from providers import available_providers, get_provider
+from assembly import build_sections, write_sections
+from export import Exporter, format_export_report
 
-def main():
-    """Main function to generate notes from code files."""
-    print("📚 DevNotes-AI: Code to Study Notes Generator")
-    print("=" * 50)
-    
-    # Get user input for main title
+def print_chunk(index, chunk):
+    """Print streamed notes to the terminal as they arrive."""
+    print(chunk, end="", flush=True)
+
+def print_result(index, entry):
+    """Print one line per file finished on the server."""
+    print(f"\n❌ {entry['file_path']}: {entry['error']}" if entry['error'] else f"\n✅ {entry['file_path']}")
+
+def prompt_for_files():
+    """Interactive fallback: ask for a title and file paths one at a time."""
     main_title = input("Enter the main title for your notes (e.g., 'Complete Python Notes'): ").strip()
-    if not main_title:
-        main_title = "Complete Study Notes"
-    
-    # Get file list from user
+
     print("\nEnter file paths (one per line, press Enter twice when done):")
     file_list = []
     while True:
@@ -18,43 +34,288 @@ def main():
         if not file_path:
             break
         file_list.append(file_path)
-    
+
+    return main_title, file_list
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="DevNotes-AI: generate study notes from code files.",
+        epilog="Run without paths for interactive mode."
+    )
+    parser.add_argument("paths", nargs="*", help="Files, directories or glob patterns to process")
+    parser.add_argument("-t", "--title", default=None, help="Main title for the notes")
+    parser.add_argument("-i", "--include", action="append", default=[], help="Only process files matching this glob (repeatable)")
+    parser.add_argument("-x", "--exclude", action="append", default=[], help="Skip files matching this glob (repeatable)")
+    parser.add_argument("--max-file-mb", type=float, default=DEFAULT_MAX_FILE_BYTES / (1024 * 1024), help="Skip source files larger than this many MB (notebooks have their own, larger cap)")
+    parser.add_argument("--no-gitignore", action="store_true", help="Also process files ignored by .gitignore")
+    parser.add_argument("-p", "--provider", choices=available_providers(), default="Gemini", help="AI provider (plugins installed through entry points are listed too)")
+    parser.add_argument("-m", "--model", default=None, help="Model name (defaults to a sensible model for the provider)")
+    parser.add_argument("--api-key", default=None, help="API key (defaults to GOOGLE_API_KEY / OPENAI_API_KEY / ANTHROPIC_API_KEY)")
+    parser.add_argument("-w", "--workers", type=int, default=4, help="Number of files generated at the same time")
+    parser.add_argument("--checkpoint", default=None, help="Checkpoint file used to resume interrupted runs (defaults to the project manifest)")
+    parser.add_argument("--rpm", type=int, default=None, help="Requests per minute allowed by your plan (defaults to the provider's entry tier)")
+    parser.add_argument("--tpm", type=int, default=None, help="Tokens per minute allowed by your plan (defaults to the provider's entry tier)")
+    parser.add_argument("--max-retries", type=int, default=5, help="Retries per request after rate limits or server errors")
+    parser.add_argument("--metrics-jsonl", default=None, help="Append one JSON line of timings and tokens per file to this file")
+    parser.add_argument("--metrics-port", type=int, default=None, help="Serve Prometheus metrics on http://127.0.0.1:PORT/metrics during the run")
+    parser.add_argument("--prompt-caching", action="store_true", help="Mark the fixed instructions for provider prompt caching (Claude cache_control)")
+    parser.add_argument("--no-preprocess", action="store_true", help="Send files as they are, without collapsing data literals and duplicate cells")
+    parser.add_argument("--strip-commented-code", action="store_true", help="Remove long blocks of commented-out code before prompting")
+    parser.add_argument("--markdown-headings", action="store_true", help="Include notebook markdown headings as section comments")
+    parser.add_argument("--no-dedupe", action="store_true", help="Generate every file on its own, even copies of another file")
+    parser.add_argument("--dedupe-threshold", type=float, default=DEFAULT_THRESHOLD, help="Similarity (0-1) above which a file counts as a near copy")
+    parser.add_argument("--keep-separate", action="append", default=[], help="Never merge files matching this glob with their copies (repeatable)")
+    parser.add_argument("--context-tokens", type=int, default=DEFAULT_CONTEXT_TOKENS, help="Token budget for related earlier notes in each prompt (0 = list every earlier topic instead)")
+    parser.add_argument("--no-cache", action="store_true", help="Ignore cached responses and call the model for every file")
+    parser.add_argument("--server", default=None, help="Generate on a DevNotes-AI server (python server.py) at this URL instead of locally")
+    parser.add_argument("--hedge", action="append", default=[], metavar="PROVIDER[:MODEL]", help="Also send calls that are slower than usual, or that fail, to this provider (repeatable, tried in order; keys from its environment variable)")
+    parser.add_argument("--hedge-percentile", type=float, default=95.0, help="Latency percentile of a provider after which a call is hedged")
+    parser.add_argument("-o", "--output", default=None, help="Markdown output file")
+    parser.add_argument("--html", action="store_true", help="Also export the notes to a standalone HTML file next to the Markdown")
+    parser.add_argument("--pdf", action="store_true", help="Also export the notes to PDF (needs wkhtmltopdf installed)")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    """Main function to generate notes from code files."""
+    args = parse_args(argv)
+
+    print("📚 DevNotes-AI: Code to Study Notes Generator")
+    print("=" * 50)
+
+    if args.paths:
+        main_title = args.title
+        paths = args.paths
+    else:
+        main_title, paths = prompt_for_files()
+        main_title = main_title or args.title
+
+    # Walk, filter and read everything up front, in parallel
+    file_list, report = ingest(
+        paths,
+        include=args.include,
+        exclude=args.exclude,
+        extensions=SUPPORTED_EXTENSIONS,
+        max_file_bytes=int(args.max_file_mb * 1024 * 1024),
+        respect_gitignore=not args.no_gitignore
+    )
+    print(f"📂 Read {report.summary()}")
+
+    if not main_title:
+        main_title = "Complete Study Notes"
+
     if not file_list:
         print("❌ No files provided. Exiting.")
-        return
-    
-    print(f"\n📁 Processing {len(file_list)} files...")
-    
-    try:
-        # Process files and generate notes
-        all_notes, previous_topics = process_files(file_list, main_title)
-        
-        # Combine all notes
-        combined_notes = f"# {main_title}\n\n" + "\n\n".join(all_notes)
-        
-        # Optional: Format final notes
-        print("\n🔧 Formatting notes...")
-        formatted_notes = format_final_notes(combined_notes)
+        return 1
 
-        markdown_filename = f"{main_title.replace(' ', '_').lower()}_notes.md"
+    # Only the selected provider is loaded; its SDK is imported when the model is created
+    provider = get_provider(args.provider)
+    api_key = args.api_key or (os.environ.get(provider.api_key_env) if provider.api_key_env else None)
+    keep_separate = [upload.name for upload in file_list if args.keep_separate and matches_filters(upload.name, args.keep_separate, [])]
+    if args.server:
+        # The server may have its own key, so a local one is optional
+        try:
+            all_notes = generate_on_server(args, file_list, main_title, api_key, keep_separate)
+        except Exception as e:
+            print(f"\n❌ Error processing files on {args.server}: {e}")
+            return 1
+        return report_results(main_title, all_notes, args.output, args.html, args.pdf)
 
-        # Convert to PDF
-        pdf_filename = f"{main_title.replace(' ', '_').lower()}_notes.pdf"
-        print(f"\n📄 Converting to PDF...")
-        success = markdown_to_pdf(formatted_notes, pdf_filename)
-        
-        if success:
-            print(f"\n🎉 Success! Generated:")
-            print(f"   📝 Markdown: {markdown_filename}")
-            print(f"   📄 PDF: {pdf_filename}")
-        else:
-            print(f"\n⚠️  Markdown saved but PDF conversion failed.")
-            print(f"   📝 Markdown: {markdown_filename}")
+    if not api_key:
+        print(f"❌ No API key. Pass --api-key" + (f" or set {provider.api_key_env}." if provider.api_key_env else "."))
+        return 1
+    model_name = args.model or provider.default_model
+    if not model_name:
+        print(f"❌ {provider.name} has no default model. Pass --model.")
+        return 1
+
+    # Every finished file is written to the checkpoint, so a rerun skips work that is already done
+    checkpoint = ProjectManifest(args.checkpoint or project_manifest_path(main_title))
+    already_done = sum(1 for upload in file_list if checkpoint.finished(upload.name))
+    if already_done:
+        print(f"♻️  Checkpoint has {already_done} of {len(file_list)} files; only new or changed files will be generated.")
+
+    print(f"\n📁 Processing {len(file_list)} files with {args.workers} workers...")
+
+    notes_cache = NotesCache(bypass=args.no_cache)
+    scheduler = RequestScheduler.for_provider(
+        args.provider,
+        requests_per_minute=args.rpm,
+        tokens_per_minute=args.tpm,
+        max_concurrency=args.workers,
+        max_retries=args.max_retries
+    )
+    sinks = []
+    prometheus = None
+    if args.metrics_jsonl:
+        sinks.append(JsonLinesSink(args.metrics_jsonl))
+    if args.metrics_port:
+        prometheus = PrometheusSink().serve(args.metrics_port)
+        sinks.append(prometheus)
+        print(f"📈 Metrics on http://127.0.0.1:{args.metrics_port}/metrics")
+    try:
+        # Retries are left to the scheduler so they respect the rate limits
+        ai_model = get_ai_model(args.provider, model_name, api_key, max_retries=0)
+        schedulers = [scheduler]
+        if args.hedge:
+            # Each provider keeps its own rate limits but a failed call moves on to the next
+            # provider at once; the whole call is only retried when every provider failed
+            ai_model = build_hedged_model(args, ai_model, model_name)
+            scheduler = RequestScheduler(max_concurrency=args.workers, max_retries=args.max_retries)
+            schedulers = [scheduler] + [backend.scheduler for backend in ai_model.backends]
         
+        # Process files and generate notes (streamed to the terminal when running one at a time)
+        all_notes, previous_topics = process_files(
+            file_list,
+            main_title,
+            ai_model=ai_model,
+            max_workers=args.workers,
+            cache=notes_cache,
+            on_chunk=print_chunk if args.workers <= 1 else None,
+            manifest=checkpoint,
+            scheduler=scheduler,
+            metrics=MultiSink(*sinks) if sinks else None,
+            prompt_caching=args.prompt_caching,
+            preprocess=None if args.no_preprocess else Preprocessor(
+                strip_commented_code=args.strip_commented_code,
+                markdown_headings=args.markdown_headings
+            ),
+            context_tokens=args.context_tokens or None,
+            dedupe=None if args.no_dedupe else DuplicateDetector(
+                threshold=args.dedupe_threshold,
+                keep_separate=keep_separate
+            )
+        )
     except Exception as e:
-        print(f"❌ Error processing files: {e}")
-        print("Make sure all required dependencies are installed:")
-        print("pip install langchain-google-genai python-dotenv langchain markdown2 pdfkit")
+        print(f"\n❌ Error processing files: {e}")
+        print(f"Finished files are saved in {checkpoint.path}; run the same command again to resume.")
+        return 1
+    finally:
+        notes_cache.close()
+        if prometheus is not None:
+            prometheus.close()
+
+    retries = sum(scheduler.retries for scheduler in schedulers)
+    if retries:
+        print(f"\n⏳ {retries} requests were retried ({sum(scheduler.throttled for scheduler in schedulers)} rate limited).")
+    if args.hedge:
+        print_hedging(ai_model.stats())
+    return report_results(main_title, all_notes, args.output, args.html, args.pdf)
+
+def build_hedged_model(args, ai_model, model_name):
+    """Put the main model first and each --hedge PROVIDER[:MODEL] after it; raises ValueError if one can't be used."""
+    # Imported only when hedging, to keep the CLI's start-up light
+    from hedging import Backend, HedgedChatModel
+    backends = [Backend(
+        f"{args.provider}:{model_name}",
+        ai_model,
+        RequestScheduler.for_provider(args.provider, requests_per_minute=args.rpm, tokens_per_minute=args.tpm, max_concurrency=args.workers, max_retries=0)
+    )]
+    for spec in args.hedge:
+        name, _, hedge_model = spec.partition(":")
+        provider = get_provider(name)
+        hedge_model = hedge_model or provider.default_model
+        api_key = os.environ.get(provider.api_key_env) if provider.api_key_env else None
+        if not hedge_model or not api_key:
+            raise ValueError(f"--hedge {spec} needs a model and " + (f"{provider.api_key_env} set" if provider.api_key_env else "an API key"))
+        backends.append(Backend(
+            f"{name}:{hedge_model}",
+            get_ai_model(name, hedge_model, api_key, max_retries=0),
+            RequestScheduler.for_provider(name, max_concurrency=args.workers, max_retries=0)
+        ))
+    return HedgedChatModel(backends=backends, hedge_percentile=args.hedge_percentile)
+
+def print_hedging(stats):
+    """Print how calls were spread over the hedged providers."""
+    print(f"\n🏁 {stats['hedged']} of {stats['calls']} calls were hedged ({stats['hedge_wins']} won by the hedge), {stats['fallbacks']} fell back after a failure.")
+    for name, backend in stats['backends'].items():
+        circuit = "" if backend['circuit'] == "closed" else f", circuit {backend['circuit']}"
+        print(f"   {name}: {backend['wins']} of {backend['calls']} calls answered, {backend['failures']} failed{circuit}")
+
+def generate_on_server(args, file_list, main_title, api_key, keep_separate):
+    """Send the batch to a DevNotes-AI server and follow it, streaming text like a local run."""
+    client = NotesClient(args.server)
+    job_id = client.submit(
+        file_list,
+        main_title,
+        provider=args.provider,
+        model=args.model,
+        api_key=api_key,
+        options={
+            "workers": args.workers,
+            "use_cache": not args.no_cache,
+            # The server keeps the checkpoint, so rerunning the command resumes there
+            "skip_unchanged": True,
+            "prompt_caching": args.prompt_caching,
+            "preprocess": not args.no_preprocess,
+            "strip_commented_code": args.strip_commented_code,
+            "markdown_headings": args.markdown_headings,
+            "dedupe": not args.no_dedupe,
+            "dedupe_threshold": args.dedupe_threshold,
+            "keep_separate": keep_separate,
+            "context_tokens": args.context_tokens
+        }
+    )
+    print(f"📡 Queued as job {job_id} on {args.server}")
+    return client.follow(job_id, on_chunk=print_chunk if args.workers <= 1 else None, on_result=print_result)
+
+def report_results(main_title, all_notes, output=None, html=False, pdf=False):
+    """Write the combined notes (and HTML/PDF exports) and print a summary of the run; returns the exit code."""
+    # Combine all notes, writing them section by section
+    markdown_filename = output or f"{main_title.replace(' ', '_').lower()}_notes.md"
+    sections = build_sections(main_title, all_notes)
+    write_sections(markdown_filename, sections)
+
+    export = None
+    if html or pdf:
+        # Rendered once for both formats; unchanged sections come from the HTML cache
+        stem = os.path.splitext(markdown_filename)[0]
+        export = Exporter().export(
+            sections,
+            main_title,
+            html_path=f"{stem}.html" if html else None,
+            pdf_path=f"{stem}.pdf" if pdf else None
+        )
+        print(f"\n📄 Exported {format_export_report(export)}")
+        if export["pdf_error"]:
+            print(f"⚠️  No PDF written: {export['pdf_error']}")
+
+    failed = [file_data for file_data in all_notes if file_data['error']]
+    reused = sum(1 for file_data in all_notes if file_data['reused'])
+    cached_tokens = sum(file_data['metrics']['cached_tokens'] for file_data in all_notes)
+    source_tokens = sum(file_data['metrics']['source_tokens'] for file_data in all_notes)
+    preprocessed_tokens = sum(file_data['metrics']['preprocessed_tokens'] for file_data in all_notes)
+    if preprocessed_tokens < source_tokens:
+        print(f"\n🧹 Preprocessing cut the source from about {source_tokens:,} to {preprocessed_tokens:,} tokens.")
+    if cached_tokens:
+        print(f"\n💾 {cached_tokens:,} prompt tokens were read from the provider's cache.")
+    merged = [file_data for file_data in all_notes if file_data['merged']]
+    if merged:
+        print(f"\n🔗 {len(merged)} files were merged with a file they copy (use --keep-separate to opt out):")
+        for file_data in merged:
+            if file_data['merged'] == "copy":
+                print(f"   {file_data['file_path']}: copy of {file_data['duplicate_of']}, notes reused")
+            else:
+                print(f"   {file_data['file_path']}: {file_data['similarity']:.0%} similar to {file_data['duplicate_of']}, only the differences were explained")
+    coalesced = sum(file_data['metrics'].get('coalesced_calls', 0) for file_data in all_notes)
+    if coalesced:
+        print(f"\n🤝 {coalesced} requests were shared with identical ones already running on the server.")
+    continuations = sum(file_data['metrics'].get('continuations', 0) for file_data in all_notes)
+    if continuations:
+        print(f"\n✂️  {continuations} cut-off responses were continued from their last lines instead of generated again.")
+    if failed:
+        print(f"\n⚠️  {len(failed)} of {len(all_notes)} files failed:")
+        for file_data in failed:
+            print(f"   ❌ {file_data['file_path']}: {file_data['error']}")
+        print(f"Notes for the other files were written to {markdown_filename}; run the same command again to retry the failed ones.")
+        return 1
+
+    print(f"\n🎉 Success! Generated notes for {len(all_notes)} files ({reused} reused).")
+    print(f"   📝 Markdown: {markdown_filename}")
+    if export and export["html_path"]:
+        print(f"   🌐 HTML: {export['html_path']}")
+    if export and export["pdf_path"]:
+        print(f"   📄 PDF: {export['pdf_path']}")
+    return 0
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
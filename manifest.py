@@ -0,0 +1,148 @@
+"""
+Per-project manifest for incremental regeneration.
+
+The manifest remembers, for every file in a project, a hash of its extracted
+content, the topic and suggestion it was generated with, and the resulting
+notes. On a rerun only files whose content, topic or suggestion changed need
+a new LLM call. For files split into chunks (groups of notebook cells, or of
+functions and classes) the notes of each chunk are kept under its hash too,
+so editing one cell of a large notebook only regenerates its chunk. Chunk
+notes are recorded as soon as each chunk is done, so a file that fails
+halfway keeps the chunks it finished. Saving is debounced to one write
+every few seconds; flush() writes whatever is pending.
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+DEFAULT_PROJECTS_DIR = ".devnotes_projects"
+# Seconds between writes of the manifest file while notes are being recorded
+DEFAULT_SAVE_INTERVAL = 5.0
+
+def content_hash(text):
+    """SHA-256 hex digest of a piece of text."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def project_manifest_path(main_title, projects_dir=DEFAULT_PROJECTS_DIR):
+    """Manifest file used for a project, derived from its notes title."""
+    slug = re.sub(r'[^a-z0-9]+', '_', main_title.lower()).strip('_') or "notes"
+    return os.path.join(projects_dir, f"{slug}.json")
+
+class ProjectManifest:
+    """
+    Content hashes and generated notes for each file of a project, saved as JSON.
+
+    Args:
+        path: JSON file the manifest is loaded from and saved to
+        save_interval: Records are written at most this often (seconds); call flush() to write the rest
+    """
+
+    def __init__(self, path, save_interval=DEFAULT_SAVE_INTERVAL):
+        self.path = path
+        self.save_interval = save_interval
+        self.entries = {}
+        self._dirty = False
+        self._saved_at = None
+        self._lock = threading.Lock()
+
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.entries = json.load(f).get("files", {})
+
+    def lookup(self, key, content, topic_name, suggestion):
+        """Return stored notes for `key` if its content, topic and suggestion are unchanged, else None."""
+        entry = self.entries.get(key)
+        if (
+            entry is None
+            or entry["content_hash"] != content_hash(content)
+            or entry["topic_name"] != topic_name
+            or entry["suggestion"] != suggestion
+        ):
+            return None
+        # Prefer the user's edited version over the raw model output
+        return entry.get("edited_notes") or entry["notes"]
+
+    def stored_chunks(self, key, chunks, topic_name, suggestion):
+        """Stored notes for each of a file's chunks that is unchanged (None for the others), if its topic and suggestion are too."""
+        entry = self.entries.get(key)
+        if entry is None or entry["topic_name"] != topic_name or entry["suggestion"] != suggestion:
+            return [None] * len(chunks)
+        stored = entry.get("chunk_notes") or {}
+        return [stored.get(content_hash(chunk)) for chunk in chunks]
+
+    def finished(self, key):
+        """Whether `key` has notes for the whole file, not only for some of its chunks."""
+        entry = self.entries.get(key)
+        return entry is not None and entry["content_hash"] is not None
+
+    def record_chunk(self, key, topic_name, suggestion, chunk, notes):
+        """Store the notes of one chunk of a file as soon as they are generated."""
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None or entry["topic_name"] != topic_name or entry["suggestion"] != suggestion:
+                # Only chunks so far: lookup() doesn't match an entry without a content hash
+                entry = self.entries[key] = {
+                    "content_hash": None,
+                    "chunk_notes": {},
+                    "topic_name": topic_name,
+                    "suggestion": suggestion,
+                    "notes": "",
+                    "edited_notes": None,
+                    "updated_at": time.time()
+                }
+            if entry.get("chunk_notes") is None:
+                entry["chunk_notes"] = {}
+            entry["chunk_notes"][content_hash(chunk)] = notes
+            self._save_soon()
+
+    def record(self, key, content, topic_name, suggestion, notes, chunks=None, parts=None):
+        """Store freshly generated notes for a file, and for each of its `chunks` the notes in `parts`."""
+        with self._lock:
+            self.entries[key] = {
+                "content_hash": content_hash(content),
+                "chunk_notes": {content_hash(chunk): part for chunk, part in zip(chunks, parts) if part} if chunks else None,
+                "topic_name": topic_name,
+                "suggestion": suggestion,
+                "notes": notes,
+                "edited_notes": None,
+                "updated_at": time.time()
+            }
+            self._save_soon()
+
+    def record_edit(self, key, notes):
+        """Remember the user's edited notes for a file so reruns keep them."""
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None or notes == (entry.get("edited_notes") or entry["notes"]):
+                return
+            entry["edited_notes"] = notes if notes != entry["notes"] else None
+            self._save()
+
+    def flush(self):
+        """Write records that are still pending to disk."""
+        with self._lock:
+            if self._dirty:
+                self._save()
+
+    def _save_soon(self):
+        # Rewriting the whole file for every record would cost O(n²) I/O on large runs
+        self._dirty = True
+        if self._saved_at is None or time.monotonic() - self._saved_at >= self.save_interval:
+            self._save()
+
+    def _save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # Write to a temporary file first so a crash never leaves a half-written manifest
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": 1, "files": self.entries}, f, ensure_ascii=False, indent=1)
+        os.replace(temp_path, self.path)
+        self._dirty = False
+        self._saved_at = time.monotonic()
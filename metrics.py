@@ -0,0 +1,190 @@
+"""
+Per-file instrumentation for the notes pipeline.
+
+process_files builds one span per file with the time spent reading it,
+rendering prompts, waiting for the first token and on the LLM overall, plus
+the file's tokens before and after preprocessing, input/output tokens (and
+prompt tokens served from the provider's cache) and retries. Spans are handed to a sink: a JSON lines file, a Prometheus
+text endpoint, or memory (for tests and the Streamlit table).
+"""
+
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Span fields holding durations in seconds, exported as Prometheus stages
+STAGE_FIELDS = ("read_time", "render_time", "time_to_first_token", "llm_time", "total_time")
+
+def new_span(file_key, topic_name):
+    """Return an empty span for one file."""
+    return {
+        "file": file_key,
+        "topic": topic_name,
+        "read_time": 0.0,
+        "render_time": 0.0,
+        "time_to_first_token": None,
+        "llm_time": 0.0,
+        "total_time": 0.0,
+        "source_tokens": 0,
+        "preprocessed_tokens": 0,
+        "input_tokens": 0,
+        "output_tokens": 0,
+        "cached_tokens": 0,
+        "calls": [],
+        "retries": 0,
+        "chunks": 0,
+        "cached_calls": 0,
+        "coalesced_calls": 0,
+        "continuations": 0,
+        "reused": False,
+        "duplicate_of": None,
+        "similarity": None,
+        "merged": None,
+        "error": None
+    }
+
+class MemorySink:
+    """Keep every span in a list."""
+
+    def __init__(self):
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def record(self, span):
+        with self._lock:
+            self.spans.append(dict(span))
+
+class JsonLinesSink:
+    """Append each span as one JSON object per line to `path`."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def record(self, span):
+        line = json.dumps(span, ensure_ascii=False)
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+class PrometheusSink:
+    """
+    Aggregate spans into counters exposed in the Prometheus text format.
+
+    Call `serve(port)` to publish them on http://host:port/metrics, or `render()` to get the text.
+    """
+
+    def __init__(self):
+        self.files = {"ok": 0, "reused": 0, "error": 0}
+        self.stage_seconds = {stage: 0.0 for stage in STAGE_FIELDS}
+        self.stage_counts = {stage: 0 for stage in STAGE_FIELDS}
+        self.tokens = {"input": 0, "output": 0, "cached": 0}
+        self.source_tokens = {"raw": 0, "preprocessed": 0}
+        self.saved_calls = {"cached": 0, "coalesced": 0}
+        self.retries = 0
+        self.continuations = 0
+        self._lock = threading.Lock()
+        self._server = None
+
+    def record(self, span):
+        status = "error" if span.get("error") else "reused" if span.get("reused") else "ok"
+        with self._lock:
+            self.files[status] += 1
+            for stage in STAGE_FIELDS:
+                if span.get(stage) is not None:
+                    self.stage_seconds[stage] += span[stage]
+                    self.stage_counts[stage] += 1
+            self.tokens["input"] += span.get("input_tokens", 0)
+            self.tokens["output"] += span.get("output_tokens", 0)
+            self.tokens["cached"] += span.get("cached_tokens", 0)
+            self.source_tokens["raw"] += span.get("source_tokens", 0)
+            self.source_tokens["preprocessed"] += span.get("preprocessed_tokens", 0)
+            self.saved_calls["cached"] += span.get("cached_calls", 0)
+            self.saved_calls["coalesced"] += span.get("coalesced_calls", 0)
+            self.retries += span.get("retries", 0)
+            self.continuations += span.get("continuations", 0)
+
+    def render(self):
+        """Return all metrics in the Prometheus text exposition format."""
+        with self._lock:
+            lines = [
+                "# HELP devnotes_files_total Files processed, by outcome.",
+                "# TYPE devnotes_files_total counter"
+            ]
+            lines += [f'devnotes_files_total{{status="{status}"}} {count}' for status, count in self.files.items()]
+            lines += [
+                "# HELP devnotes_stage_seconds Time spent per pipeline stage.",
+                "# TYPE devnotes_stage_seconds summary"
+            ]
+            for stage in STAGE_FIELDS:
+                lines.append(f'devnotes_stage_seconds_sum{{stage="{stage}"}} {self.stage_seconds[stage]:.6f}')
+                lines.append(f'devnotes_stage_seconds_count{{stage="{stage}"}} {self.stage_counts[stage]}')
+            lines += [
+                "# HELP devnotes_tokens_total Tokens sent to and received from the model (cached = prompt tokens read from the provider's cache).",
+                "# TYPE devnotes_tokens_total counter"
+            ]
+            lines += [f'devnotes_tokens_total{{direction="{direction}"}} {count}' for direction, count in self.tokens.items()]
+            lines += [
+                "# HELP devnotes_source_tokens_total Estimated tokens of the files read, before and after preprocessing.",
+                "# TYPE devnotes_source_tokens_total counter"
+            ]
+            lines += [f'devnotes_source_tokens_total{{stage="{stage}"}} {count}' for stage, count in self.source_tokens.items()]
+            lines += [
+                "# HELP devnotes_saved_calls_total LLM calls answered from the response cache or shared with an identical call in flight.",
+                "# TYPE devnotes_saved_calls_total counter"
+            ]
+            lines += [f'devnotes_saved_calls_total{{reason="{reason}"}} {count}' for reason, count in self.saved_calls.items()]
+            lines += [
+                "# HELP devnotes_retries_total LLM requests retried after throttling or errors.",
+                "# TYPE devnotes_retries_total counter",
+                f"devnotes_retries_total {self.retries}",
+                "# HELP devnotes_continuations_total Requests continuing notes cut off by the output limit.",
+                "# TYPE devnotes_continuations_total counter",
+                f"devnotes_continuations_total {self.continuations}"
+            ]
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port, host="127.0.0.1"):
+        """Serve the metrics on http://host:port/metrics from a background thread."""
+        sink = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = sink.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def close(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+class MultiSink:
+    """Send each span to several sinks."""
+
+    def __init__(self, *sinks):
+        self.sinks = sinks
+
+    def record(self, span):
+        for sink in self.sinks:
+            sink.record(span)
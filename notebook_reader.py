@@ -0,0 +1,186 @@
+"""
+Incremental Jupyter notebook reader.
+
+Notebooks often carry megabytes of base64 plots in their cell outputs. This
+reader scans the notebook JSON in fixed-size blocks and only builds the
+`cell_type` and `source` fields, skipping outputs, attachments and metadata
+without ever holding them in memory.
+"""
+
+import json
+import re
+
+_BLOCK_SIZE = 1 << 16
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_STRUCTURAL = re.compile(r'["\[\]{}]')
+_SCALAR = re.compile(r'[^,\]}\s]*')
+
+class _Scanner:
+    """Pull parser over a text stream that keeps at most one block (plus the current value) buffered."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.buf = ""
+        self.pos = 0
+
+    def _fill(self):
+        """Drop consumed text and read the next block. Returns False at end of input."""
+        data = self.stream.read(_BLOCK_SIZE)
+        if not data:
+            return False
+        self.buf = self.buf[self.pos:] + data
+        self.pos = 0
+        return True
+
+    def _error(self, message):
+        return ValueError(f"Invalid notebook JSON: {message}")
+
+    def peek(self):
+        """Skip whitespace and return the next character ('' at end of input)."""
+        while True:
+            self.pos = _WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise self._error(f"expected {char!r}")
+        self.pos += 1
+
+    def _scan_string(self, collect):
+        """Consume a JSON string; decode and return it only if `collect` is set."""
+        self.expect('"')
+        start = self.pos
+        parts = []
+        while True:
+            # str.find is much faster than a regex for skipping long base64 strings
+            quote = self.buf.find('"', self.pos)
+            escape = self.buf.find("\\", self.pos, quote if quote != -1 else len(self.buf))
+            if escape != -1 and escape + 1 < len(self.buf):
+                # Skip the escaped character
+                self.pos = escape + 2
+                continue
+
+            if escape != -1 or quote == -1:
+                # Need more input; keep what we have (if collecting) and refill
+                stop = escape if escape != -1 else len(self.buf)
+                if collect:
+                    parts.append(self.buf[start:stop])
+                self.pos = stop
+                if not self._fill():
+                    raise self._error("unterminated string")
+                start = self.pos
+                continue
+
+            self.pos = quote + 1
+            if collect:
+                parts.append(self.buf[start:quote])
+                return json.loads('"' + "".join(parts) + '"')
+            return None
+
+    def read_string(self):
+        return self._scan_string(collect=True)
+
+    def skip_value(self):
+        """Consume any JSON value without building it."""
+        char = self.peek()
+        if char == '"':
+            self._scan_string(collect=False)
+            return
+
+        if char in "{[":
+            depth = 0
+            while True:
+                match = _STRUCTURAL.search(self.buf, self.pos)
+                if match is None:
+                    self.pos = len(self.buf)
+                    if not self._fill():
+                        raise self._error("unterminated container")
+                    continue
+                if match.group() == '"':
+                    self.pos = match.start()
+                    self._scan_string(collect=False)
+                    continue
+                self.pos = match.end()
+                if match.group() in "{[":
+                    depth += 1
+                else:
+                    depth -= 1
+                    if depth == 0:
+                        return
+
+        # Number, true, false or null
+        while True:
+            match = _SCALAR.match(self.buf, self.pos)
+            if match.end() < len(self.buf) or not self._fill():
+                self.pos = match.end()
+                return
+
+    def read_source(self):
+        """Read a cell `source` field, which nbformat allows as a string or a list of strings."""
+        char = self.peek()
+        if char == '"':
+            return self.read_string()
+        if char != "[":
+            self.skip_value()
+            return ""
+        return "".join(self.read_string() for _ in self.iter_array())
+
+    def iter_keys(self):
+        """Iterate over the keys of an object; the caller must consume each value."""
+        self.expect("{")
+        if self.peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            key = self.read_string()
+            self.expect(":")
+            yield key
+            char = self.peek()
+            self.pos += 1
+            if char == "}":
+                return
+            if char != ",":
+                raise self._error("expected ',' or '}'")
+
+    def iter_array(self):
+        """Iterate over the elements of an array; the caller must consume each element."""
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield
+            char = self.peek()
+            self.pos += 1
+            if char == "]":
+                return
+            if char != ",":
+                raise self._error("expected ',' or ']'")
+
+def iter_notebook_cells(stream):
+    """
+    Yield (cell_type, source) for every cell of a notebook read from a text stream.
+
+    Outputs, attachments and metadata are skipped without being parsed into objects.
+    """
+    scanner = _Scanner(stream)
+    for key in scanner.iter_keys():
+        if key != "cells":
+            scanner.skip_value()
+            continue
+
+        for _ in scanner.iter_array():
+            cell_type = None
+            source = ""
+            for cell_key in scanner.iter_keys():
+                if cell_key == "cell_type":
+                    cell_type = scanner.read_string()
+                elif cell_key == "source":
+                    source = scanner.read_source()
+                else:
+                    scanner.skip_value()
+            yield cell_type, source
@@ -0,0 +1,200 @@
+"""
+Token-reducing clean-up of source code before it is put into a prompt.
+
+Files often carry text that costs tokens without teaching anything: inline
+data literals and base64 blobs, the same imports repeated in every notebook
+cell, duplicated cells, long blocks of commented-out code and trailing
+whitespace. A Preprocessor collapses those to short placeholders and leaves
+the code the notes are about untouched.
+"""
+
+import re
+
+from chunking import get_extension
+
+DEFAULT_MAX_LITERAL_CHARS = 200
+DEFAULT_MAX_DATA_LINES = 8
+DEFAULT_MIN_COMMENT_BLOCK_LINES = 5
+
+COMMENT_MARKERS = {"py": "#", "ipynb": "#", "js": "//", "java": "//", "cpp": "//", "c": "//"}
+
+# Single-line string literals (the body is checked against the length limit afterwards)
+_STRING_PATTERN = re.compile(r'(["\'])((?:\\.|(?!\1)[^\\\n])*)\1')
+_BASE64_PATTERN = re.compile(r'(?:data:[\w/+.-]+;base64,)?[A-Za-z0-9+/=_-]+')
+# Long comma-separated runs of numbers, e.g. the items of an inline array
+_NUMBER_RUN_PATTERN = re.compile(r'(?:[-+]?\d[\d.eE+-]*\s*,\s*){20,}[-+]?\d[\d.eE+-]*')
+_NUMBER_PATTERN = re.compile(r'[-+]?\d[\d.eE+-]*')
+# What is left of a line of pure data once its strings are removed
+_DATA_LINE_PATTERN = re.compile(r'^[\s\d.,:+\-eE\[\](){}]*,[\s\d.,:+\-eE\[\](){}]*$')
+_IMPORT_PATTERN = re.compile(r'^(?:import\s+\S|from\s+\S+\s+import\s+[^(\\]+$)')
+_HEADING_PATTERN = re.compile(r'^\s{0,3}(#{1,6})\s+(.+?)\s*#*\s*$')
+# Comment text that reads like a line of code rather than an explanation
+_CODE_LIKE_PATTERN = re.compile(
+    r'^(?:import|from|def|class|return|if|elif|else|for|while|try|except|with|print|'
+    r'const|let|var|function|public|private|static|int|void|#include)\b'
+    r'|[;{}):\]]$'
+    r'|^[\w.\[\]]+\s*[-+*/]?=\s*\S'
+    r'|^[\w.]+\(.*\)$'
+)
+
+def _collapse_string(match, max_chars):
+    quote, body = match.group(1), match.group(2)
+    if len(body) <= max_chars:
+        return match.group(0)
+    kind = "base64 data" if _BASE64_PATTERN.fullmatch(body) else "string"
+    return f"{quote}<{kind}, {len(body):,} chars>{quote}"
+
+def _collapse_numbers(match):
+    numbers = _NUMBER_PATTERN.findall(match.group(0))
+    return f"{', '.join(numbers[:5])}, ... (+{len(numbers) - 5} values)"
+
+def _is_data_line(line):
+    stripped = _STRING_PATTERN.sub("0", line).strip()
+    return bool(stripped) and bool(_DATA_LINE_PATTERN.match(stripped))
+
+class Preprocessor:
+    """
+    Shrinks code before prompting without changing what it teaches.
+
+    Args:
+        collapse_literals: Replace long string literals, base64 blobs, long number runs and runs of data rows with placeholders
+        max_literal_chars: String literals longer than this are collapsed
+        max_data_lines: Runs of more data-only lines than this keep their first and last rows
+        dedupe_cells: Drop notebook cells identical to an earlier one, and imports already made in an earlier cell
+        strip_commented_code: Remove blocks of commented-out code (explanatory comments are kept)
+        min_comment_block_lines: Comment blocks shorter than this are always kept
+        markdown_headings: Keep notebook markdown headings as comments above the following code cell
+    """
+
+    def __init__(
+        self,
+        collapse_literals=True,
+        max_literal_chars=DEFAULT_MAX_LITERAL_CHARS,
+        max_data_lines=DEFAULT_MAX_DATA_LINES,
+        dedupe_cells=True,
+        strip_commented_code=False,
+        min_comment_block_lines=DEFAULT_MIN_COMMENT_BLOCK_LINES,
+        markdown_headings=False
+    ):
+        self.collapse_literals = collapse_literals
+        self.max_literal_chars = max_literal_chars
+        self.max_data_lines = max_data_lines
+        self.dedupe_cells = dedupe_cells
+        self.strip_commented_code = strip_commented_code
+        self.min_comment_block_lines = min_comment_block_lines
+        self.markdown_headings = markdown_headings
+
+    def source(self, file_path, content):
+        """Return the cleaned-up content of a source file."""
+        marker = COMMENT_MARKERS.get(get_extension(str(file_path)))
+        lines = [line.rstrip() for line in content.splitlines()]
+
+        if self.strip_commented_code and marker:
+            lines = self._strip_commented_code(lines, marker)
+        if self.collapse_literals:
+            lines = [self._collapse_line(line) for line in lines]
+            lines = self._collapse_data_runs(lines, marker)
+
+        # Trailing whitespace is gone; also squeeze runs of blank lines
+        text = re.sub(r'\n{3,}', "\n\n", "\n".join(lines)).strip("\n")
+        return text + "\n" if text else ""
+
+    def notebook(self, file_path, cells):
+        """
+        Return the cleaned-up code cells of a notebook.
+
+        `cells` are (cell_type, source) pairs as read from the notebook. With
+        `markdown_headings`, headings from markdown cells are prepended as
+        comments to the next code cell so the notes can follow the notebook's sections.
+        """
+        code_cells = []
+        seen_cells = set()
+        seen_imports = set()
+        headings = []
+
+        for cell_type, source in cells:
+            if cell_type == "markdown" and self.markdown_headings:
+                headings += [
+                    f"# {'Section' if len(match.group(1)) <= 2 else 'Subsection'}: {match.group(2)}"
+                    for match in map(_HEADING_PATTERN.match, source.splitlines())
+                    if match and len(match.group(2)) <= 80
+                ]
+                continue
+            if cell_type != "code":
+                continue
+
+            if self.dedupe_cells:
+                normalized = "\n".join(line.rstrip() for line in source.strip().splitlines())
+                if normalized in seen_cells:
+                    continue
+                seen_cells.add(normalized)
+
+                kept = []
+                for line in source.splitlines():
+                    if _IMPORT_PATTERN.match(line):
+                        if line.strip() in seen_imports:
+                            continue
+                        seen_imports.add(line.strip())
+                    kept.append(line)
+                source = "\n".join(kept)
+
+            cell = self.source(file_path, source)
+            if not cell.strip():
+                continue
+            if headings:
+                cell = "\n".join(headings) + "\n" + cell
+                headings = []
+            code_cells.append(cell.rstrip("\n"))
+        return code_cells
+
+    def _collapse_line(self, line):
+        line = _STRING_PATTERN.sub(lambda match: _collapse_string(match, self.max_literal_chars), line)
+        if len(line) > self.max_literal_chars:
+            line = _NUMBER_RUN_PATTERN.sub(_collapse_numbers, line)
+        return line
+
+    def _collapse_data_runs(self, lines, marker):
+        """Keep the first rows and the last row of long runs of data-only lines."""
+        result = []
+        run = []
+        for line in lines + [None]:
+            if line is not None and _is_data_line(line):
+                run.append(line)
+                continue
+
+            if len(run) > self.max_data_lines:
+                indent = run[3][:len(run[3]) - len(run[3].lstrip())]
+                note = f"... {len(run) - 4} more rows of data ..."
+                result += run[:3] + [f"{indent}{marker} {note}" if marker else f"{indent}{note}"] + run[-1:]
+            else:
+                result += run
+            run = []
+            if line is not None:
+                result.append(line)
+        return result
+
+    def _strip_commented_code(self, lines, marker):
+        """Drop long comment blocks made up mostly of code, leaving a one-line note in their place."""
+        result = []
+        block = []
+        for line in lines + [None]:
+            if line is not None and line.lstrip().startswith(marker):
+                block.append(line)
+                continue
+
+            # Explanatory comments around the commented-out code are kept
+            code_like = [
+                k for k, comment in enumerate(block)
+                if _CODE_LIKE_PATTERN.search(comment.lstrip()[len(marker):].strip())
+            ]
+            first, last = (code_like[0], code_like[-1] + 1) if code_like else (0, 0)
+            if last - first >= self.min_comment_block_lines and len(code_like) >= 0.6 * (last - first):
+                indent = block[first][:len(block[first]) - len(block[first].lstrip())]
+                note = f"{indent}{marker} ({last - first} lines of commented-out code removed)"
+                result += block[:first] + [note] + block[last:]
+            else:
+                result += block
+            block = []
+            if line is not None:
+                result.append(line)
+        return result
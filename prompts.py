@@ -2,28 +2,17 @@
 Prompt templates for the DevNotes-AI application.
 """
 
-from langchain_core.prompts import PromptTemplate
+from langchain_core.messages import SystemMessage
+from langchain_core.prompts import ChatPromptTemplate, HumanMessagePromptTemplate
 
-# Notes generation template
-notes_template = PromptTemplate(
-    template="""
+# Fixed instructions, identical for every file. Keeping them in their own
+# system message gives providers a stable prefix they can cache.
+NOTES_SYSTEM_PROMPT = """
 You are an expert technical writer and educator who generates structured, comprehensive, and easy-to-understand study notes from code files. 
 Your task is to create "Detailed Notes" that explain each concept covered in the code step by step.
 
 ---
 
-### CONTEXT
-
-Main Notes Title: {main_title}
-List of Completed Topics: {previous_topics}
-Current Topic: {topic_name}
-Notes Style: Detailed
-User Suggestion: {suggestion}
-Code File:
-{file}
-
----
-
 ### OBJECTIVE
 
 Generate *detailed and educational* Markdown notes for the provided code. 
@@ -54,7 +43,7 @@ These notes should read like a mini textbook or developer guide.
    - For every example, show both the **code** and the **expected output or reasoning** in the comment.
    - Include short "Key Takeaways" or "Summary" sections for each major block.
    - Maintain logical flow and continuity from previously completed topics if provided.
-   - Avoid repeating already-covered concepts from `{previous_topics}` unless needed for context.
+   - Avoid repeating concepts already covered in the Earlier Notes unless needed for context; refer back to them instead.
    - Do not just summarize the code — **teach** what it's doing and *why* it matters.
 
 5. **Tone**
@@ -68,7 +57,68 @@ These notes should read like a mini textbook or developer guide.
    - Do not include phrases like "Here are your notes" or "As per the code below."
    - Ensure consistent spacing, indentation, and hierarchy.
 
-""",
-    input_variables=['main_title', 'previous_topics', 'topic_name', 'suggestion', 'file']
-)
+"""
+
+# Everything that changes from file to file
+NOTES_USER_TEMPLATE = """
+### CONTEXT
+
+Main Notes Title: {main_title}
+Earlier Notes:
+{previous_topics}
+
+Current Topic: {topic_name}
+Notes Style: Detailed
+User Suggestion: {suggestion}
+Code File:
+{file}
+"""
+
+# Sent after the same system message when notes were cut off by the output
+# limit; only the end of the notes is included, not the code file again
+CONTINUATION_USER_TEMPLATE = """
+### CONTINUATION
+
+Main Notes Title: {main_title}
+Current Topic: {topic_name}
+
+Your notes for this topic were cut off by the output limit. Continue them from exactly where they stop.
+Don't repeat anything already written, don't restart the topic and don't add a heading for the continuation.{fence_hint}
+
+The notes so far end with:
+{tail}"""
+
+def _system_message(cache_control):
+    if cache_control:
+        return SystemMessage(content=[
+            {"type": "text", "text": NOTES_SYSTEM_PROMPT, "cache_control": {"type": "ephemeral"}}
+        ])
+    return SystemMessage(content=NOTES_SYSTEM_PROMPT)
+
+def build_notes_template(cache_control=False):
+    """
+    Build the notes prompt as a static system message followed by the per-file user message.
+
+    With `cache_control` the system message is marked as an Anthropic
+    prompt-cache breakpoint; other providers cache the stable prefix on their own.
+    """
+    return ChatPromptTemplate.from_messages([
+        _system_message(cache_control),
+        HumanMessagePromptTemplate.from_template(NOTES_USER_TEMPLATE)
+    ])
+
+def build_continuation_template(cache_control=False):
+    """
+    Build the prompt continuing truncated notes: the notes system message
+    (so the provider's cached prefix is reused) and the tail of the notes.
+    """
+    return ChatPromptTemplate.from_messages([
+        _system_message(cache_control),
+        HumanMessagePromptTemplate.from_template(CONTINUATION_USER_TEMPLATE)
+    ])
+
+# Notes generation template
+notes_template = build_notes_template()
 
+# Continuation of notes cut off by the output limit
+continuation_template = build_continuation_template()
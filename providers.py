@@ -0,0 +1,121 @@
+"""
+Lazy registry of AI providers.
+
+Each provider names the module and class of its LangChain chat model
+instead of importing it, so starting the app or the CLI doesn't pay for
+every SDK: a backend is imported the first time a model of that provider
+is created. Other packages can add providers through the
+`devnotes_ai.providers` entry point group, e.g. in their pyproject.toml:
+
+    [project.entry-points."devnotes_ai.providers"]
+    Mistral = "devnotes_mistral:provider"
+
+where `provider` is a Provider instance. Entry points are only looked up
+for names that aren't built in.
+"""
+
+import importlib
+import threading
+from importlib.metadata import entry_points
+
+ENTRY_POINT_GROUP = "devnotes_ai.providers"
+
+class Provider:
+    """
+    How to build chat models of one provider.
+
+    Args:
+        name: Name shown to users and passed as `provider`
+        module: Module the chat model class is imported from on first use
+        class_name: Chat model class in `module`
+        api_key_argument: Keyword the class takes the API key as
+        default_model: Model used when none is given
+        api_key_env: Environment variable the CLI reads the API key from
+        client_defaults: Keyword arguments passed to every client unless overridden
+        cache_control: The prompt prefix can be marked with cache_control (Claude)
+    """
+
+    def __init__(self, name, module, class_name, api_key_argument, default_model=None, api_key_env=None,
+                 client_defaults=None, cache_control=False):
+        self.name = name
+        self.module = module
+        self.class_name = class_name
+        self.api_key_argument = api_key_argument
+        self.default_model = default_model
+        self.api_key_env = api_key_env
+        self.client_defaults = client_defaults or {}
+        self.cache_control = cache_control
+        self.model_class = None
+
+    def load(self):
+        """Import and return the chat model class (only the first call imports anything)."""
+        if self.model_class is None:
+            self.model_class = getattr(importlib.import_module(self.module), self.class_name)
+        return self.model_class
+
+    def create(self, model_name, api_key, **client_options):
+        """Build a new chat model client."""
+        options = dict(self.client_defaults, **client_options)
+        options[self.api_key_argument] = api_key
+        return self.load()(model=model_name, **options)
+
+    def owns(self, ai_model):
+        """Whether `ai_model` is a model of this provider; False while its SDK hasn't been imported."""
+        return self.model_class is not None and isinstance(ai_model, self.model_class)
+
+BUILTIN_PROVIDERS = {
+    "Gemini": Provider(
+        "Gemini", "langchain_google_genai", "ChatGoogleGenerativeAI", "google_api_key",
+        default_model="gemini-2.5-flash", api_key_env="GOOGLE_API_KEY"
+    ),
+    "OpenAI": Provider(
+        "OpenAI", "langchain_openai", "ChatOpenAI", "openai_api_key",
+        default_model="gpt-4o", api_key_env="OPENAI_API_KEY",
+        # Ask for token usage on streamed responses too, so cached tokens can be reported
+        client_defaults={"stream_usage": True}
+    ),
+    "Claude": Provider(
+        "Claude", "langchain_anthropic", "ChatAnthropic", "anthropic_api_key",
+        default_model="claude-sonnet-4-5-20250929", api_key_env="ANTHROPIC_API_KEY",
+        cache_control=True
+    ),
+}
+
+_providers = dict(BUILTIN_PROVIDERS)
+_lock = threading.Lock()
+
+def register_provider(provider):
+    """Add or replace a provider by its name."""
+    with _lock:
+        _providers[provider.name] = provider
+
+def _plugin_entry_points():
+    return {entry_point.name: entry_point for entry_point in entry_points(group=ENTRY_POINT_GROUP)}
+
+def available_providers():
+    """Names of the built-in, registered and installed plugin providers (plugins are not imported)."""
+    with _lock:
+        names = list(_providers)
+    return names + [name for name in _plugin_entry_points() if name not in names]
+
+def get_provider(name):
+    """Return the provider called `name`, loading it from its entry point if it is a plugin."""
+    with _lock:
+        provider = _providers.get(name)
+    if provider is not None:
+        return provider
+
+    entry_point = _plugin_entry_points().get(name)
+    if entry_point is None:
+        raise ValueError(f"Unsupported provider: {name}")
+    provider = entry_point.load()
+    if not isinstance(provider, Provider):
+        raise ValueError(f"Entry point {entry_point.value} for {name} is not a Provider")
+    with _lock:
+        return _providers.setdefault(name, provider)
+
+def supports_cache_control(ai_model):
+    """Whether the model's provider accepts cache_control breakpoints in the prompt."""
+    with _lock:
+        providers = list(_providers.values())
+    return any(provider.cache_control and provider.owns(ai_model) for provider in providers)
@@ -0,0 +1,283 @@
+"""
+Provider-aware request scheduling for the notes pipeline.
+
+Every LLM call goes through a RequestScheduler, which keeps requests/min and
+tokens/min under the provider's limits with token buckets, retries throttled
+or overloaded requests with jittered exponential backoff (honoring
+Retry-After), and adapts how many requests run at once AIMD-style: one more
+slot after each window of successes, half as many after a 429.
+"""
+
+import email.utils
+import random
+import re
+import threading
+import time
+from datetime import timezone
+
+# Conservative default limits for the entry-level tier of each provider
+PROVIDER_LIMITS = {
+    "Gemini": {"requests_per_minute": 10, "tokens_per_minute": 250000},
+    "OpenAI": {"requests_per_minute": 500, "tokens_per_minute": 30000},
+    "Claude": {"requests_per_minute": 50, "tokens_per_minute": 30000},
+}
+
+# Status codes that mean "slow down" and shrink the concurrency limit
+THROTTLE_STATUS_CODES = {429, 529}
+# Status codes worth retrying after a pause
+RETRYABLE_STATUS_CODES = THROTTLE_STATUS_CODES | {500, 502, 503, 504}
+
+_THROTTLE_MESSAGE_PATTERN = re.compile(r'\b429\b|rate.?limit|resource.?exhausted|quota|overloaded', re.IGNORECASE)
+_RETRY_DELAY_PATTERN = re.compile(r'retry(?:[ _-]?delay)?\W+(?:in\W+|seconds:\s*)?(\d+(?:\.\d+)?)\s*s', re.IGNORECASE)
+
+class TokenBucket:
+    """
+    Token bucket refilled at `per_minute` tokens per minute, holding at most one minute's worth.
+
+    Reservations may push the bucket into debt; later callers wait until it is paid off.
+    """
+
+    def __init__(self, per_minute, clock=time.monotonic):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.clock = clock
+        self.tokens = self.capacity
+        self.updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount):
+        """Take `amount` tokens and return how many seconds the caller must wait before using them."""
+        amount = min(amount, self.capacity)
+        with self._lock:
+            self._refill(self.clock())
+            self.tokens -= amount
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def charge(self, amount):
+        """Take tokens that were already spent (e.g. output tokens) without waiting."""
+        with self._lock:
+            self._refill(self.clock())
+            self.tokens -= amount
+
+def status_code_of(error):
+    """Find an HTTP status code on an exception or anything it wraps, or None."""
+    while error is not None:
+        for attribute in ("status_code", "code", "http_status"):
+            value = getattr(error, attribute, None)
+            value = value() if callable(value) else value
+            if isinstance(value, int) and 100 <= value < 600:
+                return value
+        response = getattr(error, "response", None)
+        if isinstance(getattr(response, "status_code", None), int):
+            return response.status_code
+        error = error.__cause__ or error.__context__
+    return None
+
+def is_throttle_error(error):
+    """True if an exception means the provider is rate limiting or overloaded."""
+    status = status_code_of(error)
+    if status is not None:
+        return status in THROTTLE_STATUS_CODES
+    return bool(_THROTTLE_MESSAGE_PATTERN.search(str(error)))
+
+def is_retryable_error(error):
+    """True if an exception is worth retrying after a pause."""
+    status = status_code_of(error)
+    if status is not None:
+        return status in RETRYABLE_STATUS_CODES
+    return is_throttle_error(error) or isinstance(error, (ConnectionError, TimeoutError))
+
+def retry_after_seconds(error):
+    """Delay requested by the server through Retry-After headers or a retry hint in the message, or None."""
+    while error is not None:
+        headers = getattr(getattr(error, "response", None), "headers", None) or {}
+        if headers.get("retry-after-ms"):
+            try:
+                return float(headers["retry-after-ms"]) / 1000
+            except ValueError:
+                pass
+        value = headers.get("retry-after")
+        if value:
+            try:
+                return max(0.0, float(value))
+            except ValueError:
+                try:
+                    parsed = email.utils.parsedate_to_datetime(value)
+                except (TypeError, ValueError):
+                    # Malformed dates raise on Python 3.10+ (older versions return None)
+                    parsed = None
+                if parsed is not None:
+                    # An HTTP date without a zone is GMT, not local time
+                    if parsed.tzinfo is None:
+                        parsed = parsed.replace(tzinfo=timezone.utc)
+                    return max(0.0, parsed.timestamp() - time.time())
+        match = _RETRY_DELAY_PATTERN.search(str(error))
+        if match:
+            return float(match.group(1))
+        error = error.__cause__ or error.__context__
+    return None
+
+class RequestScheduler:
+    """
+    Rate limits, retries and adaptive concurrency for calls to one provider.
+
+    Args:
+        requests_per_minute: Request budget (None = unlimited)
+        tokens_per_minute: Input plus output token budget (None = unlimited)
+        max_concurrency: Upper bound for requests in flight
+        min_concurrency: Concurrency never drops below this after throttling
+        max_retries: Retries per request before the error is raised
+        base_delay: First backoff delay in seconds, doubled on every retry
+        max_delay: Longest single backoff delay in seconds
+    """
+
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None, max_concurrency=8, min_concurrency=1,
+                 max_retries=5, base_delay=1.0, max_delay=60.0, sleep=time.sleep, clock=time.monotonic):
+        self.request_bucket = TokenBucket(requests_per_minute, clock) if requests_per_minute else None
+        self.token_bucket = TokenBucket(tokens_per_minute, clock) if tokens_per_minute else None
+        self.max_concurrency = max(1, max_concurrency)
+        self.min_concurrency = max(1, min(min_concurrency, self.max_concurrency))
+        self.concurrency_limit = float(self.max_concurrency)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.sleep = sleep
+        self.in_flight = 0
+        self.retries = 0
+        self.throttled = 0
+        self._condition = threading.Condition()
+
+    @classmethod
+    def for_provider(cls, provider, requests_per_minute=None, tokens_per_minute=None, **options):
+        """Build a scheduler with the default limits of `provider`, overriding whichever limits are given."""
+        limits = PROVIDER_LIMITS.get(provider, {})
+        return cls(
+            requests_per_minute=requests_per_minute or limits.get("requests_per_minute"),
+            tokens_per_minute=tokens_per_minute or limits.get("tokens_per_minute"),
+            **options
+        )
+
+    def run(self, request, input_tokens=0, count_output=None, stats=None):
+        """
+        Call `request()` within the limits and return its result, retrying throttled or failed attempts.
+
+        Args:
+            request: Zero-argument function making one LLM call
+            input_tokens: Estimated prompt tokens, reserved before the call
+            count_output: Optional function mapping the result to its output token count
+            stats: Optional dict whose `retries` counter is increased on every retry
+        """
+        attempt = 0
+        while True:
+            self._acquire(input_tokens)
+            try:
+                result = request()
+            except Exception as error:
+                self._release()
+                attempt = self._before_retry(error, attempt, stats)
+                continue
+            self._release()
+            self._on_success()
+            if count_output and self.token_bucket:
+                self.token_bucket.charge(count_output(result))
+            return result
+
+    def stream(self, open_stream, input_tokens=0, count_output=None, stats=None):
+        """
+        Yield chunks from `open_stream()` within the limits.
+
+        Failures before the first chunk are retried like `run`; once text has
+        been yielded an error is raised, since the caller already used it.
+        """
+        attempt = 0
+        while True:
+            self._acquire(input_tokens)
+            chunks = []
+            failure = None
+            try:
+                for chunk in open_stream():
+                    chunks.append(chunk)
+                    yield chunk
+            except Exception as error:
+                if chunks:
+                    raise
+                failure = error
+            finally:
+                # Also runs when the caller stops reading early
+                self._release()
+            if failure is not None:
+                attempt = self._before_retry(failure, attempt, stats)
+                continue
+            self._on_success()
+            if count_output and self.token_bucket:
+                self.token_bucket.charge(count_output("".join(chunks)))
+            return
+
+    def backoff_delay(self, attempt):
+        """Jittered exponential backoff ("full jitter") for the given retry attempt."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def stats(self):
+        """Return retry and throttle counters and the current concurrency limit."""
+        with self._condition:
+            return {
+                "retries": self.retries,
+                "throttled": self.throttled,
+                "concurrency_limit": int(self.concurrency_limit),
+                "in_flight": self.in_flight
+            }
+
+    def _before_retry(self, error, attempt, stats):
+        """Raise `error` if it shouldn't be retried, otherwise wait and return the next attempt number."""
+        if attempt >= self.max_retries or not is_retryable_error(error):
+            raise error
+
+        if is_throttle_error(error):
+            self._on_throttle()
+        with self._condition:
+            self.retries += 1
+        if stats is not None:
+            stats['retries'] = stats.get('retries', 0) + 1
+
+        delay = retry_after_seconds(error)
+        if delay is None:
+            delay = self.backoff_delay(attempt)
+        print(f"⏳ Request failed ({error.__class__.__name__}), retrying in {delay:.1f}s")
+        self.sleep(min(delay, self.max_delay))
+        return attempt + 1
+
+    def _acquire(self, input_tokens):
+        # Wait for the rate budget first, so a call paced by the buckets doesn't hold an idle slot
+        wait = 0.0
+        if self.request_bucket:
+            wait = max(wait, self.request_bucket.reserve(1))
+        if self.token_bucket and input_tokens:
+            wait = max(wait, self.token_bucket.reserve(input_tokens))
+        if wait > 0:
+            self.sleep(wait)
+
+        with self._condition:
+            while self.in_flight >= int(self.concurrency_limit):
+                self._condition.wait()
+            self.in_flight += 1
+
+    def _release(self):
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def _on_success(self):
+        # Additive increase: about one extra slot per window of successful requests
+        with self._condition:
+            self.concurrency_limit = min(self.max_concurrency, self.concurrency_limit + 1 / self.concurrency_limit)
+            self._condition.notify_all()
+
+    def _on_throttle(self):
+        # Multiplicative decrease
+        with self._condition:
+            self.throttled += 1
+            self.concurrency_limit = max(self.min_concurrency, self.concurrency_limit / 2)
@@ -0,0 +1,162 @@
+"""
+Bounded context from notes already written in a run.
+
+Instead of listing every completed topic in every prompt, the notes of
+finished files are split into sections and indexed with BM25. Each new file
+gets the few sections most relevant to its code, plus the names of the most
+recent topics, trimmed to a fixed token budget, so prompt size stays the
+same however many files a batch has.
+"""
+
+import math
+import re
+import threading
+from bisect import bisect_left
+from collections import Counter, defaultdict
+
+from chunking import estimate_tokens
+
+DEFAULT_CONTEXT_TOKENS = 400
+DEFAULT_MAX_SECTIONS = 3
+
+# Query terms taken from a file: its most frequent distinct words
+MAX_QUERY_TERMS = 64
+
+_WORD_PATTERN = re.compile(r'[A-Za-z][A-Za-z0-9]+')
+_HEADING_PATTERN = re.compile(r'^#{1,6}\s+(.*)$', re.MULTILINE)
+_CODE_BLOCK_PATTERN = re.compile(r'```.*?(?:```|\Z)', re.DOTALL)
+
+_STOPWORDS = frozenset("""
+a an and are as at be but by can do for from has have if in into is it its of on or so that the their then
+there these this to was we were what when which while will with you your not all any each our how why
+def return import print self none true false class else elif try except pass lambda var let const new
+""".split())
+
+def tokenize(text):
+    """Lower-case words of a text; snake_case and camelCase identifiers are split into their parts."""
+    words = []
+    for word in _WORD_PATTERN.findall(text.replace("_", " ")):
+        for part in re.findall(r'[A-Z]?[a-z0-9]+|[A-Z]+(?![a-z])', word) or [word]:
+            part = part.lower()
+            if len(part) > 1 and part not in _STOPWORDS:
+                words.append(part)
+    return words
+
+def split_sections(notes):
+    """Split Markdown notes into (heading, body) sections at their headings; code blocks are dropped."""
+    notes = _CODE_BLOCK_PATTERN.sub(" ", notes)
+    matches = list(_HEADING_PATTERN.finditer(notes))
+    sections = []
+    if not matches or matches[0].start() > 0:
+        sections.append(("", notes[:matches[0].start()] if matches else notes))
+    for k, match in enumerate(matches):
+        end = matches[k + 1].start() if k + 1 < len(matches) else len(notes)
+        sections.append((match.group(1).strip(" #*"), notes[match.end():end]))
+    return [(heading, " ".join(body.split())) for heading, body in sections if body.strip()]
+
+class NotesIndex:
+    """
+    BM25 index over the sections of notes generated so far; safe to use from several threads.
+
+    Args:
+        k1: Term frequency saturation
+        b: Length normalisation
+    """
+
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.sections = []
+        self._postings = defaultdict(list)
+        # Number of sections and their total length after each added file
+        self._files = [(0, 0)]
+        self._lock = threading.Lock()
+
+    @property
+    def files(self):
+        """Number of files added so far."""
+        return len(self._files) - 1
+
+    def add(self, topic_name, notes):
+        """Index the sections of one file's notes."""
+        sections = []
+        for heading, body in split_sections(notes):
+            terms = Counter(tokenize(f"{topic_name} {heading} {body}"))
+            if terms:
+                sections.append((heading, body, terms))
+        with self._lock:
+            total_length = self._files[-1][1]
+            for heading, body, terms in sections:
+                section_id = len(self.sections)
+                length = sum(terms.values())
+                self.sections.append({"topic": topic_name, "heading": heading, "text": body, "length": length})
+                total_length += length
+                for term, count in terms.items():
+                    self._postings[term].append((section_id, count))
+            self._files.append((len(self.sections), total_length))
+
+    def search(self, query, limit=DEFAULT_MAX_SECTIONS, files=None):
+        """
+        Return up to `limit` sections ranked by their BM25 score for the query terms.
+
+        With `files`, only the sections of the first `files` files added are
+        searched, as if the index held nothing else.
+        """
+        with self._lock:
+            count, total_length = self._files[-1 if files is None else min(files, self.files)]
+            if not count:
+                return []
+            average_length = total_length / count
+            scores = defaultdict(float)
+            for term in query:
+                # Postings are in section order, so the searched files' come first
+                postings = self._postings.get(term, [])
+                postings = postings[:bisect_left(postings, (count,))]
+                if not postings:
+                    continue
+                idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for section_id, frequency in postings:
+                    length = self.sections[section_id]["length"]
+                    norm = self.k1 * (1 - self.b + self.b * length / average_length)
+                    scores[section_id] += idf * frequency * (self.k1 + 1) / (frequency + norm)
+            ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:limit]
+            return [self.sections[section_id] for section_id, _ in ranked]
+
+    def context(self, topic_name, content, earlier_topics, budget=DEFAULT_CONTEXT_TOKENS, max_sections=DEFAULT_MAX_SECTIONS, files=None):
+        """
+        Build the prompt context for a file within `budget` tokens.
+
+        It names the most recent earlier topics (with a count of the rest)
+        and quotes the start of the sections most relevant to the file's
+        topic and code, from the first `files` files added (all by default).
+        """
+        # A quarter of the budget for topic names, the rest for related sections
+        names = []
+        for name in reversed(earlier_topics):
+            if estimate_tokens(", ".join(names + [name])) > budget // 4:
+                break
+            names.append(name)
+        names.reverse()
+        lines = []
+        if names:
+            earlier = len(earlier_topics) - len(names)
+            lines.append(", ".join(names) + (f" (and {earlier} earlier topics)" if earlier else ""))
+        else:
+            lines.append("None yet")
+
+        frequent = Counter(tokenize(content)).most_common(MAX_QUERY_TERMS)
+        query = set(tokenize(topic_name)) | {term for term, _ in frequent}
+        sections = self.search(query, max_sections, files)
+        if sections:
+            lines.append("Related sections already written (don't re-explain these, refer back to them):")
+            remaining = budget - estimate_tokens("\n".join(lines))
+            for k, section in enumerate(sections):
+                share = remaining // (len(sections) - k)
+                label = f"- {section['topic']}" + (f" > {section['heading']}" if section['heading'] else "") + ": "
+                room = (share - estimate_tokens(label)) * 4
+                if room <= 40:
+                    break
+                text = section["text"] if len(section["text"]) <= room else section["text"][:room - 3].rsplit(" ", 1)[0] + "..."
+                lines.append(label + text)
+                remaining -= estimate_tokens(lines[-1])
+        return "\n".join(lines)
@@ -0,0 +1,460 @@
+"""
+Headless HTTP service for generating notes.
+
+One server runs batches for many users: jobs wait in a queue for a slot on
+the JobManager's worker pool, every LLM call to a provider and model goes
+through one shared RequestScheduler, and identical prompts in flight at the
+same time (two users processing the same course files) are coalesced into
+one call. Progress, streamed text and finished files are pushed to clients
+as server-sent events. `python main.py --server URL` and the Streamlit app's
+"Notes Server" setting use it as thin clients (see client.py).
+
+Endpoints:
+    POST /jobs              Queue a batch (see NotesServer.submit); answers {"id": ...}
+    GET  /jobs/<id>         The job as JSON: status, progress and finished entries
+    GET  /jobs/<id>/events  Server-sent events until the job ends: progress, text, result, end
+    GET  /health            Queue and coalescing counters
+    GET  /metrics           Prometheus metrics of every file processed
+
+Usage:
+    python server.py --port 8765 --max-jobs 4 --max-concurrency 8
+    python server.py --fake-latency 0.5    # offline, with FakeNotesModel
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from cache import DEFAULT_CACHE_PATH, NotesCache
+from chunking import DEFAULT_MAX_CHUNK_TOKENS
+from coalesce import Singleflight
+from dedupe import DEFAULT_THRESHOLD, DuplicateDetector
+from helper import process_files, get_ai_model
+from jobs import ACTIVE_STATES, DEFAULT_JOBS_DIR, JobManager, JobStore
+from manifest import DEFAULT_PROJECTS_DIR, ProjectManifest, project_manifest_path
+from metrics import PrometheusSink
+from preprocess import Preprocessor
+from providers import available_providers, get_provider
+from rate_limit import RequestScheduler
+from retrieval import DEFAULT_CONTEXT_TOKENS
+from uploads import Upload
+
+DEFAULT_PORT = 8765
+# Request bodies carry whole files; notebooks may be large
+MAX_REQUEST_BYTES = 200 * 1024 * 1024
+# A comment is sent on idle event streams this often so proxies don't drop them
+KEEPALIVE_SECONDS = 15.0
+
+# Options a job may set, with their defaults
+JOB_OPTIONS = {
+    "workers": 4,
+    "max_chunk_tokens": DEFAULT_MAX_CHUNK_TOKENS,
+    "use_cache": True,
+    "skip_unchanged": False,
+    "prompt_caching": False,
+    "preprocess": True,
+    "strip_commented_code": False,
+    "markdown_headings": False,
+    "dedupe": True,
+    "dedupe_threshold": DEFAULT_THRESHOLD,
+    "keep_separate": [],
+    "context_tokens": DEFAULT_CONTEXT_TOKENS
+}
+# Options that may also be null: no chunking, and the plain list of earlier topics
+NULLABLE_OPTIONS = {"max_chunk_tokens", "context_tokens"}
+
+def create_model(provider, model_name, api_key):
+    """Default model factory: a warm client from get_ai_model (retries are left to the scheduler)."""
+    if not api_key:
+        raise ValueError(f"No API key for {provider}; send api_key or set {get_provider(provider).api_key_env or 'its API key variable'} on the server")
+    return get_ai_model(provider, model_name, api_key, max_retries=0)
+
+def check_string_list(name, value):
+    """Raise ValueError unless `value` is None or a list of strings."""
+    if value is not None and not (isinstance(value, list) and all(isinstance(item, str) for item in value)):
+        raise ValueError(f"{name} must be a list of strings")
+
+def check_options(options):
+    """
+    Return JOB_OPTIONS updated with a request's `options`.
+
+    Each value must have the type of its default, so a bad request is
+    rejected before it is queued rather than failing inside the job.
+    """
+    if options is None:
+        options = {}
+    if not isinstance(options, dict):
+        raise ValueError("options must be a JSON object")
+    unknown = set(options) - set(JOB_OPTIONS)
+    if unknown:
+        raise ValueError(f"Unknown options: {', '.join(sorted(unknown))}")
+    for name, value in options.items():
+        default = JOB_OPTIONS[name]
+        if value is None and name in NULLABLE_OPTIONS:
+            continue
+        if isinstance(default, bool):
+            valid, expected = isinstance(value, bool), "true or false"
+        elif isinstance(default, int):
+            minimum = 1 if name == "workers" else 0
+            valid = isinstance(value, int) and not isinstance(value, bool) and value >= minimum
+            expected = f"an integer of at least {minimum}"
+        elif isinstance(default, float):
+            valid, expected = isinstance(value, (int, float)) and not isinstance(value, bool), "a number"
+        else:
+            valid, expected = isinstance(value, list) and all(isinstance(item, str) for item in value), "a list of strings"
+        if not valid:
+            raise ValueError(f"Option {name} must be {expected}")
+    return {**JOB_OPTIONS, **options}
+
+def client_scope(client_id, api_key):
+    """
+    Folder name keeping one client's project manifests apart from another's.
+
+    It is a hash of the request's `client_id`, or else of its API key, so
+    neither ends up in a path; clients sending neither share one folder.
+    """
+    if client_id:
+        return hashlib.sha256(f"client:{client_id}".encode("utf-8")).hexdigest()[:16]
+    if api_key:
+        return hashlib.sha256(f"key:{api_key}".encode("utf-8")).hexdigest()[:16]
+    return "shared"
+
+def format_event(event, data):
+    """Encode one server-sent event; `event` None is a keep-alive comment."""
+    if event is None:
+        return b": keep-alive\n\n"
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8")
+
+class NotesServer:
+    """
+    HTTP API that runs process_files jobs on a shared worker pool.
+
+    Args:
+        host: Interface to listen on (the API has no authentication, so keep it local or behind a proxy)
+        port: Port to listen on (0 = any free port)
+        max_jobs: Batches generated at the same time; later ones wait in the queue
+        max_concurrency: LLM requests in flight per provider and model, across all jobs
+        model_factory: `model_factory(provider, model_name, api_key)` returning the chat model for a job
+        cache_path: NotesCache database shared by all jobs
+        jobs_dir: Folder the JobStore keeps jobs in
+        projects_dir: Folder of the project manifests, with one subfolder per client (see client_scope)
+    """
+
+    def __init__(self, host="127.0.0.1", port=DEFAULT_PORT, max_jobs=4, max_concurrency=8, model_factory=create_model,
+                 cache_path=DEFAULT_CACHE_PATH, jobs_dir=DEFAULT_JOBS_DIR, projects_dir=DEFAULT_PROJECTS_DIR):
+        self.max_concurrency = max_concurrency
+        self.model_factory = model_factory
+        self.cache_path = cache_path
+        self.projects_dir = projects_dir
+        self.jobs = JobManager(max_jobs=max_jobs, store=JobStore(jobs_dir))
+        self.coalescer = Singleflight()
+        self.metrics = PrometheusSink()
+        self._schedulers = {}
+        self._manifests = {}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def start(self):
+        """Serve from a background thread."""
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def scheduler(self, provider, model_name):
+        """The RequestScheduler shared by every job using `provider` and `model_name`."""
+        with self._lock:
+            key = (provider, model_name)
+            if key not in self._schedulers:
+                self._schedulers[key] = RequestScheduler.for_provider(provider, max_concurrency=self.max_concurrency)
+            return self._schedulers[key]
+
+    def acquire_manifest(self, title, scope):
+        """
+        The ProjectManifest of a client's project, shared by all its running jobs.
+
+        Jobs running at the same time on the same project record into one
+        instance (which saves under its lock) instead of each loading the file
+        and overwriting the others' entries when it saves. Every call must be
+        paired with release_manifest once the job ends.
+        """
+        path = project_manifest_path(title, os.path.join(self.projects_dir, scope))
+        with self._lock:
+            if path not in self._manifests:
+                self._manifests[path] = {"manifest": ProjectManifest(path), "jobs": 0}
+            entry = self._manifests[path]
+            entry["jobs"] += 1
+            return entry["manifest"]
+
+    def release_manifest(self, manifest):
+        """Forget a project's manifest when the last job using it ends, so only running projects stay in memory."""
+        with self._lock:
+            entry = self._manifests.get(manifest.path)
+            if entry is not None and entry["manifest"] is manifest:
+                entry["jobs"] -= 1
+                if not entry["jobs"]:
+                    del self._manifests[manifest.path]
+
+    def submit(self, request):
+        """
+        Queue a job from a decoded POST /jobs body and return its ID.
+
+        The body has `files` (a list of `{"name", "content"}`), and optionally
+        `title`, `topics`, `suggestions`, `provider`, `model`, `api_key` (the
+        server's environment variable is used otherwise), `client_id` (keeps
+        the client's project manifests apart; see client_scope) and `options`
+        (see JOB_OPTIONS). Raises ValueError when the request is invalid.
+        """
+        if not isinstance(request, dict):
+            raise ValueError("The request body must be a JSON object")
+        files = request.get("files")
+        if not files or not all(isinstance(f, dict) and isinstance(f.get("name"), str) and isinstance(f.get("content"), str) for f in files):
+            raise ValueError("files must be a non-empty list of {\"name\": ..., \"content\": ...} objects")
+        options = check_options(request.get("options"))
+        for name in ("title", "provider", "model", "api_key", "client_id"):
+            if request.get(name) is not None and not isinstance(request[name], str):
+                raise ValueError(f"{name} must be a string")
+
+        title = request.get("title") or "Complete Study Notes"
+        names = [f["name"] for f in files]
+        # Missing topics default to the file names, as in process_files
+        topics = request.get("topics")
+        suggestions = request.get("suggestions")
+        check_string_list("topics", topics)
+        check_string_list("suggestions", suggestions)
+
+        provider = request.get("provider") or "Gemini"
+        # A custom model_factory may serve providers that aren't registered
+        info = get_provider(provider) if provider in available_providers() else None
+        model_name = request.get("model") or (info.default_model if info else None)
+        if not model_name:
+            raise ValueError(f"No model given and {provider!r} has no default model")
+        api_key = request.get("api_key") or (os.environ.get(info.api_key_env, "") if info and info.api_key_env else "")
+        try:
+            ai_model = self.model_factory(provider, model_name, api_key)
+        except ImportError as e:
+            # The provider's SDK isn't installed on this server
+            raise ValueError(f"{provider} is not available on this server: {e}") from None
+        scheduler = self.scheduler(provider, model_name)
+        scope = client_scope(request.get("client_id"), request.get("api_key"))
+
+        uploads = []
+        for f in files:
+            data = f["content"].encode("utf-8")
+            uploads.append(Upload(hashlib.sha256(data).hexdigest(), f["name"], data))
+
+        def run(job):
+            job.set_info(file_keys=names, provider=provider, model=model_name)
+            notes_cache = NotesCache(self.cache_path, bypass=not options["use_cache"])
+            manifest = self.acquire_manifest(title, scope) if options["skip_unchanged"] else None
+            try:
+                process_files(
+                    uploads,
+                    title,
+                    topics,
+                    suggestions,
+                    progress_callback=job.update_progress,
+                    ai_model=ai_model,
+                    max_workers=max(1, min(options["workers"], self.max_concurrency)),
+                    cache=notes_cache,
+                    on_chunk=job.append_text,
+                    max_chunk_tokens=options["max_chunk_tokens"],
+                    manifest=manifest,
+                    file_keys=names,
+                    scheduler=scheduler,
+                    metrics=self.metrics,
+                    on_result=job.add_result,
+                    prompt_caching=options["prompt_caching"],
+                    preprocess=Preprocessor(
+                        strip_commented_code=options["strip_commented_code"],
+                        markdown_headings=options["markdown_headings"]
+                    ) if options["preprocess"] else None,
+                    dedupe=DuplicateDetector(
+                        threshold=options["dedupe_threshold"],
+                        keep_separate=options["keep_separate"]
+                    ) if options["dedupe"] else None,
+                    context_tokens=options["context_tokens"] or None,
+                    coalescer=self.coalescer
+                )
+            finally:
+                job.set_info(cache_stats=notes_cache.stats())
+                notes_cache.close()
+                if manifest is not None:
+                    self.release_manifest(manifest)
+
+        return self.jobs.submit(run, total=len(uploads), title=title)
+
+    def events(self, job_id, keepalive=KEEPALIVE_SECONDS):
+        """
+        Yield (event, data) pairs for a job until it ends.
+
+        The stream starts from the job's current state, so a client that
+        reconnects gets every finished file again: `progress` when the status
+        or counters change, `text` with new streamed text of a file, `result`
+        with a finished file's entry and a final `end`. (None, None) is
+        yielded after `keepalive` seconds without changes.
+        """
+        version = -1
+        sent_text = {}
+        sent_results = set()
+        last_progress = None
+        while True:
+            job = self.jobs.wait(job_id, version, timeout=keepalive)
+            if job is None:
+                return
+            if job.get("version", 0) == version and job["status"] in ACTIVE_STATES:
+                yield None, None
+                continue
+            version = job.get("version", 0)
+
+            progress = {key: job[key] for key in ("status", "completed", "total", "message")}
+            if progress != last_progress:
+                last_progress = progress
+                yield "progress", progress
+            for index, entry in enumerate(job["results"]):
+                if entry is not None and index not in sent_results:
+                    sent_results.add(index)
+                    yield "result", {"index": index, "entry": entry}
+            for index, text in sorted(job["live_text"].items()):
+                if index not in sent_results and len(text) > sent_text.get(index, 0):
+                    yield "text", {"index": index, "text": text[sent_text.get(index, 0):]}
+                    sent_text[index] = len(text)
+            if job["status"] not in ACTIVE_STATES:
+                yield "end", {"status": job["status"], "error": job["error"], "info": job["info"]}
+                return
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                if self.path.split("?")[0].rstrip("/") != "/jobs":
+                    self.send_json(404, {"error": "Not found"})
+                    return
+                length = int(self.headers.get("Content-Length", 0))
+                if length > MAX_REQUEST_BYTES:
+                    self.send_json(413, {"error": f"Request larger than {MAX_REQUEST_BYTES // (1024 * 1024)} MB"})
+                    return
+                try:
+                    job_id = server.submit(json.loads(self.rfile.read(length) or b"{}"))
+                except (ValueError, TypeError) as e:
+                    self.send_json(400, {"error": str(e)})
+                    return
+                self.send_json(202, {"id": job_id, "url": f"/jobs/{job_id}"})
+
+            def do_GET(self):
+                parts = self.path.split("?")[0].strip("/").split("/")
+                if parts == ["health"]:
+                    self.send_json(200, {"status": "ok", "coalescing": server.coalescer.stats()})
+                elif parts == ["metrics"]:
+                    body = server.metrics.render().encode("utf-8")
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/plain; version=0.0.4")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                elif len(parts) == 2 and parts[0] == "jobs":
+                    job = server.jobs.get(parts[1])
+                    if job is None:
+                        self.send_json(404, {"error": "No such job"})
+                    else:
+                        self.send_json(200, job)
+                elif len(parts) == 3 and parts[0] == "jobs" and parts[2] == "events":
+                    self.send_events(parts[1])
+                else:
+                    self.send_json(404, {"error": "Not found"})
+
+            def send_json(self, status, data):
+                body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def send_events(self, job_id):
+                if server.jobs.get(job_id) is None:
+                    self.send_json(404, {"error": "No such job"})
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Cache-Control", "no-cache")
+                self.end_headers()
+                try:
+                    for event, data in server.events(job_id):
+                        self.wfile.write(format_event(event, data))
+                        self.wfile.flush()
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client went away; the job keeps running
+                    pass
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="DevNotes-AI server: generate notes over HTTP for many clients.")
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to listen on")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="Port to listen on")
+    parser.add_argument("--max-jobs", type=int, default=4, help="Batches generated at the same time; the rest wait in the queue")
+    parser.add_argument("--max-concurrency", type=int, default=8, help="LLM requests in flight per provider and model, across all jobs")
+    parser.add_argument("--cache", default=DEFAULT_CACHE_PATH, help="Response cache shared by all jobs")
+    parser.add_argument("--jobs-dir", default=DEFAULT_JOBS_DIR, help="Folder jobs are stored in")
+    parser.add_argument("--projects-dir", default=DEFAULT_PROJECTS_DIR, help="Folder of the project manifests, one subfolder per client")
+    parser.add_argument("--fake-latency", type=float, default=None, help="Answer every request with the offline FakeNotesModel after this many seconds (for testing)")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    model_factory = create_model
+    if args.fake_latency is not None:
+        from fake_models import FakeNotesModel
+        fake_model = FakeNotesModel(latency=args.fake_latency)
+        model_factory = lambda provider, model_name, api_key: fake_model
+
+    server = NotesServer(
+        host=args.host,
+        port=args.port,
+        max_jobs=args.max_jobs,
+        max_concurrency=args.max_concurrency,
+        model_factory=model_factory,
+        cache_path=args.cache,
+        jobs_dir=args.jobs_dir,
+        projects_dir=args.projects_dir
+    )
+    print(f"📡 DevNotes-AI server on {server.base_url} ({args.max_jobs} jobs at a time)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
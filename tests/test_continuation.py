@@ -0,0 +1,74 @@
+"""Notes cut off by the output limit are continued from their tail and stitched back together."""
+
+import pytest
+
+from continuation import DEFAULT_MAX_CONTINUATIONS, is_truncated, trim_overlap
+from fake_models import FakeNotesModel, numbered_notes
+from helper import generate_detailed_notes
+from rate_limit import RequestScheduler
+
+OUTPUT_CHARS = 9000
+FILE_CONTENT = "x = 1\n" * 500
+
+def generate(model, stream=False, scheduler=None):
+    timings = {}
+    pieces = []
+    notes = generate_detailed_notes(
+        "Title", "", "Topic", "", FILE_CONTENT, model,
+        timings=timings, scheduler=scheduler, on_chunk=pieces.append if stream else None
+    )
+    return notes, pieces, timings
+
+@pytest.mark.parametrize("repeat_chars", [0, 40])
+@pytest.mark.parametrize("stream", [False, True])
+@pytest.mark.parametrize("with_scheduler", [False, True])
+def test_continued_notes_equal_untruncated_notes(repeat_chars, stream, with_scheduler):
+    model = FakeNotesModel(latency=0.0, output_chars=OUTPUT_CHARS, max_output_chars=2500, repeat_chars=repeat_chars)
+    scheduler = RequestScheduler(max_retries=0) if with_scheduler else None
+
+    notes, pieces, timings = generate(model, stream=stream, scheduler=scheduler)
+
+    assert notes == numbered_notes(OUTPUT_CHARS)
+    if stream:
+        assert "".join(pieces) == notes
+    assert timings["continuations"] == 3
+    assert len(timings["calls"]) == 4
+
+def test_continuations_only_send_the_tail():
+    model = FakeNotesModel(latency=0.0, output_chars=OUTPUT_CHARS, max_output_chars=2500)
+
+    _, _, timings = generate(model)
+
+    first, *continuations = timings["calls"]
+    assert all(call["input_tokens"] < first["input_tokens"] for call in continuations)
+
+def test_complete_notes_are_not_continued():
+    model = FakeNotesModel(latency=0.0, output_chars=OUTPUT_CHARS, max_output_chars=20000)
+
+    notes, _, timings = generate(model)
+
+    assert notes == numbered_notes(OUTPUT_CHARS)
+    assert not timings.get("continuations")
+    assert len(timings["calls"]) == 1
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_continuations_stop_at_the_cap(stream):
+    model = FakeNotesModel(latency=0.0, output_chars=OUTPUT_CHARS, max_output_chars=500)
+
+    notes, _, timings = generate(model, stream=stream)
+
+    assert timings["continuations"] == DEFAULT_MAX_CONTINUATIONS
+    assert len(timings["calls"]) == 1 + DEFAULT_MAX_CONTINUATIONS
+    assert numbered_notes(OUTPUT_CHARS).startswith(notes)
+    assert len(notes) == 500 * (1 + DEFAULT_MAX_CONTINUATIONS)
+
+def test_finish_reason_decides_over_open_fence():
+    assert is_truncated("```python\nx = 1", None)
+    assert not is_truncated("```python\nx = 1", "stop")
+    assert is_truncated("Complete sentence.", "length")
+    assert not is_truncated("Complete sentence.", None)
+
+def test_trim_overlap_drops_repeated_tail():
+    text = "The loop adds each value to the running total."
+    assert trim_overlap(text, "each value to the running total. Then it returns it.") == " Then it returns it."
+    assert trim_overlap(text, "Then it returns it.") == "Then it returns it."
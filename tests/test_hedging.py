@@ -0,0 +1,157 @@
+"""Latency hedging, fallback and circuit breakers, with fake providers."""
+
+import time
+
+import pytest
+from langchain_core.messages import HumanMessage
+
+import hedging
+from fake_models import FakeNotesModel
+from hedging import CLOSED, HALF_OPEN, OPEN, Backend, CircuitBreaker, HedgedChatModel
+
+MESSAGES = [HumanMessage(content="Explain this file")]
+
+@pytest.fixture
+def attempts(monkeypatch):
+    """Every _Attempt started during the test."""
+    started = []
+
+    class RecordedAttempt(hedging._Attempt):
+        def __init__(self, *args):
+            super().__init__(*args)
+            self.thread = None
+            started.append(self)
+
+        def run(self, *args):
+            self.thread = hedging.threading.current_thread()
+            super().run(*args)
+
+    monkeypatch.setattr(hedging, "_Attempt", RecordedAttempt)
+    return started
+
+def hedged(*backends, **options):
+    options.setdefault("initial_hedge_delay", 0.1)
+    return HedgedChatModel(backends=[Backend(name, model) for name, model in backends], **options)
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_slow_primary_is_hedged_and_the_hedge_wins(attempts, stream):
+    model = hedged(
+        ("primary", FakeNotesModel(latency=3.0, output_chars=200)),
+        ("secondary", FakeNotesModel(latency=0.05, output_chars=200))
+    )
+
+    start = time.perf_counter()
+    text = "".join(chunk.content for chunk in model.stream(MESSAGES)) if stream else model.invoke(MESSAGES).content
+    elapsed = time.perf_counter() - start
+
+    assert text
+    assert elapsed < 1.0
+    stats = model.stats()
+    assert stats["hedged"] == 1 and stats["hedge_wins"] == 1
+    assert stats["backends"]["secondary"]["wins"] == 1
+    assert stats["backends"]["primary"]["cancelled"] == 1
+    primary, secondary = attempts
+    assert primary.cancelled.is_set()
+    assert not secondary.cancelled.is_set()
+
+def test_fast_primary_is_not_hedged():
+    model = hedged(
+        ("primary", FakeNotesModel(latency=0.01, output_chars=200)),
+        ("secondary", FakeNotesModel(latency=0.01, output_chars=200))
+    )
+
+    assert model.invoke(MESSAGES).content
+    stats = model.stats()
+    assert stats["hedged"] == 0
+    assert stats["backends"]["secondary"]["calls"] == 0
+
+def test_failing_primary_falls_back_to_the_next_backend():
+    model = hedged(
+        ("primary", FakeNotesModel(latency=0.05, output_chars=200, error_rate=1.0)),
+        ("secondary", FakeNotesModel(latency=0.05, output_chars=200)),
+        initial_hedge_delay=5.0
+    )
+
+    assert model.invoke(MESSAGES).content
+    stats = model.stats()
+    assert stats["fallbacks"] == 1
+    assert stats["backends"]["primary"]["failures"] == 1
+    assert stats["backends"]["secondary"]["wins"] == 1
+
+def test_every_backend_failing_raises_the_last_error():
+    model = hedged(
+        ("primary", FakeNotesModel(latency=0.01, error_rate=1.0)),
+        ("secondary", FakeNotesModel(latency=0.01, error_rate=1.0))
+    )
+
+    with pytest.raises(ConnectionError):
+        model.invoke(MESSAGES)
+
+def test_open_circuit_skips_the_backend():
+    model = hedged(
+        ("primary", FakeNotesModel(latency=0.01, error_rate=1.0)),
+        ("secondary", FakeNotesModel(latency=0.01, output_chars=200))
+    )
+    for _ in range(3):
+        model.invoke(MESSAGES)
+
+    primary = model.backends[0]
+    assert primary.breaker.state == OPEN
+    model.invoke(MESSAGES)
+    assert primary.calls == 3
+
+def test_circuit_breaker_opens_goes_half_open_and_closes():
+    now = [0.0]
+    breaker = CircuitBreaker(failure_threshold=3, cooldown=10.0, clock=lambda: now[0])
+
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.state == CLOSED and breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == OPEN and not breaker.allow()
+
+    now[0] = 9.9
+    assert not breaker.allow()
+    now[0] = 10.0
+    # One trial call is let through once the cooldown has passed
+    assert breaker.allow() and breaker.state == HALF_OPEN
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CLOSED and breaker.allow()
+
+def test_failed_trial_reopens_the_circuit():
+    now = [0.0]
+    breaker = CircuitBreaker(failure_threshold=1, cooldown=5.0, clock=lambda: now[0])
+    breaker.record_failure()
+    now[0] = 5.0
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == OPEN and not breaker.allow()
+
+def test_stopping_early_cancels_running_attempts_and_releases_the_trial(attempts):
+    model = hedged(
+        ("primary", FakeNotesModel(latency=1.0, output_chars=1000, chunk_chars=50)),
+        ("secondary", FakeNotesModel(latency=1.0, output_chars=1000, chunk_chars=50)),
+        initial_hedge_delay=5.0
+    )
+    primary = model.backends[0]
+    # A circuit whose cooldown has passed: the next call is its half-open trial
+    primary.breaker.state, primary.breaker.opened_at, primary.breaker.cooldown = OPEN, 0.0, 0.0
+
+    race = model._race(MESSAGES, None, {}, streaming=True)
+    assert next(race).content
+    assert primary.breaker.trial_running
+    race.close()
+
+    (attempt,) = attempts
+    assert attempt.cancelled.is_set()
+    assert not primary.breaker.trial_running
+    assert primary.cancelled == 1
+    # The attempt's thread stops reading its stream instead of running to the end
+    assert wait_for(lambda: not attempt.thread.is_alive(), timeout=0.5)
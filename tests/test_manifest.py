@@ -0,0 +1,88 @@
+"""Incremental regeneration: unchanged files and unchanged chunks of changed files reuse their notes."""
+
+import json
+
+from fake_models import FakeNotesModel
+from helper import process_files
+from manifest import ProjectManifest
+
+def write_notebook(path, edited_cell=None):
+    cells = [
+        {
+            "cell_type": "code", "metadata": {}, "outputs": [], "execution_count": None,
+            "source": [f"def cell_{k}(x):\n", f"    return x + {999 if k == edited_cell else k}\n"] + [f"# step {j}\n" for j in range(30)]
+        }
+        for k in range(12)
+    ]
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"cells": cells, "metadata": {}, "nbformat": 4, "nbformat_minor": 5}, f)
+
+def run(path, manifest_path):
+    model = FakeNotesModel(latency=0.0, output_chars=200)
+    notes, _ = process_files([path], ai_model=model, max_workers=2, max_chunk_tokens=600, manifest=ProjectManifest(manifest_path))
+    return notes[0], len(model.prefix_hashes)
+
+def test_only_changed_chunks_are_regenerated(tmp_path):
+    notebook = str(tmp_path / "lesson.ipynb")
+    manifest_path = str(tmp_path / "manifest.json")
+    write_notebook(notebook)
+
+    first, first_calls = run(notebook, manifest_path)
+    assert first["metrics"]["chunks"] == first_calls > 1
+
+    unchanged, unchanged_calls = run(notebook, manifest_path)
+    assert unchanged["reused"] and unchanged_calls == 0
+
+    write_notebook(notebook, edited_cell=5)
+    edited, edited_calls = run(notebook, manifest_path)
+    assert not edited["reused"]
+    assert edited_calls == 1
+    assert edited["notes"] == first["notes"]
+
+def test_chunks_are_not_reused_for_a_new_topic(tmp_path):
+    manifest = ProjectManifest(str(tmp_path / "manifest.json"))
+    manifest.record("a.py", "one\ntwo", "Topic", "", "notes", chunks=["one", "two"], parts=["first", "second"])
+
+    assert manifest.stored_chunks("a.py", ["one", "three"], "Topic", "") == ["first", None]
+    assert manifest.stored_chunks("a.py", ["one", "two"], "Other topic", "") == [None, None]
+    assert manifest.stored_chunks("b.py", ["one"], "Topic", "") == [None]
+
+class FailingModel(FakeNotesModel):
+    """FakeNotesModel failing every prompt that contains `fail_on`."""
+
+    fail_on: str = ""
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.fail_on and self.fail_on in messages[-1].content:
+            raise ValueError("provider error")
+        return super()._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+def test_chunks_finished_before_a_failure_are_kept(tmp_path):
+    notebook = str(tmp_path / "lesson.ipynb")
+    manifest_path = str(tmp_path / "manifest.json")
+    write_notebook(notebook)
+
+    failing = FailingModel(latency=0.0, output_chars=200, fail_on="def cell_11")
+    notes, _ = process_files([notebook], ai_model=failing, max_workers=1, max_chunk_tokens=600, manifest=ProjectManifest(manifest_path))
+    assert notes[0]["error"]
+    chunks = notes[0]["metrics"]["chunks"]
+
+    manifest = ProjectManifest(manifest_path)
+    assert not manifest.finished(notebook)
+    assert len(manifest.entries[notebook]["chunk_notes"]) == chunks - 1
+
+    retried, calls = run(notebook, manifest_path)
+    assert not retried["error"]
+    assert calls == 1
+    assert ProjectManifest(manifest_path).finished(notebook)
+
+def test_records_are_written_in_batches(tmp_path):
+    path = tmp_path / "manifest.json"
+    manifest = ProjectManifest(str(path), save_interval=60)
+
+    for k in range(50):
+        manifest.record(f"file_{k}.py", f"content {k}", "Topic", "", "notes")
+    # The first record is written at once, the rest wait for the interval or a flush
+    assert len(json.loads(path.read_text())["files"]) == 1
+    manifest.flush()
+    assert len(json.loads(path.read_text())["files"]) == 50
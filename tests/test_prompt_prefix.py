@@ -0,0 +1,77 @@
+"""Every call in a batch starts with the same system prefix, so providers can cache it."""
+
+import os
+
+import pytest
+from pydantic import Field
+
+from fake_models import FakeNotesModel, message_text
+from helper import process_files
+
+MAIN_TITLE = "Zebrafish Pipeline Handbook"
+
+class RecordingModel(FakeNotesModel):
+    """FakeNotesModel that keeps the messages of every call."""
+
+    sent: list = Field(default_factory=list)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        self.sent.append(messages)
+        return super()._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        self.sent.append(messages)
+        yield from super()._stream(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+def write_files(directory):
+    sources = {
+        "quokka_loader.py": "def load_quokka_rows(path):\n    return open(path).read().split('\\n')\n",
+        "narwhal_stats.py": "def narwhal_mean(values):\n    return sum(values) / len(values)\n",
+        # Large enough to be split into chunks
+        "axolotl_module.py": "".join(f"def axolotl_step_{k}(state):\n    return state + {k}\n\n\n" for k in range(120)),
+    }
+    paths = []
+    for name, content in sources.items():
+        path = os.path.join(directory, name)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(content)
+        paths.append(path)
+    return paths, sources
+
+@pytest.mark.parametrize("stream", [False, True])
+@pytest.mark.parametrize("max_workers", [1, 3])
+def test_batch_sends_one_static_system_prefix(tmp_path, stream, max_workers):
+    paths, sources = write_files(tmp_path)
+    topics = ["Quokka Loading", "Narwhal Statistics", "Axolotl Steps"]
+    suggestions = ["Mention pelican files", "Compare with walrus data", "Explain ocelot state"]
+    model = RecordingModel(latency=0.0, output_chars=300)
+
+    notes, _ = process_files(
+        paths, main_title=MAIN_TITLE, topics=topics, suggestions=suggestions, ai_model=model,
+        max_workers=max_workers, max_chunk_tokens=500, on_chunk=(lambda i, chunk: None) if stream else None
+    )
+
+    assert all(entry["notes"] and not entry["error"] for entry in notes)
+    assert notes[2]["metrics"]["chunks"] > 1
+    assert len(model.sent) == len(paths) - 1 + notes[2]["metrics"]["chunks"]
+
+    assert all(messages[0].type == "system" for messages in model.sent)
+    prefixes = {message_text(messages[0]) for messages in model.sent}
+    assert len(prefixes) == 1
+    assert len(set(model.prefix_hashes)) == 1
+
+    prefix = prefixes.pop()
+    dynamic = [MAIN_TITLE, *topics, *suggestions, *sources, *(content.split("\n")[0] for content in sources.values())]
+    for value in dynamic:
+        assert value not in prefix
+    # The dynamic data is still sent, after the prefix
+    assert any(MAIN_TITLE in message_text(message) for message in model.sent[0][1:])
+
+def test_continuations_reuse_the_system_prefix(tmp_path):
+    paths, _ = write_files(tmp_path)
+    model = RecordingModel(latency=0.0, output_chars=900, max_output_chars=400)
+
+    notes, _ = process_files(paths, main_title=MAIN_TITLE, ai_model=model, max_workers=2, max_chunk_tokens=500)
+
+    assert sum(entry["metrics"]["continuations"] for entry in notes) > 0
+    assert len({message_text(messages[0]) for messages in model.sent}) == 1
@@ -0,0 +1,164 @@
+"""Retry-After parsing for rate-limited calls."""
+
+import email.utils
+import time
+
+import pytest
+
+from rate_limit import RequestScheduler, retry_after_seconds
+
+class Response:
+    def __init__(self, headers):
+        self.headers = headers
+
+class ProviderError(Exception):
+    def __init__(self, message, headers):
+        super().__init__(message)
+        self.response = Response(headers)
+
+def test_seconds_and_milliseconds():
+    assert retry_after_seconds(ProviderError("slow down", {"retry-after": "7"})) == 7.0
+    assert retry_after_seconds(ProviderError("slow down", {"retry-after-ms": "1500"})) == 1.5
+
+def test_http_date():
+    value = email.utils.formatdate(time.time() + 30, usegmt=True)
+    assert retry_after_seconds(ProviderError("slow down", {"retry-after": value})) == pytest.approx(30, abs=2)
+
+def test_http_date_without_zone_is_utc():
+    # "-0000" marks a date without time zone information, parsed as a naive datetime
+    value = email.utils.formatdate(time.time() + 30).rsplit(" ", 1)[0] + " -0000"
+    assert retry_after_seconds(ProviderError("slow down", {"retry-after": value})) == pytest.approx(30, abs=2)
+
+@pytest.mark.parametrize("value", ["soon", "Mon, 99 Foo 2024 25:61:00", "", "  "])
+def test_malformed_header_falls_through_to_the_message(value):
+    error = ProviderError("Please retry in 12s.", {"retry-after": value})
+    assert retry_after_seconds(error) == 12.0
+
+def test_malformed_header_and_no_hint():
+    assert retry_after_seconds(ProviderError("slow down", {"retry-after": "soon"})) is None
+
+class StatusError(Exception):
+    def __init__(self, status_code, message="provider error", headers=None):
+        super().__init__(f"{status_code} {message}")
+        self.status_code = status_code
+        self.response = Response(headers or {})
+
+class Recorder:
+    """Injected sleep that records delays instead of waiting."""
+
+    def __init__(self):
+        self.delays = []
+
+    def __call__(self, seconds):
+        self.delays.append(seconds)
+
+def failing(errors, result="notes"):
+    """A request raising `errors` one per call, then returning `result`; counts its calls."""
+    errors = list(errors)
+    calls = []
+
+    def request():
+        calls.append(1)
+        if errors:
+            raise errors.pop(0)
+        return result
+    return request, calls
+
+def test_throttle_halves_the_concurrency_limit():
+    scheduler = RequestScheduler(max_concurrency=8, sleep=Recorder())
+    limits = []
+    request, _ = failing([StatusError(429)])
+
+    def observed():
+        limits.append(scheduler.concurrency_limit)
+        return request()
+
+    assert scheduler.run(observed) == "notes"
+    assert limits == [8.0, 4.0]
+    assert scheduler.stats()["throttled"] == 1
+
+def test_successes_raise_the_limit_additively():
+    scheduler = RequestScheduler(max_concurrency=4, min_concurrency=1, sleep=Recorder())
+    scheduler.concurrency_limit = 2.0
+
+    scheduler.run(lambda: "notes")
+    assert scheduler.concurrency_limit == pytest.approx(2.5)
+    scheduler.run(lambda: "notes")
+    assert scheduler.concurrency_limit == pytest.approx(2.9)
+    for _ in range(50):
+        scheduler.run(lambda: "notes")
+    assert scheduler.concurrency_limit == 4
+
+def test_max_retries_is_respected():
+    sleep = Recorder()
+    scheduler = RequestScheduler(max_retries=2, sleep=sleep)
+    request, calls = failing([StatusError(503)] * 5)
+    stats = {}
+
+    with pytest.raises(StatusError):
+        scheduler.run(request, stats=stats)
+    assert len(calls) == 3
+    assert len(sleep.delays) == 2
+    assert stats["retries"] == scheduler.stats()["retries"] == 2
+
+def test_errors_that_are_not_retryable_are_raised_at_once():
+    scheduler = RequestScheduler(sleep=Recorder())
+    request, calls = failing([StatusError(400, "bad request")])
+
+    with pytest.raises(StatusError):
+        scheduler.run(request)
+    assert len(calls) == 1
+
+def test_retry_after_header_sets_the_delay():
+    sleep = Recorder()
+    scheduler = RequestScheduler(sleep=sleep)
+    request, _ = failing([StatusError(429, headers={"retry-after": "7"})])
+
+    scheduler.run(request)
+    assert sleep.delays == [7.0]
+
+def test_stream_retries_before_the_first_chunk():
+    scheduler = RequestScheduler(sleep=Recorder())
+    opened = []
+
+    def open_stream():
+        opened.append(1)
+        if len(opened) == 1:
+            raise StatusError(503)
+        yield from ["a", "b"]
+
+    assert list(scheduler.stream(open_stream)) == ["a", "b"]
+    assert len(opened) == 2
+
+def test_stream_does_not_retry_after_a_chunk():
+    scheduler = RequestScheduler(sleep=Recorder())
+    opened = []
+
+    def open_stream():
+        opened.append(1)
+        yield "a"
+        raise StatusError(503)
+
+    received = []
+    with pytest.raises(StatusError):
+        for chunk in scheduler.stream(open_stream):
+            received.append(chunk)
+    assert received == ["a"]
+    assert len(opened) == 1
+    assert scheduler.in_flight == 0
+
+def test_rate_limit_wait_does_not_hold_a_slot():
+    now = [0.0]
+    in_flight_while_waiting = []
+    scheduler = RequestScheduler(requests_per_minute=60, max_concurrency=1, clock=lambda: now[0])
+
+    def sleep(seconds):
+        in_flight_while_waiting.append(scheduler.in_flight)
+        now[0] += seconds
+    scheduler.sleep = sleep
+
+    scheduler.run(lambda: "notes")
+    # The bucket holds a minute's worth; drain it so the next call has to wait
+    scheduler.request_bucket.tokens = 0
+    scheduler.run(lambda: "notes")
+    assert in_flight_while_waiting == [0]
@@ -0,0 +1,73 @@
+"""Context from earlier notes in a batch: bounded, and the same whatever order files finish in."""
+
+import os
+import re
+import time
+
+from pydantic import Field
+
+from fake_models import FakeNotesModel, message_text
+from helper import process_files
+from retrieval import NotesIndex
+
+class PacedModel(FakeNotesModel):
+    """FakeNotesModel taking `delays[n]` seconds for the prompt about file n, and keeping each prompt."""
+
+    delays: dict = Field(default_factory=dict)
+    prompts: dict = Field(default_factory=dict)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        prompt = message_text(messages[-1])
+        number = int(re.search(r"def example_concept_(\d+)", prompt).group(1))
+        self.prompts[number] = prompt
+        time.sleep(self.delays.get(number, 0.0))
+        return super()._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+def write_lessons(directory, count):
+    paths = []
+    for n in range(count):
+        path = os.path.join(directory, f"lesson_{n}.py")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(f"def example_concept_{n}(value):\n    # the answer explains why the value matters\n    return value + {n}\n")
+        paths.append(path)
+    return paths
+
+def run(paths, delays, max_workers=4):
+    model = PacedModel(latency=0.0, output_chars=600, delays=delays)
+    topics = [f"Lesson {n}" for n in range(len(paths))]
+    start = time.perf_counter()
+    notes, _ = process_files(paths, topics=topics, ai_model=model, max_workers=max_workers)
+    return model.prompts, notes, time.perf_counter() - start
+
+def test_context_does_not_depend_on_completion_order(tmp_path):
+    paths = write_lessons(tmp_path, 10)
+
+    # Early files finish last in one run and first in the other
+    slow_first, _, _ = run(paths, {n: 0.02 * (10 - n) for n in range(10)})
+    slow_last, _, _ = run(paths, {n: 0.02 * n for n in range(10)})
+
+    assert slow_first == slow_last
+    # Files at least max_workers places in get sections of earlier notes; the first max_workers get none
+    assert all("Related sections" in slow_first[n] for n in range(4, 10))
+    assert not any("Related sections" in slow_first[n] for n in range(4))
+
+def test_slow_early_file_does_not_serialise_the_batch(tmp_path):
+    paths = write_lessons(tmp_path, 12)
+    slow, fast = 0.6, 0.1
+
+    _, notes, elapsed = run(paths, {0: slow, **{n: fast for n in range(1, 12)}})
+
+    assert all(note["notes"] for note in notes)
+    # Files after the slow one wait for it, then still run four at a time:
+    # about slow + 2 * fast, where one at a time would take slow + 11 * fast
+    assert elapsed < slow + 4 * fast
+    assert elapsed < (slow + 11 * fast) * 0.6
+
+def test_search_is_limited_to_the_first_files():
+    index = NotesIndex()
+    index.add("Loops", "## For loops\n\nA for loop walks over a list of values.")
+    index.add("Lists", "## Appending\n\nA list grows when values are appended.")
+
+    assert [section["topic"] for section in index.search({"list", "values"}, files=1)] == ["Loops"]
+    assert {section["topic"] for section in index.search({"list", "values"})} == {"Loops", "Lists"}
+    assert index.search({"list"}, files=0) == []
@@ -0,0 +1,108 @@
+"""The notes server end to end, with a local fake model."""
+
+import threading
+
+import pytest
+
+from client import NotesClient, ServerError
+from fake_models import FakeNotesModel
+from jobs import DONE
+from server import NotesServer
+
+FILES = [(f"lesson_{i}.py", f"def lesson_{i}(value):\n    return value * {i}\n") for i in range(3)]
+
+@pytest.fixture
+def model():
+    return FakeNotesModel(latency=0.5, output_chars=600, chunk_chars=100)
+
+@pytest.fixture
+def server(tmp_path, model):
+    with NotesServer(
+        port=0,
+        max_jobs=2,
+        model_factory=lambda provider, model_name, api_key: model,
+        cache_path=str(tmp_path / "cache.sqlite"),
+        jobs_dir=str(tmp_path / "jobs"),
+        projects_dir=str(tmp_path / "projects")
+    ) as notes_server:
+        yield notes_server
+
+def submit(server, files=FILES, **request):
+    request.setdefault("provider", "Fake")
+    request.setdefault("model", "fake-1")
+    return NotesClient(server.base_url).submit(files, "Course", **request)
+
+def test_identical_jobs_make_one_call_per_prompt(server, model):
+    start = threading.Barrier(2)
+    jobs = {}
+
+    def user(name):
+        start.wait()
+        job_id = submit(server, options={"workers": 2})
+        jobs[name] = (job_id, list(NotesClient(server.base_url).events(job_id)))
+
+    threads = [threading.Thread(target=user, args=(name,)) for name in ("alice", "bob")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(model.prefix_hashes) == len(FILES)
+    stats = server.coalescer.stats()
+    assert stats["leaders"] == len(FILES)
+
+    results = {}
+    for name, (job_id, events) in jobs.items():
+        kinds = [event for event, _ in events]
+        assert kinds[0] == "progress"
+        assert kinds[-1] == "end" and kinds.count("end") == 1
+        assert events[-1][1]["status"] == DONE
+        entries = {data["index"]: data["entry"] for event, data in events if event == "result"}
+        assert sorted(entries) == list(range(len(FILES)))
+        assert all(entry["notes"] and not entry["error"] for entry in entries.values())
+        # Streamed text of a file comes before its result and is the start of its notes
+        for index, entry in entries.items():
+            result_position = events.index(("result", {"index": index, "entry": entry}))
+            text = "".join(data["text"] for event, data in events[:result_position] if event == "text" and data["index"] == index)
+            assert entry["notes"].startswith(text)
+        progress = [data for event, data in events if event == "progress"]
+        assert progress[-1]["completed"] == progress[-1]["total"] == len(FILES)
+        results[name] = [entries[index]["notes"] for index in sorted(entries)]
+
+    assert results["alice"] == results["bob"]
+
+@pytest.mark.parametrize("request_body, message", [
+    ({"options": {"workers": "4"}}, "workers"),
+    ({"options": {"workers": 0}}, "workers"),
+    ({"options": {"max_chunk_tokens": "big"}}, "max_chunk_tokens"),
+    ({"options": {"use_cache": "yes"}}, "use_cache"),
+    ({"options": {"keep_separate": "a.py"}}, "keep_separate"),
+    ({"options": {"bogus": 1}}, "bogus"),
+    ({"topics": "Lesson"}, "topics"),
+    ({"suggestions": [1, 2, 3]}, "suggestions"),
+])
+def test_invalid_requests_are_rejected(server, request_body, message):
+    options = request_body.pop("options", None)
+    with pytest.raises(ServerError, match=message):
+        submit(server, options=options, **request_body)
+
+def test_missing_provider_sdk_is_a_client_error(tmp_path):
+    def factory(provider, model_name, api_key):
+        raise ImportError("No module named 'langchain_fake'")
+
+    with NotesServer(port=0, model_factory=factory, cache_path=str(tmp_path / "cache.sqlite"), jobs_dir=str(tmp_path / "jobs")) as notes_server:
+        with pytest.raises(ServerError, match="not available"):
+            submit(notes_server)
+
+def test_manifests_are_shared_while_jobs_run_and_then_released(server):
+    job_ids = [submit(server, client_id="alice", options={"skip_unchanged": True}) for _ in range(2)]
+    for job_id in job_ids:
+        NotesClient(server.base_url).follow(job_id)
+    assert server._manifests == {}
+
+def test_running_jobs_of_a_project_share_its_manifest(server):
+    first = server.acquire_manifest("Course", "alice")
+    assert server.acquire_manifest("Course", "alice") is first
+    assert server.acquire_manifest("Course", "bob") is not first
+    server.release_manifest(first)
+    assert server.acquire_manifest("Course", "alice") is first
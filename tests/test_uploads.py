@@ -0,0 +1,66 @@
+"""Upload store memory maps: deselected uploads are unmapped, and a running job keeps the ones it reads."""
+
+import os
+
+from uploads import UploadStore
+
+class UploadedFile:
+    """Stand-in for Streamlit's UploadedFile."""
+
+    def __init__(self, name, data, file_id):
+        self.name = name
+        self.file_id = file_id
+        self._data = data
+
+    def getbuffer(self):
+        return memoryview(self._data)
+
+def spilled(store):
+    return sorted(os.listdir(store._spill_directory))
+
+def test_sync_unmaps_deselected_uploads():
+    store = UploadStore(mmap_threshold=4)
+    first, second = UploadedFile("a.py", b"print('a')\n", "1"), UploadedFile("b.py", b"print('b')\n", "2")
+    a, b = store.sync([first, second])
+    assert len(spilled(store)) == 2
+
+    store.sync([second])
+    assert a.buffer.closed
+    assert not b.buffer.closed
+    assert spilled(store) == [b.key]
+    assert list(store._maps) == [b.key]
+    store.close()
+    assert b.buffer.closed
+    assert not os.path.exists(store._spill_directory)
+
+def test_held_uploads_outlive_sync_and_close():
+    store = UploadStore(mmap_threshold=4)
+    first, second = UploadedFile("a.py", b"print('a')\n", "1"), UploadedFile("b.py", b"print('b')\n", "2")
+    a, b = store.sync([first, second])
+    release = store.hold([a, b])
+
+    store.sync([second])
+    assert not a.buffer.closed
+    store.close()
+    with a.open() as f:
+        assert f.read() == "print('a')\n"
+    assert not b.buffer.closed
+
+    release()
+    assert a.buffer.closed and b.buffer.closed
+    assert not os.path.exists(store._spill_directory)
+    release()
+
+def test_reselected_upload_keeps_its_map():
+    store = UploadStore(mmap_threshold=4)
+    first = UploadedFile("a.py", b"print('a')\n", "1")
+    [a] = store.sync([first])
+    release = store.hold([a])
+    store.sync([])
+    [again] = store.sync([first])
+    assert again.buffer is a.buffer
+
+    release()
+    assert not again.buffer.closed
+    store.close()
+    assert again.buffer.closed
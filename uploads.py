@@ -0,0 +1,209 @@
+"""
+In-memory store for files uploaded to the Streamlit app.
+
+Uploads are keyed by a hash of their content and kept as bytes, so reruns
+don't write anything to disk and settings keyed by the hash survive them.
+Large uploads are spilled once to a private temporary directory and
+memory-mapped. The readers get a text stream over the buffer instead of a
+file path. A background job holds the uploads it reads (UploadStore.hold),
+so deselecting them or closing the store only unmaps them once it is done.
+"""
+
+import hashlib
+import io
+import mmap
+import os
+import shutil
+import tempfile
+import threading
+import weakref
+
+DEFAULT_MMAP_THRESHOLD = 8 * 1024 * 1024
+
+class BufferReader(io.RawIOBase):
+    """Read-only binary stream over a bytes-like object (bytes, memoryview or mmap) without copying it."""
+
+    def __init__(self, buffer):
+        self._view = memoryview(buffer)
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, target):
+        size = min(len(target), len(self._view) - self._position)
+        target[:size] = self._view[self._position:self._position + size]
+        self._position += size
+        return size
+
+    def close(self):
+        self._view.release()
+        super().close()
+
+class Upload:
+    """One uploaded file: its name, content hash, bytes (in memory or memory-mapped) and text encoding."""
+
+    def __init__(self, key, name, buffer, encoding="utf-8"):
+        self.key = key
+        self.name = name
+        self.buffer = buffer
+        self.size = len(buffer)
+        self.encoding = encoding
+
+    def open(self):
+        """Open the content as a text stream, like open(path, "r", encoding=...) with undecodable bytes replaced."""
+        return io.TextIOWrapper(io.BufferedReader(BufferReader(self.buffer)), encoding=self.encoding, errors="replace")
+
+    @property
+    def id(self):
+        """Stable identifier for per-file settings: the same name and content always get the same ID."""
+        return f"{self.name}:{self.key[:16]}"
+
+    def __repr__(self):
+        return f"Upload({self.name!r}, {self.size} bytes)"
+
+def _close_map(mapped):
+    try:
+        mapped.close()
+    except BufferError:
+        # Still being read; the map goes away with its last reader
+        pass
+
+def _remove_spill_directory(maps, directory):
+    for mapped in maps.values():
+        _close_map(mapped)
+    maps.clear()
+    shutil.rmtree(directory, ignore_errors=True)
+
+class UploadStore:
+    """
+    Content-addressed uploads for one session.
+
+    Args:
+        mmap_threshold: Uploads larger than this many bytes are memory-mapped from a temporary file
+    """
+
+    def __init__(self, mmap_threshold=DEFAULT_MMAP_THRESHOLD):
+        self.mmap_threshold = mmap_threshold
+        self.uploads = {}
+        self._buffers = {}
+        self._keys_by_file_id = {}
+        self._maps = {}
+        # Jobs reading each memory-mapped upload, and maps to release once they are done
+        self._holds = {}
+        self._retired = set()
+        self._closed = False
+        self._lock = threading.Lock()
+        self._spill_directory = tempfile.mkdtemp(prefix="devnotes_uploads_")
+        # Spilled files are removed when the session (and with it the store) goes away
+        self._finalizer = weakref.finalize(self, _remove_spill_directory, self._maps, self._spill_directory)
+
+    def add(self, name, data, file_id=None):
+        """
+        Store an upload and return it; identical content is only stored once.
+
+        If `file_id` (Streamlit's ID for an upload) was seen before, the
+        content isn't hashed again, so reruns cost the same however big the upload is.
+        """
+        with self._lock:
+            key = self._keys_by_file_id.get(file_id) if file_id is not None else None
+            if key is None:
+                key = hashlib.sha256(data).hexdigest()
+                if file_id is not None:
+                    self._keys_by_file_id[file_id] = key
+
+            upload = self.uploads.get((name, key))
+            if upload is None:
+                if key not in self._buffers:
+                    self._buffers[key] = self._keep(key, data)
+                upload = Upload(key, name, self._buffers[key])
+                self.uploads[(name, key)] = upload
+            return upload
+
+    def sync(self, uploaded_files):
+        """Add Streamlit UploadedFile objects, drop uploads no longer selected, and return them in order."""
+        current = [
+            self.add(uploaded_file.name, uploaded_file.getbuffer(), file_id=getattr(uploaded_file, "file_id", None))
+            for uploaded_file in uploaded_files
+        ]
+        with self._lock:
+            self.uploads = {(upload.name, upload.key): upload for upload in current}
+            keep = {upload.key for upload in current}
+            self._buffers = {key: buffer for key, buffer in self._buffers.items() if key in keep}
+            self._keys_by_file_id = {file_id: key for file_id, key in self._keys_by_file_id.items() if key in keep}
+            for key in [key for key in self._maps if key not in keep]:
+                self._retire(key)
+        return current
+
+    def hold(self, uploads):
+        """
+        Keep the memory maps of `uploads` open for a job reading them in the background.
+
+        Returns a function to call once the job is done; until then the maps
+        survive the uploads being deselected (sync) or the store being closed.
+        """
+        with self._lock:
+            keys = [upload.key for upload in uploads if upload.key in self._maps]
+            for key in keys:
+                self._holds[key] = self._holds.get(key, 0) + 1
+        released = []
+
+        def release():
+            with self._lock:
+                if released:
+                    return
+                released.append(True)
+                for key in keys:
+                    self._holds[key] -= 1
+                    if not self._holds[key]:
+                        del self._holds[key]
+                        if key in self._retired:
+                            self._retire(key)
+                if self._closed and not self._holds:
+                    self._finalizer()
+        return release
+
+    def _retire(self, key):
+        """Unmap a dropped upload and delete its spilled file, or defer that while a job holds it."""
+        if key in self._holds:
+            self._retired.add(key)
+            return
+        self._retired.discard(key)
+        mapped = self._maps.pop(key, None)
+        if mapped is not None:
+            _close_map(mapped)
+        try:
+            os.remove(os.path.join(self._spill_directory, key))
+        except OSError:
+            pass
+
+    def _keep(self, key, data):
+        """Copy small uploads into bytes; spill large ones to disk once and memory-map them."""
+        if len(data) <= self.mmap_threshold or len(data) == 0:
+            return bytes(data)
+        if key in self._maps:
+            # Deselected while a job still held it, then selected again
+            self._retired.discard(key)
+            return self._maps[key]
+
+        path = os.path.join(self._spill_directory, key)
+        if not os.path.exists(path):
+            with open(path, "wb") as f:
+                f.write(data)
+        with open(path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._maps[key] = mapped
+        return mapped
+
+    def close(self):
+        """Release memory maps and delete spilled files; those held by a job are released when it is done."""
+        with self._lock:
+            self._closed = True
+            self.uploads.clear()
+            self._buffers.clear()
+            self._keys_by_file_id.clear()
+            if not self._holds:
+                self._finalizer()
+                return
+            for key in list(self._maps):
+                self._retire(key)